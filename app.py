@@ -16,9 +16,21 @@ import numpy as np
 import os
 from datetime import datetime, timedelta
 import calendar_sync
+import nightscout_sync
+import rolling_metrics
+import clinical_metrics
+import rollups
+import forecast
+import episodes
+import llm_cache
+from llm_cache import quantize, quantize_bg
+from cgm_store import CGMSeries, TREND_FALLING, TREND_FALLING_FAST
 from audio_recorder_streamlit import audio_recorder
 from openai import OpenAI
 import tempfile
+import time
+import background
+from concurrent.futures import TimeoutError as FuturesTimeout
 
 # =============================================================================
 # GLOBAL SAFETY GUARDRAILS (FDA SaMD AVOIDANCE)
@@ -102,31 +114,246 @@ try:
 except Exception:
     openai_client = None
 
-def ask_claude(system_instruction, user_messages, max_tokens=500, parse_json=True):
-    safe_sys = system_instruction + "\n\n" + CLINICAL_GUARDRAIL
+def claude_system(instructions, telemetry=None):
+    """
+    Full system prompt: the guardrail and the caller's fixed instructions first, per-call
+    telemetry (readings, memory, tone) last, so requests share the longest possible prefix.
+    """
+    system = CLINICAL_GUARDRAIL.strip() + "\n\n" + instructions.strip()
+    return system + "\n\n" + telemetry.strip() if telemetry else system
+
+def ask_claude(system_instruction, user_messages, max_tokens=500, parse_json=True, cache_ttl=None, telemetry=None):
+    """
+    `system_instruction` is the caller's fixed template and `telemetry` its per-call inputs (see
+    claude_system()). With `cache_ttl` (seconds), identical requests are answered from the
+    persistent LLM cache; callers quantize telemetry (quantize_bg etc.) so near-identical
+    readings map to the same request.
+    """
+    system = claude_system(system_instruction, telemetry)
+    cache_key = llm_cache.make_key(ACTIVE_MODEL, max_tokens, system, user_messages, parse_json) if cache_ttl else None
+    if cache_key:
+        cached = llm_cache.get_cache().get(cache_key)
+        if cached is not None: return cached
     try:
-        res = client.messages.create(model=ACTIVE_MODEL, max_tokens=max_tokens, system=safe_sys, messages=user_messages)
+        res = client.messages.create(model=ACTIVE_MODEL, max_tokens=max_tokens, system=system, messages=user_messages)
+        llm_cache.record_usage("create", res.usage)
         text = res.content[0].text.strip()
         if parse_json:
             text = text.replace("```json", "").replace("```", "").strip()
             match = re.search(r'\{.*\}', text, re.DOTALL)
             if match:
                 text = match.group(0)
-            return json.loads(text)
+            text = json.loads(text)
+        if cache_key: llm_cache.get_cache().put(cache_key, text, cache_ttl)
         return text
     except Exception as e:
         if "not_found_error" in str(e) or "404" in str(e):
             raise Exception(f"**API Account Locked:** Check Anthropic billing.")
         raise e
 
-def get_ai_chart_summary(chart_type, time_window, metrics, active_memory=""):
-    sys_prompt = f"""You are my elite personal performance coach. Analyze my {chart_type} over the last {time_window}. 
-    Metrics: {metrics}. 
-    Recent Events Context: {active_memory}. 
+def stream_claude(system_instruction, user_messages, max_tokens=500, cache_ttl=None, telemetry=None):
+    """
+    ask_claude() as a generator of text chunks from the streaming Messages API, so callers can
+    render from the first token. The finished text shares ask_claude()'s (parse_json=False) cache.
+    """
+    system = claude_system(system_instruction, telemetry)
+    cache_key = llm_cache.make_key(ACTIVE_MODEL, max_tokens, system, user_messages, False) if cache_ttl else None
+    if cache_key:
+        cached = llm_cache.get_cache().get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    try:
+        with client.messages.stream(model=ACTIVE_MODEL, max_tokens=max_tokens, system=system, messages=user_messages) as stream:
+            for text in stream.text_stream:
+                parts.append(text)
+                yield text
+            final = stream.get_final_message()
+        llm_cache.record_usage("stream", final.usage)
+    except Exception as e:
+        if "not_found_error" in str(e) or "404" in str(e):
+            raise Exception(f"**API Account Locked:** Check Anthropic billing.")
+        raise e
+    # A reply cut off at max_tokens is not an answer; it is neither cached nor kept
+    if final.stop_reason == "max_tokens": raise Exception("Response was cut off before it finished.")
+    if cache_key: llm_cache.get_cache().put(cache_key, "".join(parts).strip(), cache_ttl)
+
+# `"key": "value"` pairs whose closing quote has arrived; escaped quotes stay inside the value
+_JSON_STRING_FIELD = re.compile(r'"(\w+)"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+def iter_json_fields(chunks, keys):
+    """Yields (key, value) for each wanted string field of a streamed JSON object as soon as it is complete."""
+    buf, pos, wanted = "", 0, set(keys)
+    for chunk in chunks:
+        buf += chunk
+        for match in _JSON_STRING_FIELD.finditer(buf, pos):
+            pos = match.end()
+            if match.group(1) in wanted:
+                wanted.discard(match.group(1))
+                yield match.group(1), json.loads(match.group(2))
+
+# Fixed prompt templates (the cacheable prefix); per-call telemetry is passed separately
+CHART_SUMMARY_INSTRUCTIONS = """You are my elite personal performance coach. Analyze the chart described at the end of this prompt.
     Clinical Guardrails: Target range is 70-180 mg/dL. Any spike above 180 is considered high and requires attention.
     CRITICAL INSTRUCTION: If the Recent Events explain the current glucose trend (e.g., a recently logged meal causing a spike, or recent exercise/strain causing a drop), you MUST explicitly acknowledge that connection. 
     Provide a 2-sentence highly actionable synthesis. Speak directly to me ('you'). No 'the patient'. No markdown."""
-    return ask_claude(sys_prompt, [{"role": "user", "content": "Synthesize this trend based on my recent context."}], max_tokens=150, parse_json=False)
+
+def get_ai_chart_summary(chart_type, time_window, metrics, active_memory=""):
+    telemetry = f"""Chart: my {chart_type} over the last {time_window}.
+    Metrics: {metrics}.
+    Recent Events Context: {active_memory}."""
+    return ask_claude(CHART_SUMMARY_INSTRUCTIONS, [{"role": "user", "content": "Synthesize this trend based on my recent context."}], max_tokens=150, parse_json=False, cache_ttl=llm_cache.DEFAULT_TTL_S, telemetry=telemetry)
+
+# Background AI calls: results per session keyed on the call's inputs, newest AI_RESULTS_KEPT kept
+AI_POLL_S = 1.0
+AI_RESULTS_KEPT = 32
+
+def ai_insight(render, fn, *args, pending="🤖 Synthesizing...", **kwargs):
+    """
+    Shows the result of an AI call without holding up the page. The call runs on the background
+    pool; until it lands, a polling fragment holds the slot, then one rerun draws `render(result)`.
+    Repeat renders with the same inputs reuse the finished result. An error is shown in the slot
+    once and then forgotten, so the next render retries the call.
+    """
+    key = _ai_key(fn, args, kwargs)
+    results, futures = st.session_state.ai_results, st.session_state.ai_futures
+    if key in futures and futures[key].done(): _collect_ai_result(key)
+    if key in results:
+        ok, value = results[key]
+        if ok: render(value)
+        else:
+            results.pop(key)
+            st.error(f"AI synthesis failed: {value}")
+        return
+    if key not in futures:
+        futures[key] = background.submit_once(("ai", key), fn, *args, executor=background.AI_EXECUTOR, **kwargs)
+    _ai_pending(key, pending)
+
+def _ai_key(fn, args, kwargs):
+    return hashlib.sha256(repr((fn.__name__, args, sorted(kwargs.items()))).encode("utf-8")).hexdigest()
+
+def _store_ai_result(key, ok, value):
+    results = st.session_state.ai_results
+    results[key] = (ok, value)
+    while len(results) > AI_RESULTS_KEPT: results.pop(next(iter(results)))
+
+def _collect_ai_result(key):
+    fut = st.session_state.ai_futures.pop(key)
+    error = fut.exception()
+    _store_ai_result(key, error is None, fut.result() if error is None else error)
+
+def _prune_ai_futures():
+    """Moves finished calls into the bounded results, so only running calls keep a future (inputs may have moved on)."""
+    for key in [k for k, fut in st.session_state.ai_futures.items() if fut.done()]: _collect_ai_result(key)
+
+def ai_stream(render, system_instruction, user_messages, max_tokens=500, cache_ttl=None, telemetry=None):
+    """
+    Streams a prose answer into the page with st.write_stream (time-to-first-token instead of the
+    whole completion), then redraws the slot with `render(text)`. Finished answers are reused per
+    session; a failed or truncated stream shows its error and is retried on the next render.
+    """
+    key = _ai_key(stream_claude, (system_instruction, user_messages), {"max_tokens": max_tokens, "telemetry": telemetry})
+    slot = st.empty()
+    if key not in st.session_state.ai_results:
+        try:
+            with slot.container(): text = st.write_stream(stream_claude(system_instruction, user_messages, max_tokens, cache_ttl, telemetry))
+        except Exception as e:
+            with slot.container(): st.error(f"AI synthesis failed: {e}")
+            return
+        _store_ai_result(key, True, text.strip())
+    with slot.container(): render(st.session_state.ai_results[key][1])
+
+def ai_stream_fields(fields, system_instruction, user_messages, max_tokens=500, cache_ttl=None, telemetry=None, pending="🤖 Synthesizing..."):
+    """
+    Streams a JSON-mode answer: each `fields` entry (key, render) gets its own slot, filled with
+    `render(value)` as soon as that key's string value has streamed in. Only an answer with every
+    field is kept, returned and cached (under ask_claude()'s parse_json key); otherwise the error is
+    shown, None returned and the next render retries.
+    """
+    key = _ai_key(stream_claude, (system_instruction, user_messages), {"max_tokens": max_tokens, "telemetry": telemetry, "fields": [k for k, _ in fields]})
+    slots = {k: st.empty() for k, _ in fields}
+    if key not in st.session_state.ai_results:
+        cache_key = llm_cache.make_key(ACTIVE_MODEL, max_tokens, claude_system(system_instruction, telemetry), user_messages, True) if cache_ttl else None
+        data = llm_cache.get_cache().get(cache_key) if cache_key else None
+        if not (isinstance(data, dict) and all(k in data for k, _ in fields)):
+            for k, _ in fields: slots[k].caption(pending)
+            data, renders = {}, dict(fields)
+            try:
+                for k, value in iter_json_fields(stream_claude(system_instruction, user_messages, max_tokens, telemetry=telemetry), renders):
+                    data[k] = value
+                    with slots[k].container(): renders[k](value)
+                missing = [k for k, _ in fields if k not in data]
+                if missing: raise Exception(f"Response was missing {', '.join(missing)}.")
+            except Exception as e:
+                for k, _ in fields: slots[k].empty()
+                st.error(f"AI synthesis failed: {e}")
+                return None
+            if cache_key: llm_cache.get_cache().put(cache_key, data, cache_ttl)
+        _store_ai_result(key, True, data)
+    value = st.session_state.ai_results[key][1]
+    for k, render in fields:
+        with slots[k].container(): render(value[k])
+    return value
+
+@st.fragment(run_every=AI_POLL_S)
+def _ai_pending(key, pending):
+    fut = st.session_state.ai_futures.get(key)
+    # Landed: one full rerun draws the result in place (this fragment is not created again)
+    if fut is None or fut.done(): st.rerun()
+    st.caption(pending)
+
+# The Briefing is precomputed in the background when an input that matters for a daily plan
+# changes (day, recovery, calendar, BG range band, context, journal), and kept in the persistent
+# LLM cache under the fingerprint of its prompt. Only users who open the Briefing pay for it: the
+# last view is recorded in the same persistent cache, so it survives sessions and restarts.
+BRIEFING_TTL_S = 4 * 60 * 60
+BRIEFING_RECENT_S = 7 * 24 * 60 * 60    # precompute for users who opened the Briefing within the last week
+BRIEFING_BG_BANDS = ("very low (<54)", "low (54-69)", "in range (70-180)", "high (181-250)", "very high (>250)")
+BRIEFING_MESSAGES = [{"role": "user", "content": "Generate my morning briefing."}]
+
+BRIEFING_INSTRUCTIONS = """You are an elite personal performance coach and clinical AI agent. Use the tone given with my telemetry at the end of this prompt.
+                Clinical Guardrails: Target range is 70-180 mg/dL. Any spike above 180 is considered high and requires attention.
+                CRITICAL: If the Active Memory explains the current glucose trend, explicitly acknowledge this.
+                Synthesize this into a proactive daily briefing. Focus on cognitive load management and metabolic forecasting. Speak directly to me using 'you'.
+                Return ONLY a valid JSON object with these EXACT keys: 
+                'metabolic_baseline' (assess my physical readiness and insulin sensitivity based on Whoop, BG, and Memory), 
+                'schedule_friction' (how my calendar density impacts my glucose management today), 
+                'action_directive' (one clear, proactive step to take right now)."""
+
+def briefing_telemetry(context, tone, meeting_count, recovery, bg, memory, day):
+    """
+    Per-call part of the Briefing prompt; it is the briefing's input fingerprint. BG enters as its
+    consensus range band only, so live readings and trend arrows do not trigger a rebuild.
+    """
+    band = BRIEFING_BG_BANDS[int(clinical_metrics.range_index(bg))]
+    return f"""Tone should be {tone}
+                Date: {day:%A %Y-%m-%d}.
+                Metrics: {context} Context, {meeting_count} meetings today, Whoop Recovery: {quantize(recovery, 5)}%, Current BG: {band}. 
+                Active Memory Context: {memory}."""
+
+def briefing_cache_key(telemetry):
+    return llm_cache.make_key(ACTIVE_MODEL, 500, claude_system(BRIEFING_INSTRUCTIONS, telemetry), BRIEFING_MESSAGES, True)
+
+def briefing_job_key(telemetry):
+    """Background-task key of the precompute, shared with ai_insight() so the view can join a running job."""
+    return ("ai", _ai_key(ask_claude, (BRIEFING_INSTRUCTIONS, BRIEFING_MESSAGES), {"cache_ttl": BRIEFING_TTL_S, "telemetry": telemetry}))
+
+def _briefing_viewed_key():
+    return f"briefing-viewed:{st.session_state.ns_url}"
+
+def mark_briefing_viewed():
+    """Records (for BRIEFING_RECENT_S, across sessions) that this user reads the Briefing."""
+    llm_cache.get_cache().put(_briefing_viewed_key(), time.time(), BRIEFING_RECENT_S)
+
+def precompute_briefing(telemetry):
+    """
+    Builds the Briefing off-thread unless it is cached (or already being built) for these inputs,
+    for users who opened the Briefing within BRIEFING_RECENT_S, so a new session's first view is ready.
+    """
+    if llm_cache.get_cache().get(_briefing_viewed_key()) is None: return
+    if llm_cache.get_cache().get(briefing_cache_key(telemetry)) is not None: return
+    background.submit_once(briefing_job_key(telemetry), ask_claude, BRIEFING_INSTRUCTIONS, BRIEFING_MESSAGES, executor=background.AI_EXECUTOR, cache_ttl=BRIEFING_TTL_S, telemetry=telemetry)
 
 def render_adaptive_schedule_card(title, value):
     card_css = "background-color: var(--secondary-background-color); padding: 20px; border-radius: 20px; border: 1px solid rgba(128,128,128,0.2); box-shadow: 0 4px 10px rgba(0,0,0,0.05); text-align: center;"
@@ -150,17 +377,89 @@ def get_time_remaining(end_time):
 
 # --- NEW CLINICAL METRICS (GMI & TIR) ---
 def calculate_gmi(mean_glucose):
+    if isinstance(mean_glucose, CGMSeries): mean_glucose = mean_glucose.glucose.mean() if len(mean_glucose) else np.nan
     if pd.isna(mean_glucose): return 0.0
     return round(3.31 + (0.02392 * mean_glucose), 1)
 
-def calculate_tir(df):
-    if len(df) == 0: return 0.0
-    in_range = len(df[(df['Glucose_Value'] >= 70) & (df['Glucose_Value'] <= 180)])
-    return round((in_range / len(df)) * 100, 1)
+@st.cache_resource
+def get_metrics_engine(source):
+    """One incrementally-updated RollingMetrics per data source, shared across reruns."""
+    return rolling_metrics.RollingMetrics()
+
+@st.cache_resource
+def get_forecaster(source):
+    """One incrementally-refitted GlucoseForecaster per data source, shared across reruns."""
+    return forecast.GlucoseForecaster()
+
+def user_utc_offset_min():
+    """The user's offset from UTC in minutes (e.g. -300 for EST): the browser's, else the server's."""
+    tzoff = st.context.timezone_offset
+    if tzoff is not None: return -int(tzoff)
+    return int(datetime.now().astimezone().utcoffset().total_seconds() // 60)
+
+def glucose_stats(window):
+    """
+    Mean/min/max/sample-std as ints: a named rolling window is read from the streaming engine,
+    any other CGMSeries view (e.g. overnight) is summarised directly.
+    """
+    if isinstance(window, CGMSeries):
+        g = window.glucose.astype(float)
+        if not len(g): return 0, 0, 0, 0
+        return int(g.mean()), int(g.min()), int(g.max()), int(g.std(ddof=1)) if len(g) > 1 else 0
+    m = metrics_engine.stats(window)
+    if not m: return 0, 0, 0, 0
+    return int(m["mean"]), int(m["min"]), int(m["max"]), int(m["std"])
+
+def add_risk_shading(fig, view):
+    """Shades the HIGH/LOW alert episodes of the risk timeline behind a chart of a `full_data` view."""
+    if not len(view): return
+    i = int(np.searchsorted(full_data.minutes, view.minutes[0]))
+    for start, end, code in logic.risk_spans(view.minutes, risk_codes[i:i + len(view)]):
+        # Pad by one reading so single-reading episodes still show
+        fig.add_vrect(x0=pd.Timestamp(start, unit='m'), x1=pd.Timestamp(end + 5, unit='m'), fillcolor=logic.RISK_COLORS[code], opacity=0.15, line_width=0, layer="below")
+
+def add_episode_markers(fig, view):
+    """Marks the nadir/peak of each low (<70) and high (>180) episode inside a chart of a `full_data` view."""
+    if not len(view): return
+    found = episode_index.query(int(view.minutes[0]), int(view.minutes[-1]) + 1, kinds=(episodes.LOW, episodes.HIGH))
+    inside = (found["extreme_minute"] >= view.minutes[0]) & (found["extreme_minute"] <= view.minutes[-1])
+    if not inside.any(): return
+    low = found["kind"][inside] == episodes.LOW
+    fig.add_trace(go.Scatter(
+        x=pd.to_datetime(found["extreme_minute"][inside], unit='m'), y=found["extreme"][inside], mode='markers', showlegend=False,
+        marker=dict(size=10, symbol=np.where(low, 'triangle-down', 'triangle-up'), color=np.where(low, '#ED8796', '#EED49F')),
+        hovertext=[f"{'Low' if l else 'High'} episode: {int(d)} min, AUC {a:.0f} mg/dL·min" for l, d, a in zip(low, episodes.durations(found)[inside], found["auc"][inside])],
+        hoverinfo='text'))
+
+@st.cache_resource(max_entries=4)
+def get_simulated_rollups(_series, data_version):
+    """Rollups for the simulated trace (real sources get theirs from the store)."""
+    return rollups.CGMRollups.from_series(_series)
+
+@st.cache_resource(max_entries=4)
+def get_simulated_episodes(_series, data_version):
+    """Episode index for the simulated trace (real sources get theirs from the store)."""
+    return episodes.EpisodeIndex.from_series(_series)
+
+# `_rollups`/`_history` are excluded from hashing like `_series` below; the history fingerprint keys the cache.
+@st.cache_data(ttl=300)
+def get_clinical_report(_rollups, _history, history_version, days, utc_offset_min=0):
+    """
+    Consensus metrics, local hourly AGP bands and per-day mean/TIR over the last `days` days,
+    read from the hourly/daily rollups (O(hours + days) rows). Only MAGE, which depends
+    on the order of readings, walks the raw window.
+    """
+    end = int(_history.minutes[-1]) + 1
+    start = end - days * 1440
+    summary = _rollups.summary(start, end)
+    summary["mage"] = clinical_metrics.mage(_history.last(hours=24 * days).glucose, summary["sd"])
+    return {
+        "summary": summary,
+        "agp": _rollups.agp(start, end, utc_offset_min=utc_offset_min),
+        "daily": _rollups.daily_summary(((end + utc_offset_min) // 1440 - days + 1) * 1440 - utc_offset_min, end, utc_offset_min),
+        "span_days": min(days, (end - int(_history.minutes[0])) / 1440),
+    }
 
-# -----------------------------------------------------------------------------
-# 3. STATE, TIMERS & EVENT LOGGING
-# -----------------------------------------------------------------------------
 def load_ns_config():
     try:
         with open("ns_config.json", "r") as f: return json.load(f)
@@ -187,6 +486,9 @@ if "_toast" not in st.session_state: st.session_state._toast = None
 if "active_view" not in st.session_state: st.session_state.active_view = "Home"
 if "latest_trend_insight" not in st.session_state: st.session_state.latest_trend_insight = "No macro trend synthesized yet. Run an analysis in the Trends tab."
 if "show_dossier" not in st.session_state: st.session_state.show_dossier = False
+if "ai_results" not in st.session_state: st.session_state.ai_results = {}
+if "ai_futures" not in st.session_state: st.session_state.ai_futures = {}
+_prune_ai_futures()
 
 # Consume transient toast message
 if st.session_state._toast:
@@ -224,22 +526,83 @@ if "code" in st.query_params and not st.session_state.whoop_token:
                 st.session_state.whoop_token = token_data["access_token"]
                 whoop.save_tokens(token_data); st.query_params.clear(); st.rerun()
 
-@st.cache_data(ttl=300)
-def get_cached_health_data(url, token):
-    if url:
-        real_df = logic.fetch_nightscout_data(url, token)
-        if real_df is not None and not real_df.empty: return real_df, True
-    return logic.fetch_health_data(), False
+# Per-source deadlines (seconds from loader start). A source that misses its deadline
+# degrades to its fallback for this render; its task keeps running and warms the cache.
+LOAD_DEADLINES = {"whoop": 6.0, "calendar": 2.0, "cgm": 8.0, "weather": 3.0}
 
 @st.cache_data(ttl=60)
-def get_cached_glycemic_risk(df, context, whoop_data=None, meeting_count=0, speaker_mode=False, owm_api_key="", is_real_data=False):
-    return logic.calc_glycemic_risk(df, context, whoop_data, meeting_count, speaker_mode, owm_api_key, is_real_data)
+def get_simulated_health_data():
+    sim_series = CGMSeries.from_pandas(logic.fetch_health_data(), source="simulator")
+    return sim_series, False, sim_series.fingerprint
+
+def get_cached_health_data(url, token, wait_s=LOAD_DEADLINES["cgm"]):
+    """
+    Returns (series, is_real, fingerprint). The fingerprint is the cheap content version downstream caches key on.
+    Real data is the whole stored history, read from the in-memory store that the background poller
+    keeps current, so once the first sync has landed there is no network on the render path. Each
+    call copies the store's columns into a new CGMSeries (minutes, compact dtypes); views slice it by time.
+    """
+    if url:
+        poller = nightscout_sync.start_poller(url, token)
+        poller.first_sync.wait(wait_s)
+        real_series = nightscout_sync.load_local_series(url, count=None)
+        if real_series is not None: return real_series, True, real_series.fingerprint
+    return get_simulated_health_data()
+
+def load_all_data(whoop_token, context, ns_url="", ns_token="", owm_api_key="", calendar_override=None):
+    """
+    Runs the Whoop, calendar, Nightscout and weather loads concurrently so a cold
+    render costs max(latency) rather than sum(latency), then scores risk.
+    Returns a dict of results plus `timed_out`, the sources that fell back this render.
+    """
+    start = time.monotonic()
+    weather_refresh = logic.prefetch_environmental_load(api_key=owm_api_key)
+    tasks = {
+        "whoop": background.EXECUTOR.submit(whoop.fetch_whoop_recovery, whoop_token) if whoop_token else None,
+        "calendar": None if calendar_override else background.EXECUTOR.submit(calendar_sync.fetch_calendar_context),
+        "cgm": background.EXECUTOR.submit(get_cached_health_data, ns_url, ns_token),
+        # Only a cold cache is worth waiting on; a stale reading is served while the refresh finishes.
+        "weather": None if logic.has_cached_weather() else weather_refresh,
+    }
+    fallbacks = {"whoop": None, "calendar": (3, False), "cgm": None, "weather": None}
+
+    results, timed_out = {}, []
+    for name, fut in tasks.items():
+        if fut is None:
+            results[name] = fallbacks[name]
+            continue
+        try:
+            results[name] = fut.result(timeout=max(0.0, LOAD_DEADLINES[name] - (time.monotonic() - start)))
+        except FuturesTimeout:
+            timed_out.append(name)
+            results[name] = fallbacks[name]
+        except Exception as e:
+            print(f"Loader Error ({name}): {e}")
+            results[name] = fallbacks[name]
+
+    if results["cgm"] is None:
+        local = nightscout_sync.load_local_series(ns_url, count=None) if ns_url else None
+        results["cgm"] = (local, True, local.fingerprint) if local is not None else get_simulated_health_data()
+    cgm_stale = bool(ns_url) and results["cgm"][1] and ("cgm" in timed_out or nightscout_sync.is_degraded(ns_url))
+
+    meeting_count, speaker_mode = calendar_override or results["calendar"]
+    series, is_real_cgm, data_version = results["cgm"]
+    # Memoised in logic on (data_version, every risk input incl. weather), returning the same
+    # series object: no per-render copy of the full history
+    full_data, status, color_hex, raw_reason = logic.calc_glycemic_risk(series, context, results["whoop"], meeting_count, speaker_mode, owm_api_key, is_real_cgm, fingerprint=data_version)
+    return {
+        "whoop": results["whoop"], "meeting_count": meeting_count, "speaker_mode": speaker_mode,
+        "cgm": series, "is_real_cgm": is_real_cgm, "cgm_stale": cgm_stale, "data_version": data_version,
+        "full_data": full_data, "status": status, "color_hex": color_hex, "raw_reason": raw_reason,
+        "risk_codes": logic.calc_risk_timeline(full_data, context, results["whoop"], speaker_mode, owm_api_key),
+        "timed_out": timed_out,
+    }
 
 try:
     with st.spinner("Synchronizing biometric telemetry..."):
-        whoop_metrics = whoop.fetch_whoop_recovery(st.session_state.whoop_token) if st.session_state.whoop_token else None
-        meeting_count = st.session_state.get("local_meeting_count", calendar_sync.fetch_calendar_context()[0])
-        speaker_mode = st.session_state.get("local_speaker_mode", calendar_sync.fetch_calendar_context()[1])
+        local_cal = (st.session_state.local_meeting_count, st.session_state.local_speaker_mode) if "local_meeting_count" in st.session_state else None
+        loaded = load_all_data(st.session_state.whoop_token, st.session_state.current_context, st.session_state.ns_url, st.session_state.ns_token, st.secrets.get("OWM_API_KEY", ""), local_cal)
+        whoop_metrics, meeting_count, speaker_mode = loaded["whoop"], loaded["meeting_count"], loaded["speaker_mode"]
         
         if whoop_metrics:
             w_rec = whoop_metrics.get('recovery', {}).get('score', {}).get('recovery_score', 0) if 'recovery' in whoop_metrics else whoop_metrics.get('score', {}).get('recovery_score', 0)
@@ -249,9 +612,29 @@ try:
             w_rhr = int(whoop_metrics.get('recovery', {}).get('score', {}).get('resting_heart_rate', 0)) if 'recovery' in whoop_metrics else int(whoop_metrics.get('score', {}).get('resting_heart_rate', 0))
         else: w_rec, w_sleep, w_strain, w_hrv, w_rhr = 0, 0, 0.0, 0, 0
 
-        raw_data, is_real_cgm = get_cached_health_data(st.session_state.ns_url, st.session_state.ns_token)
-        full_data, status, color_hex, raw_reason = get_cached_glycemic_risk(raw_data, st.session_state.current_context, whoop_metrics, meeting_count, speaker_mode, st.secrets.get("OWM_API_KEY", ""), is_real_cgm)
-        latest_bg = full_data.iloc[-1]
+        is_real_cgm, cgm_stale, full_data = loaded["is_real_cgm"], loaded["cgm_stale"], loaded["full_data"]
+        status, color_hex, raw_reason = loaded["status"], loaded["color_hex"], loaded["raw_reason"]
+        risk_codes = loaded["risk_codes"]
+        latest_bg = full_data.latest()
+        # Nightscout stamps readings in UTC, the simulator in local wall-clock time; views that
+        # bucket by hour of day or calendar day shift by this so they use the user's day
+        utc_offset_min = user_utc_offset_min() if is_real_cgm else 0
+
+        # `full_data` is the one time-indexed source: every view and metric slices it with
+        # window()/last()/overnight() (binary-search views) rather than keeping its own copy.
+        # Caches built from it key on its own version: simulated data is rewritten by the context
+        # modifiers, so the raw `data_version` would keep serving the previous context.
+        full_version = (full_data.fingerprint, st.session_state.current_context)
+        history_rollups = nightscout_sync.load_local_rollups(st.session_state.ns_url) if is_real_cgm else None
+        if history_rollups is None: history_rollups = get_simulated_rollups(full_data, full_version)
+        episode_index = nightscout_sync.load_local_episodes(st.session_state.ns_url) if is_real_cgm else None
+        if episode_index is None: episode_index = get_simulated_episodes(full_data, full_version)
+
+        # Both engines only consume readings newer than the last ones they saw
+        metrics_engine = get_metrics_engine(full_data.source)
+        metrics_engine.ingest(full_data)
+        forecaster = get_forecaster(full_data.source)
+        forecaster.ingest(full_data)
 except Exception as e:
     st.error(f"Data loading failed: {e}"); st.stop()
 
@@ -277,6 +660,11 @@ if recent_journals:
 
 context_memory_string = " | ".join(active_memory_list) if active_memory_list else "No active external events logged."
 
+# A new day, recovery score, calendar, BG band or journal entry changes the fingerprint; the
+# Briefing is then rebuilt before it is next opened
+briefing_inputs = briefing_telemetry(st.session_state.current_context, get_claude_tone(), meeting_count, w_rec, latest_bg['Glucose_Value'], context_memory_string, datetime.now().date())
+precompute_briefing(briefing_inputs)
+
 # -----------------------------------------------------------------------------
 # 5. AUTO-DETECT INTERCEPTS & UI HEADERS
 # -----------------------------------------------------------------------------
@@ -293,9 +681,10 @@ st.markdown(f"""
 if st.session_state.current_context == "Normal":
     auto_mode, auto_dur, auto_reason = None, 0, ""
     
-    if len(full_data) >= 6 and all(full_data.tail(6)['Glucose_Value'] > 160):
+    # Sustained >160 mg/dL: an ongoing elevated episode of at least six readings
+    if episode_index.sustained(episodes.ELEVATED, episodes.SUSTAINED_ELEVATED_MIN):
         auto_mode, auto_dur, auto_reason = "Stressed", 3, "Sustained elevated glucose detected."
-    elif w_strain > 14.0 and latest_bg['Trend'] in ["Falling", "Falling Fast"]:
+    elif w_strain > 14.0 and latest_bg['Trend_Code'] >= TREND_FALLING:
         auto_mode, auto_dur, auto_reason = "Recovery", 2, "High Whoop strain detected with dropping glucose (Post-Workout)."
     elif w_strain > 14.0:
         auto_mode, auto_dur, auto_reason = "Exercise", 2, "High systemic strain detected via Whoop."
@@ -318,7 +707,7 @@ if st.session_state.current_context == "Normal":
             st.rerun()
 
 elif st.session_state.current_context == "Exercise":
-    if latest_bg['Trend'] == "Falling Fast":
+    if latest_bg['Trend_Code'] == TREND_FALLING_FAST:
         if "Recovery" not in st.session_state.muted_intercepts or datetime.now() >= st.session_state.muted_intercepts["Recovery"]:
             st.warning("🤖 **Agentic Intercept:** Rapid glucose drop detected during Exercise. Shift to **Recovery** mode early to focus on refueling?")
             col1, col2, _ = st.columns([1, 1, 3])
@@ -344,9 +733,9 @@ with st.container(border=True):
             icon = {"Stressed": "🧘‍♂️", "Exercise": "🏃‍♂️", "Recovery": "🔋", "Sick": "🤒", "Project": "🧠", "Travel": "✈️"}.get(st.session_state.current_context, "🟣")
             vectors.append(f"{icon} {st.session_state.current_context} ({rem})")
 
-        tir_df = full_data.tail(36)
-        if len(tir_df) > 0:
-            low, tgt, elev, high = [len(tir_df[cond])/len(tir_df)*100 for cond in [tir_df['Glucose_Value'] < 80, (tir_df['Glucose_Value'] >= 80) & (tir_df['Glucose_Value'] <= 140), (tir_df['Glucose_Value'] > 140) & (tir_df['Glucose_Value'] <= 180), tir_df['Glucose_Value'] > 180]]
+        m3h = metrics_engine.stats("3h")
+        if m3h:
+            low, tgt, elev, high = [m3h["pct"][b] for b in ("below_80", "target", "elevated", "high")]
             if low > 5: vectors.append(f"🔴 {int(low)}% BG Low (3h)")
             elif high > 15: vectors.append(f"🔴 {int(high)}% BG High (3h)")
             elif elev > 25: vectors.append(f"🟡 {int(elev)}% BG Elevated (3h)")
@@ -466,9 +855,17 @@ with st.container(border=True):
             st.markdown("##### 🔌 Integrations")
             st.markdown("**🩸 Nightscout CGM Sync**")
             if st.session_state.ns_url:
-                if is_real_cgm: st.success("🟢 Connected & Streaming Live")
+                if is_real_cgm and cgm_stale: st.warning(f"🟡 Upstream Unreachable. Showing readings from {latest_bg['Timestamp'].strftime('%I:%M %p')} (retrying in background).")
+                elif is_real_cgm: st.success("🟢 Connected & Streaming Live")
                 else: st.error("🔴 Connection Failed. (Simulated Data)")
+                bf_days = st.selectbox("History Backfill", [14, 90], format_func=lambda d: f"{d} days", key="ns_backfill_days")
+                if st.button("⏬ Backfill History", key="ns_backfill", use_container_width=True):
+                    with st.spinner(f"Downloading {bf_days} days of CGM history..."):
+                        bf = nightscout_sync.backfill_nightscout_history(st.session_state.ns_url, st.session_state.ns_token, days=bf_days)
+                    if bf["failed"]: st.warning(f"{bf['fetched']}/{bf['pages']} pages synced ({bf['rows']} readings). Run again to resume.")
+                    else: st.success(f"History complete: {bf['rows']} new readings.")
                 if st.button("Disconnect / Reconnect", key="dc_ns"):
+                    nightscout_sync.stop_poller(st.session_state.ns_url)
                     st.session_state.ns_url = ""; st.session_state.ns_token = ""
                     save_ns_config("", "")
                     st.cache_data.clear(); st.rerun()
@@ -502,7 +899,14 @@ with st.container(border=True):
                 mc, sm = calendar_sync.analyze_local_calendar(cal_file.getvalue().decode("utf-8"))
                 st.session_state.local_meeting_count, st.session_state.local_speaker_mode = mc, sm
                 st.success(f"Local Sync: {mc} events loaded.")
-                
+
+            st.divider()
+            st.markdown("##### 🧮 AI Usage")
+            usage = dict(llm_cache.USAGE)
+            st.caption(f"{usage['calls']} Claude calls since restart: {usage['input_tokens']:,} uncached + {usage['cache_read_input_tokens']:,} cache-read "
+                       f"+ {usage['cache_creation_input_tokens']:,} cache-write input tokens, {usage['output_tokens']:,} output. "
+                       f"Prompt cache hit share: {llm_cache.cached_input_share():.0%}.")
+
             # --- DOCTOR REPORT GENERATION BUTTON ---
             st.divider()
             st.markdown("##### 🩺 Clinical Export")
@@ -520,16 +924,17 @@ st.divider()
 if 'db_search_submit' in locals() and db_search_submit and db_search_query:
     with st.spinner(f"Querying USDA Macro Database for '{db_search_query}'..."):
         try:
-            sys = f"""You are my elite personal clinical nutritionist managing my Type 1 Diabetes.
-            Look up the exact macronutrients for the following food query: {db_search_query}.
-            Speak directly to me using "you" and "your". Tone should be {get_claude_tone()}.
+            sys = """You are my elite personal clinical nutritionist managing my Type 1 Diabetes.
+            Look up the exact macronutrients for the food query given at the end of this prompt.
+            Speak directly to me using "you" and "your", in the tone given at the end of this prompt.
             Return ONLY a valid JSON object with EXACTLY these keys and strict data types:
             - "food_identified": "Short description." (Must be a String)
             - "estimated_carbs_g": 45 (MUST be a single Integer. No dictionaries)
             - "glycemic_index": "High", "Medium", or "Low" (Must be a String)
             - "analysis": "A concise 2-sentence clinical breakdown." (Must be a String)"""
+            telemetry = f"Food query: {db_search_query}. Tone should be {get_claude_tone()}."
             
-            meal_data = ask_claude(sys, [{"role": "user", "content": "Retrieve exact macros for this query."}])
+            meal_data = ask_claude(sys, [{"role": "user", "content": "Retrieve exact macros for this query."}], telemetry=telemetry)
             meal_data["source"] = "🔍 USDA Text Search"
             
             raw_c = meal_data.get('estimated_carbs_g', 0)
@@ -545,19 +950,21 @@ if 'text_submit' in locals() and text_submit and text_input:
     with st.spinner("Correlating subjective report with objective telemetry..."):
         try:
             ctx = {"context": st.session_state.current_context, "meetings": meeting_count, "glucose": int(latest_bg['Glucose_Value']), "trend": latest_bg['Trend']}
-            sys = f"""You are my elite AI clinical assistant. My telemetry: {json.dumps(ctx)}. 
-            Active Memory Context: {context_memory_string}.
+            sys = """You are my elite AI clinical assistant. My telemetry, memory and preferred tone follow at the end of this prompt.
             Clinical Guardrails: Target range is 70-180 mg/dL. Any spike above 180 is considered high and requires attention.
             Correlate my text with the telemetry and memory. 
-            Speak to me as 'you'. Tone should be {get_claude_tone()}. NEVER refer to me as "the patient".
+            Speak to me as 'you'. NEVER refer to me as "the patient".
             Return ONLY a valid JSON object with EXACTLY these keys:
             - "reply": "A contextual response. Include clinical escalation if anomalous symptoms persist."
             - "summary": "3 words."
-            - "scores": {{"bio_strain": 5, "cog_load": 5}}
+            - "scores": {"bio_strain": 5, "cog_load": 5}
             - "impact_prediction": "1-sentence prediction."
             - "suggested_mode": "Exercise", "Recovery", "Stressed", "Sick", "Project", "Travel", or "Normal" (Detect from my text)
             - "suggested_duration_hours": 1.5"""
-            res_data = ask_claude(sys, [{"role": "user", "content": text_input}])
+            telemetry = f"""My telemetry: {json.dumps(ctx)}.
+            Active Memory Context: {context_memory_string}.
+            Tone should be {get_claude_tone()}."""
+            res_data = ask_claude(sys, [{"role": "user", "content": text_input}], telemetry=telemetry)
             res_data["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M")
             st.session_state.journal_history = [res_data]
             log_event("🎙️ Note", res_data.get("summary", "Logged observation."))
@@ -573,15 +980,15 @@ if 'food_image' in locals() and food_image is not None:
         with st.spinner("Analyzing meal nutrition..."):
             try:
                 b64 = base64.b64encode(food_image.getvalue()).decode("utf-8")
-                sys = f"""You are my elite personal clinical nutritionist managing my Type 1 Diabetes.
+                sys = """You are my elite personal clinical nutritionist managing my Type 1 Diabetes.
                 Analyze the food image. Estimate carbs and glycemic index.
-                Speak directly to me using "you" and "your". Tone should be {get_claude_tone()}. NEVER refer to me as "the patient".
+                Speak directly to me using "you" and "your", in the tone given at the end of this prompt. NEVER refer to me as "the patient".
                 Return ONLY a valid JSON object with EXACTLY these keys and strict data types:
                 - "food_identified": "Short description." (Must be a String)
                 - "estimated_carbs_g": 45 (MUST be a single Integer. No dictionaries)
                 - "glycemic_index": "High", "Medium", or "Low" (Must be a String)
                 - "analysis": "A concise 2-sentence clinical breakdown." (Must be a String)"""
-                meal_data = ask_claude(sys, [{"role": "user", "content": [{"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": b64}}, {"type": "text", "text": "Analyze this meal for T1D."}]}])
+                meal_data = ask_claude(sys, [{"role": "user", "content": [{"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": b64}}, {"type": "text", "text": "Analyze this meal for T1D."}]}], telemetry=f"Tone should be {get_claude_tone()}.")
                 meal_data["source"] = "📸 Vision Estimate"
                 
                 raw_c = meal_data.get('estimated_carbs_g', 0)
@@ -659,26 +1066,35 @@ if st.session_state.show_dossier:
         st.caption(f"Generated on {datetime.now().strftime('%B %d, %Y')} | Confidential Medical Data")
         
         dos_c1, dos_c2, dos_c3, dos_c4 = st.columns(4)
-        d_gmi = calculate_gmi(full_data['Glucose_Value'].mean())
-        d_tir = calculate_tir(full_data)
+        d_report = get_clinical_report(history_rollups, full_data, full_version, 14, utc_offset_min)
+        d_sum = d_report["summary"]
+        d_gmi = calculate_gmi(d_sum["mean"])
+        d_end = int(full_data.minutes[-1]) + 1
+        d_episodes = episode_index.counts(d_end - 14 * 1440, d_end)
+        d_tir = round(d_sum["in_range"], 1)
         dos_c1.metric("Est. GMI", f"{d_gmi}%")
         dos_c2.metric("Time in Range (70-180)", f"{d_tir}%")
         dos_c3.metric("Avg Sleep Perf", f"{w_sleep}%" if w_sleep else "N/A")
         dos_c4.metric("Avg Daily Strain", f"{w_strain}" if w_strain else "N/A")
+
+        dos_c5, dos_c6, dos_c7, dos_c8 = st.columns(4)
+        dos_c5.metric("CV", f"{d_sum['cv']:.1f}%", "Stable (≤36%)" if d_sum['cv'] <= 36 else "Labile", delta_color="normal" if d_sum['cv'] <= 36 else "inverse")
+        dos_c6.metric("GRI", f"{d_sum['gri']:.0f}")
+        dos_c7.metric("Below 70 / 54", f"{d_sum['below_70']:.1f}% / {d_sum['very_low']:.1f}%")
+        dos_c8.metric("MAGE", f"{d_sum['mage']:.0f} mg/dL")
+        st.caption(f"Consensus metrics over {d_report['span_days']:.1f} days of CGM data ({d_sum['n']} readings). LBGI {d_sum['lbgi']:.1f} | HBGI {d_sum['hbgi']:.1f} | Above 180 / 250: {d_sum['above_180']:.1f}% / {d_sum['very_high']:.1f}%")
+        st.caption(f"Episodes (≥15 min): {d_episodes['low'][0]} below 70 ({d_episodes['very_low'][0]} below 54) | {d_episodes['high'][0]} above 180 ({d_episodes['very_high'][0]} above 250), {d_episodes['high'][1] // 60}h total")
         
-        with st.spinner("Synthesizing clinical report..."):
-            try:
-                sys_prompt = f"""You are an elite endocrinologist generating a clinical dossier for a patient's medical file.
-                Metrics: GMI {d_gmi}%, TIR {d_tir}%, Sleep Performance {w_sleep}%, Strain {w_strain}.
-                Analyze this data from an Enterprise Risk Management perspective. Output a 3-paragraph clinical summary highlighting systemic correlations (e.g., how their sleep and strain impact their glycemic volatility) and suggest 2 behavioral interventions. Speak in the third person ('The patient'). Do not prescribe insulin."""
-                dossier_text = ask_claude(sys_prompt, [{"role": "user", "content": "Generate the clinical dossier."}], max_tokens=1500, parse_json=False)
-                st.info(dossier_text)
-            except Exception as e:
-                st.error(f"Failed to generate synthesis: {e}")
-        
+        sys_prompt = """You are an elite endocrinologist generating a clinical dossier for a patient's medical file.
+        Analyze the metrics given at the end of this prompt from an Enterprise Risk Management perspective. Output a 3-paragraph clinical summary highlighting systemic correlations (e.g., how their sleep and strain impact their glycemic volatility) and suggest 2 behavioral interventions. Speak in the third person ('The patient'). Do not prescribe insulin."""
+        dossier_metrics = f"""Metrics: GMI {d_gmi}%, TIR {d_tir}%, CV {d_sum['cv']:.1f}%, GRI {d_sum['gri']:.0f}, Time <70 {d_sum['below_70']:.1f}% (<54 {d_sum['very_low']:.1f}%), Time >180 {d_sum['above_180']:.1f}% (>250 {d_sum['very_high']:.1f}%), LBGI {d_sum['lbgi']:.1f}, HBGI {d_sum['hbgi']:.1f}, MAGE {d_sum['mage']:.0f} mg/dL, Episodes <70 {d_episodes['low'][0]} (<54 {d_episodes['very_low'][0]}), Episodes >180 {d_episodes['high'][0]} (>250 {d_episodes['very_high'][0]}), Sleep Performance {w_sleep}%, Strain {w_strain}."""
+        # The report streams in after the rest of the dossier (and its Close button) has rendered
+        dossier_slot = st.container()
         if st.button("Close Report", type="primary"):
             st.session_state.show_dossier = False
             st.rerun()
+        with dossier_slot:
+            ai_stream(st.info, sys_prompt, [{"role": "user", "content": "Generate the clinical dossier."}], max_tokens=1500, cache_ttl=2 * llm_cache.DEFAULT_TTL_S, telemetry=dossier_metrics)
         st.markdown("---")
 
 else:
@@ -687,11 +1103,11 @@ else:
         st.markdown("<br>", unsafe_allow_html=True)
         
         c1, c2, c3, c4 = st.columns(4)
-        delta = int(latest_bg['Glucose_Value'] - full_data.iloc[-2]['Glucose_Value'])
+        delta = latest_bg['Glucose_Value'] - full_data.latest(2)['Glucose_Value']
         delta_str = f"+{delta}" if delta >= 0 else f"{delta}"
         c1.metric("🩸 Blood Sugar", f"{int(latest_bg['Glucose_Value'])} mg/dL", f"{delta_str} ({latest_bg['Trend']})")
         
-        gmi = calculate_gmi(full_data['Glucose_Value'].mean())
+        gmi = calculate_gmi(metrics_engine.stats("24h")["mean"])
         c2.metric("📊 Est. GMI", f"{gmi}%", "Target: < 7.0%" if gmi < 7.0 else "Above Target", delta_color="normal" if gmi < 7.0 else "inverse")
         
         if st.session_state.whoop_token and whoop_metrics:
@@ -710,43 +1126,53 @@ else:
         st.markdown("### 📈 Predictive Volatility Horizon")
         st.caption("Fusing primary biometric momentum with systemic strain to visualize the future T+3 hour risk surface.")
         
-        # Calculate Cone Boundaries
-        strain_multiplier = (w_strain / 21.0) * 30
-        sleep_multiplier = 20 if w_sleep < 70 else (10 if w_sleep < 85 else 0)
-        max_divergence = 15 + strain_multiplier + sleep_multiplier
+        # Forecast T+3h quantiles from the personal model, widened for strain, sleep debt and context
+        widen = forecast.uncertainty_multiplier(w_strain, w_sleep, st.session_state.current_context)
+        offsets, bands = forecaster.forecast(full_data.minutes, full_data.glucose, widen=widen)
+        p5, p25, p50, p75, p95 = bands
+        max_divergence = (p95[-1] - p5[-1]) / 2
         
         current_g = latest_bg['Glucose_Value']
         t0 = latest_bg['Timestamp']
-        t_end = t0 + timedelta(hours=3)
-        
-        # Determine baseline trajectory
-        trend_val = 15 if "Rising" in latest_bg['Trend'] else (-15 if "Falling" in latest_bg['Trend'] else 5)
-        future_g = current_g + trend_val
+        future_x = [t0] + [t0 + timedelta(minutes=int(m)) for m in offsets]
         
         cone_fig = go.Figure()
         
         # 1. Plot Historical Data (Past 2 hours)
-        past_df = full_data.tail(24) # 2 hours of 5-min intervals
+        past_df = full_data.last(hours=2).to_pandas(mark_gaps=True) # past 2 hours, broken at sensor gaps
         cone_fig.add_trace(go.Scatter(
             x=past_df['Timestamp'], y=past_df['Glucose_Value'], 
             mode='lines', name='Historical', 
             line=dict(color='#10B981', width=3)
         ))
         
-        # 2. Plot the Cone Area (Risk Surface)
-        cone_fig.add_trace(go.Scatter(
-            x=[t0, t_end, t_end, t0],
-            y=[current_g, future_g + max_divergence, future_g - max_divergence, current_g],
-            fill='toself',
-            fillcolor='rgba(99, 102, 241, 0.15)',
-            line=dict(color='rgba(255,255,255,0)'),
-            hoverinfo="skip",
-            name='Risk Surface'
-        ))
+        # 2. Plot the Cone Area (Risk Surface): 5-95% outer and 25-75% inner bands
+        for lo, hi, alpha in ((p5, p95, 0.15), (p25, p75, 0.25)):
+            cone_fig.add_trace(go.Scatter(
+                x=future_x + future_x[::-1],
+                y=[current_g] + list(hi) + list(lo[::-1]) + [current_g],
+                fill='toself',
+                fillcolor=f'rgba(99, 102, 241, {alpha})',
+                line=dict(color='rgba(255,255,255,0)'),
+                hoverinfo="skip",
+                name='Risk Surface'
+            ))
+        
+        # 2b. Typical 5-95% range for these hours of day over the last 14 days (merged hourly sketches)
+        cone_end = int(full_data.minutes[-1]) + 1
+        cone_hours = [((t0 + timedelta(minutes=utc_offset_min)).hour + h) % 24 for h in range(4)]
+        _, typical = history_rollups.agp(cone_end - 14 * 1440, cone_end, (5, 95), hours=cone_hours, utc_offset_min=utc_offset_min)
+        if not np.isnan(typical).any():
+            cone_x = [t0.floor("h") + timedelta(hours=h) for h in range(4)]
+            cone_fig.add_trace(go.Scatter(
+                x=cone_x + cone_x[::-1], y=list(typical[1]) + list(typical[0][::-1]),
+                fill='toself', fillcolor='rgba(148, 163, 184, 0.12)',
+                line=dict(color='rgba(255,255,255,0)'), hoverinfo="skip", name='Typical Range (14d)'
+            ))
         
         # 3. Plot Midline Prediction (Dashed)
         cone_fig.add_trace(go.Scatter(
-            x=[t0, t_end], y=[current_g, future_g],
+            x=future_x, y=[current_g] + list(p50),
             mode='lines', name='Predicted Path',
             line=dict(color='#6366F1', width=2, dash='dash')
         ))
@@ -765,27 +1191,28 @@ else:
         )
         st.plotly_chart(cone_fig, use_container_width=True, config={'displayModeBar': False})
         
-        st.info(f"**Agentic Insight:** Volatility divergence is currently **±{int(max_divergence)} mg/dL**, influenced by a Whoop Strain multiplier of **{w_strain}** and recent sleep recovery metrics.")
+        st.info(f"**Agentic Insight:** Volatility divergence at T+3h is **±{int(max_divergence)} mg/dL** (median path {int(p50[-1])} mg/dL), learned from your CGM history and widened ×{widen:.2f} by a Whoop Strain of **{w_strain}** and recent sleep recovery metrics.")
     
     elif st.session_state.active_view == "Briefing":
-        with st.spinner("Compiling Executive Briefing..."):
-            try:
-                sys = f"""You are an elite personal performance coach and clinical AI agent. Tone should be {get_claude_tone()}
-                Metrics: {st.session_state.current_context} Context, {meeting_count} meetings today, Whoop Recovery: {w_rec}%, Current BG: {int(latest_bg['Glucose_Value'])} ({latest_bg['Trend']}). 
-                Active Memory Context: {context_memory_string}.
-                Clinical Guardrails: Target range is 70-180 mg/dL. Any spike above 180 is considered high and requires attention.
-                CRITICAL: If the Active Memory explains the current glucose trend, explicitly acknowledge this.
-                Synthesize this into a proactive daily briefing. Focus on cognitive load management and metabolic forecasting. Speak directly to me using 'you'.
-                Return ONLY a valid JSON object with these EXACT keys: 
-                'metabolic_baseline' (assess my physical readiness and insulin sensitivity based on Whoop, BG, and Memory), 
-                'schedule_friction' (how my calendar density impacts my glucose management today), 
-                'action_directive' (one clear, proactive step to take right now)."""
-                
-                data = ask_claude(sys, [{"role": "user", "content": "Generate my morning briefing."}])
-                st.info(f"**🧬 Metabolic Baseline:** {html.escape(data.get('metabolic_baseline', ''))}")
-                st.warning(f"**🗓️ Schedule Friction:** {html.escape(data.get('schedule_friction', ''))}")
-                st.success(f"**🎯 Action Directive:** {html.escape(data.get('action_directive', ''))}")
-            except Exception as e: st.error(f"Failed: {e}")
+        briefing_fields = [
+            ("metabolic_baseline", lambda v: st.info(f"**🧬 Metabolic Baseline:** {html.escape(v)}")),
+            ("schedule_friction", lambda v: st.warning(f"**🗓️ Schedule Friction:** {html.escape(v)}")),
+            ("action_directive", lambda v: st.success(f"**🎯 Action Directive:** {html.escape(v)}")),
+        ]
+        def render_briefing(data):
+            for k, render in briefing_fields: render(data.get(k, ""))
+
+        mark_briefing_viewed()
+        ready = llm_cache.get_cache().get(briefing_cache_key(briefing_inputs))
+        if ready is not None:
+            # Precomputed for these inputs: served without touching the API
+            render_briefing(ready)
+        elif background.inflight(briefing_job_key(briefing_inputs)):
+            # Precompute still running: join it rather than starting a second request
+            ai_insight(render_briefing, ask_claude, BRIEFING_INSTRUCTIONS, BRIEFING_MESSAGES, cache_ttl=BRIEFING_TTL_S, telemetry=briefing_inputs, pending="🤖 Compiling Executive Briefing...")
+        else:
+            # Cached under briefing_cache_key(), so later opens are served like a precompute
+            ai_stream_fields(briefing_fields, BRIEFING_INSTRUCTIONS, BRIEFING_MESSAGES, cache_ttl=BRIEFING_TTL_S, telemetry=briefing_inputs, pending="🤖 Compiling Executive Briefing...")
     
     elif st.session_state.active_view == "Metrics":
         top_container = st.container()
@@ -793,20 +1220,18 @@ else:
         
         st.markdown("<br>", unsafe_allow_html=True)
         tw = st.radio("Time Range", ["3h", "6h", "12h", "24h"], index=1, horizontal=True, label_visibility="collapsed", key="metrics_tw")
-        p_df = full_data.tail({"3h": 36, "6h": 72, "12h": 144, "24h": 288}[tw])
+        p_win = full_data.last(minutes=rolling_metrics.WINDOWS_MIN[tw])
         
         with top_container:
-            with st.spinner("Synthesizing Trend..."):
-                raw_std_val = p_df['Glucose_Value'].std()
-                safe_std = int(raw_std_val) if pd.notna(raw_std_val) else 0
-                metrics_str = f"Avg: {int(p_df['Glucose_Value'].mean())}, Min: {int(p_df['Glucose_Value'].min())}, Max: {int(p_df['Glucose_Value'].max())}, Std Dev: {safe_std}, Latest: {int(p_df['Glucose_Value'].iloc[-1])}"
-                st.success(f"**🤖 Agentic Synthesis:** {get_ai_chart_summary('Glucose', tw, metrics_str, context_memory_string)}")
+            p_avg, p_min, p_max, safe_std = glucose_stats(tw)
+            metrics_str = f"Avg: {quantize_bg(p_avg)}, Min: {quantize_bg(p_min)}, Max: {quantize_bg(p_max)}, Std Dev: {quantize_bg(safe_std)}, Latest: {quantize_bg(p_win.glucose[-1])}"
+            ai_insight(lambda text: st.success(f"**🤖 Agentic Synthesis:** {text}"), get_ai_chart_summary, 'Glucose', tw, metrics_str, context_memory_string, pending="🤖 Synthesizing Trend...")
                 
             c_dex = st.columns(3)
-            c_dex[0].metric("Blood Sugar (mg/dL)", int(latest_bg['Glucose_Value']), int(latest_bg['Glucose_Value'] - full_data.iloc[-2]['Glucose_Value']))
+            c_dex[0].metric("Blood Sugar (mg/dL)", latest_bg['Glucose_Value'], latest_bg['Glucose_Value'] - full_data.latest(2)['Glucose_Value'])
             c_dex[1].metric("Trend", latest_bg['Trend'])
             
-            gmi_tw = calculate_gmi(p_df['Glucose_Value'].mean())
+            gmi_tw = calculate_gmi(metrics_engine.stats(tw)["mean"])
             c_dex[2].metric("Est. GMI", f"{gmi_tw}%")
             
             if st.session_state.whoop_token and whoop_metrics:
@@ -819,8 +1244,11 @@ else:
         
         with chart_container:
             st.markdown("##### 🩸 Current Blood Sugar")
-            fig = go.Figure(go.Scatter(x=p_df['Timestamp'], y=p_df['Glucose_Value'], mode='lines', line=dict(color='#8B5CF6', width=3)))
+            plot_df = p_win.to_pandas(mark_gaps=True)
+            fig = go.Figure(go.Scatter(x=plot_df['Timestamp'], y=plot_df['Glucose_Value'], mode='lines', line=dict(color='#8B5CF6', width=3)))
             fig.add_hrect(y0=70, y1=180, line_width=0, fillcolor="rgba(166, 218, 149, 0.1)", opacity=0.5); fig.add_hline(y=70, line_dash="dash", line_color="#ED8796")
+            add_risk_shading(fig, p_win)
+            add_episode_markers(fig, p_win)
             fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='gray'), height=400, margin=dict(l=0, r=0, t=30, b=0), yaxis_title="mg/dL", xaxis=dict(fixedrange=True), yaxis=dict(fixedrange=True))
             st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
     
@@ -832,9 +1260,10 @@ else:
         trend_window = st.radio("Select Horizon", ["1 Week", "1 Month", "3 Months"], horizontal=True, key="trends_tw")
     
         days = 7 if trend_window == "1 Week" else 30 if trend_window == "1 Month" else 90
-        dates = pd.date_range(end=datetime.now(), periods=days, freq='D')
-        mock_tir = np.clip(np.random.normal(75, 8, days), 0, 100) 
-        mock_avg_bg = np.clip(np.random.normal(135, 15, days), 70, 200)
+        t_report = get_clinical_report(history_rollups, full_data, full_version, days, utc_offset_min)
+        t_sum = t_report["summary"]
+        day_starts, daily_avg_bg, daily_tir = t_report["daily"]
+        dates = pd.to_datetime(day_starts + utc_offset_min, unit="m")
     
         with top_container:
             if st.button(f"🧠 Synthesize {trend_window} Patterns", type="primary", use_container_width=True):
@@ -842,12 +1271,13 @@ else:
                     try:
                         journal_text = " | ".join([f"{e['time']}: {e['desc']}" for e in st.session_state.event_log]) if st.session_state.event_log else "No recent manual logs."
         
-                        sys_prompt = f"""You are my elite long-term performance endocrinologist.
-                        Analyze my {trend_window} metabolic trends based on my recent journals, current Whoop strain ({w_strain}), and average TIR of {int(mock_tir.mean())}%.
-                        Journal Context: {journal_text}
+                        sys_prompt = """You are my elite long-term performance endocrinologist.
+                        Analyze my metabolic trends based on my recent journals, current Whoop strain and the range metrics given at the end of this prompt.
                         Provide a 3-sentence deep insight identifying a hidden pattern (e.g., "Your TIR drops on days you log high stress and sleep poorly"). Speak directly to me ('you'). No markdown.
                         """
-                        trend_insight = ask_claude(sys_prompt, [{"role": "user", "content": "Find my hidden metabolic patterns."}], max_tokens=500, parse_json=False)
+                        trend_telemetry = f"""Window: {trend_window}. Whoop strain: {w_strain}. Average TIR {int(t_sum['in_range'])}% (CV {t_sum['cv']:.0f}%, GRI {t_sum['gri']:.0f}, {t_sum['below_70']:.1f}% below 70).
+                        Journal Context: {journal_text}"""
+                        trend_insight = ask_claude(sys_prompt, [{"role": "user", "content": "Find my hidden metabolic patterns."}], max_tokens=500, parse_json=False, telemetry=trend_telemetry)
                         
                         st.session_state.latest_trend_insight = trend_insight
                         st.success(f"**Agentic Synthesis:** {trend_insight}")
@@ -857,9 +1287,17 @@ else:
                 st.success(f"**Latest Synthesis:** {st.session_state.latest_trend_insight}")
     
         with chart_container:
+            t_cols = st.columns(5)
+            t_cols[0].metric("Time in Range", f"{t_sum['in_range']:.0f}%")
+            t_cols[1].metric("Below 70", f"{t_sum['below_70']:.1f}%")
+            t_cols[2].metric("CV", f"{t_sum['cv']:.0f}%")
+            t_cols[3].metric("GRI", f"{t_sum['gri']:.0f}")
+            t_cols[4].metric("MAGE", f"{t_sum['mage']:.0f}")
+            if t_report["span_days"] < days - 1: st.caption(f"Only {t_report['span_days']:.1f} days of CGM history available. Backfill more from the ☰ MENU.")
+
             fig = go.Figure()
-            fig.add_trace(go.Bar(x=dates, y=mock_tir, name="Time in Range (%)", marker_color="#8B5CF6", opacity=0.7))
-            fig.add_trace(go.Scatter(x=dates, y=mock_avg_bg, name="Avg Glucose (mg/dL)", mode="lines+markers", line=dict(color="#ED8796", width=3), yaxis="y2"))
+            fig.add_trace(go.Bar(x=dates, y=daily_tir, name="Time in Range (%)", marker_color="#8B5CF6", opacity=0.7))
+            fig.add_trace(go.Scatter(x=dates, y=daily_avg_bg, name="Avg Glucose (mg/dL)", mode="lines+markers", line=dict(color="#ED8796", width=3), yaxis="y2"))
         
             fig.update_layout(
                 paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='gray'),
@@ -870,6 +1308,25 @@ else:
                 showlegend=False
             )
             st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+
+            st.markdown("##### 🕒 Ambulatory Glucose Profile")
+            bin_starts, bands = t_report["agp"]
+            hours = bin_starts / 60
+            p5, p25, p50, p75, p95 = bands
+            agp_fig = go.Figure()
+            agp_fig.add_trace(go.Scatter(x=hours, y=p95, mode="lines", line=dict(width=0), hoverinfo="skip"))
+            agp_fig.add_trace(go.Scatter(x=hours, y=p5, mode="lines", line=dict(width=0), fill="tonexty", fillcolor="rgba(139, 92, 246, 0.15)", name="5–95%"))
+            agp_fig.add_trace(go.Scatter(x=hours, y=p75, mode="lines", line=dict(width=0), hoverinfo="skip"))
+            agp_fig.add_trace(go.Scatter(x=hours, y=p25, mode="lines", line=dict(width=0), fill="tonexty", fillcolor="rgba(139, 92, 246, 0.35)", name="25–75%"))
+            agp_fig.add_trace(go.Scatter(x=hours, y=p50, mode="lines", line=dict(color="#8B5CF6", width=3), name="Median"))
+            agp_fig.add_hrect(y0=70, y1=180, line_width=0, fillcolor="rgba(166, 218, 149, 0.1)", opacity=0.5)
+            agp_fig.update_layout(
+                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='gray'),
+                height=300, margin=dict(l=0, r=0, t=30, b=0), showlegend=False,
+                xaxis=dict(title="Hour of Day", range=[0, 23], dtick=3, showgrid=False, fixedrange=True),
+                yaxis=dict(title="mg/dL", fixedrange=True)
+            )
+            st.plotly_chart(agp_fig, use_container_width=True, config={'displayModeBar': False})
     
     elif st.session_state.active_view == "Schedule":
         st.info(f"**Agentic Insight:** The Risk Engine is factoring in **{meeting_count} meetings** to adjust glycemic sensitivity.")
@@ -884,24 +1341,31 @@ else:
         st.markdown("### 🌙 Sleep & Recovery Correlation")
         if st.session_state.whoop_token and whoop_metrics:
             sleep_perf = whoop_metrics.get('score', {}).get('sleep_performance_percentage', 85)
-            overnight_df = full_data.tail(96)
-            
-            raw_std = overnight_df['Glucose_Value'].std()
-            safe_std = int(raw_std) if pd.notna(raw_std) else 0
+            night_start, night_end = full_data.overnight_span(utc_offset_min=utc_offset_min)
+            overnight_win = full_data.window(night_start, night_end)
+            if len(overnight_win) < 2:
+                # No readings for last night yet: fall back to the trailing 8 hours
+                overnight_win = full_data.last(hours=8)
+                night_start, night_end = int(full_data.minutes[-1]) - 8 * 60, int(full_data.minutes[-1]) + 1
+            o_avg, o_min, o_max, safe_std = glucose_stats(overnight_win)
 
-            with st.spinner("Synthesizing Sleep Impact..."):
-                metrics_str = f"Avg: {int(overnight_df['Glucose_Value'].mean())}, Min: {int(overnight_df['Glucose_Value'].min())}, Max: {int(overnight_df['Glucose_Value'].max())}, Std Dev: {safe_std}"
-                st.success(f"**🤖 Agentic Insight:** {get_ai_chart_summary(f'Overnight Glucose (with {sleep_perf}% Sleep Performance)', '12h', metrics_str, context_memory_string)}")
+            metrics_str = f"Avg: {quantize_bg(o_avg)}, Min: {quantize_bg(o_min)}, Max: {quantize_bg(o_max)}, Std Dev: {quantize_bg(safe_std)}"
+            ai_insight(lambda text: st.success(f"**🤖 Agentic Insight:** {text}"), get_ai_chart_summary, f'Overnight Glucose (with {quantize(sleep_perf, 5)}% Sleep Performance)', '12h', metrics_str, context_memory_string, pending="🤖 Synthesizing Sleep Impact...")
             
             s_col1, s_col2 = st.columns(2)
             with s_col1: st.metric("Sleep Performance", f"{sleep_perf}%", delta="Restorative" if sleep_perf > 80 else "Deficit", delta_color="normal" if sleep_perf > 80 else "inverse")
             with s_col2: st.metric("Overnight Volatility", f"±{safe_std} mg/dL", delta="Stable" if safe_std < 15 else "Erratic", delta_color="normal" if safe_std < 15 else "inverse")
+            o_p10, o_p50, o_p90 = history_rollups.quantiles(night_start, night_end, (10, 50, 90))
+            st.caption(f"Overnight distribution: median {o_p50:.0f} mg/dL, 10–90% band {o_p10:.0f}–{o_p90:.0f} mg/dL")
             st.markdown("---")
             
             st.markdown("##### 🌙 Overnight Blood Sugar")
             sleep_fig = go.Figure()
-            sleep_fig.add_trace(go.Scatter(x=overnight_df['Timestamp'], y=overnight_df['Glucose_Value'], mode='lines+markers', line=dict(color='#A855F7', width=4)))
+            overnight_plot = overnight_win.to_pandas(mark_gaps=True)
+            sleep_fig.add_trace(go.Scatter(x=overnight_plot['Timestamp'], y=overnight_plot['Glucose_Value'], mode='lines+markers', line=dict(color='#A855F7', width=4)))
             sleep_fig.add_hrect(y0=70, y1=180, line_width=0, fillcolor="rgba(166, 218, 149, 0.1)", opacity=0.5); sleep_fig.add_hline(y=70, line_dash="dash", line_color="#ED8796")
+            add_risk_shading(sleep_fig, overnight_win)
+            add_episode_markers(sleep_fig, overnight_win)
             sleep_fig.update_layout(height=300, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', margin=dict(l=0, r=0, t=30, b=0), xaxis=dict(fixedrange=True), yaxis=dict(fixedrange=True))
             st.plotly_chart(sleep_fig, use_container_width=True, config={'displayModeBar': False})
             
@@ -0,0 +1,30 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared worker pool for out-of-band I/O (cache refreshes, probes, prefetch) so that
+# none of it runs on the Streamlit script thread.
+EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tldh-bg")
+# LLM calls take seconds each; they get their own small pool so pending insights can never
+# starve the deadline-bound data loads on EXECUTOR.
+AI_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="tldh-ai")
+
+_INFLIGHT = {}
+_LOCK = threading.Lock()
+
+def _discard(key, fut):
+    with _LOCK:
+        if _INFLIGHT.get(key) is fut: del _INFLIGHT[key]
+
+def submit_once(key, fn, *args, executor=None, **kwargs):
+    """Submits `fn` (to `executor`, default EXECUTOR) unless a task with the same key is still running. Returns the task's future."""
+    with _LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is not None and not fut.done(): return fut
+        fut = (executor or EXECUTOR).submit(fn, *args, **kwargs)
+        _INFLIGHT[key] = fut
+    fut.add_done_callback(lambda f: _discard(key, f))
+    return fut
+
+def inflight(key):
+    """The running future for `key`, or None."""
+    with _LOCK: return _INFLIGHT.get(key)
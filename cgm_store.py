@@ -0,0 +1,364 @@
+import os
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import rollups
+import episodes
+
+STORE_DIR = "cgm_history"
+
+# -----------------------------------------------------------------------------
+# 1. TREND ENCODING (SHARED BY STORE, PARSER & RISK ENGINE)
+# -----------------------------------------------------------------------------
+TREND_LABELS = np.array([
+    "Unknown", "Rising Fast", "Rising", "Rising Slowly", "Steady",
+    "Falling Slowly", "Falling", "Falling Fast"
+], dtype=object)
+TREND_CODES = {label: code for code, label in enumerate(TREND_LABELS)}
+TREND_UNKNOWN = TREND_CODES["Unknown"]
+TREND_STEADY = TREND_CODES["Steady"]
+TREND_FALLING = TREND_CODES["Falling"]
+TREND_FALLING_FAST = TREND_CODES["Falling Fast"]
+
+# Codes are ordered Rising Fast (1) .. Steady (4) .. Falling Fast (7), so direction
+# checks are integer comparisons and work element-wise on code arrays.
+def is_rising(code):
+    return (code > TREND_UNKNOWN) & (code < TREND_STEADY)
+
+def is_falling(code):
+    return code > TREND_STEADY
+
+def encode_trends(labels):
+    """Maps trend label strings onto their int8 codes (unrecognised labels become Unknown)."""
+    codes = pd.Index(TREND_LABELS).get_indexer(np.asarray(labels, dtype=object))
+    return np.where(codes < 0, 0, codes).astype(np.int8)
+
+# Rate-of-change bands (mg/dL/min) as used by CGM receivers: |rate| < 1 Steady,
+# 1-2 Slowly, 2-3 Rising/Falling, >= 3 Fast. Slopes are least squares over the trailing window.
+TREND_WINDOW_MIN = 15
+TREND_RATE_EDGES = np.array([1.0, 2.0, 3.0])
+_RISING_BANDS = np.array([TREND_STEADY, TREND_CODES["Rising Slowly"], TREND_CODES["Rising"], TREND_CODES["Rising Fast"]], dtype=np.int8)
+_FALLING_BANDS = np.array([TREND_STEADY, TREND_CODES["Falling Slowly"], TREND_FALLING, TREND_FALLING_FAST], dtype=np.int8)
+
+def trend_slopes(minutes, glucose, window_min=TREND_WINDOW_MIN):
+    """
+    Least-squares slope (mg/dL/min) of each reading over the readings in its trailing
+    (t - window_min, t] window, from prefix sums in one vectorised pass. The window is
+    measured in real minutes, so readings across a sensor gap never contribute;
+    readings with fewer than two points in their window get NaN.
+    """
+    t = np.asarray(minutes, dtype=np.int64)
+    if not len(t): return np.empty(0)
+    t = t - t[0]
+    g = np.asarray(glucose, dtype=np.float64)
+    end = np.arange(1, len(t) + 1)
+    start = np.searchsorted(t, t - window_min, side="right")
+
+    def window_sum(values):
+        cs = np.concatenate(([0], np.cumsum(values)))
+        return cs[end] - cs[start]
+
+    n = end - start
+    st, sg, stt, stg = window_sum(t), window_sum(g), window_sum(t * t), window_sum(t * g)
+    den = n * stt - st * st
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * stg - st * sg) / den
+    return np.where((n >= 2) & (den > 0), slope, np.nan)
+
+def classify_trends(minutes, glucose, window_min=TREND_WINDOW_MIN):
+    """int8 trend codes from rate of change; Unknown where the slope is undefined."""
+    slope = trend_slopes(minutes, glucose, window_min)
+    rate = np.nan_to_num(np.abs(slope))
+    band = np.searchsorted(TREND_RATE_EDGES, rate, side="right")
+    codes = np.where(slope < 0, _FALLING_BANDS[band], _RISING_BANDS[band])
+    return np.where(np.isnan(slope), TREND_UNKNOWN, codes).astype(np.int8)
+
+# Longest spacing (minutes) still treated as continuous data; 3+ missed readings is a gap
+GAP_MIN = 15
+# Local hours bounding "overnight" (evening before -> morning of)
+OVERNIGHT_HOURS = (22, 7)
+
+# -----------------------------------------------------------------------------
+# 2. COMPACT ARRAY-BACKED SERIES
+# -----------------------------------------------------------------------------
+class CGMSeries:
+    """
+    Compact CGM trace: int32 epoch minutes, uint16 mg/dL and int8 trend codes
+    (7 bytes/reading vs ~60+ for the Timestamp/float/object DataFrame).
+    Slicing returns views over the same buffers; time windows are binary searches.
+    """
+    __slots__ = ("minutes", "glucose", "trend", "source")
+
+    def __init__(self, minutes, glucose, trend=None, source=""):
+        self.minutes = np.asarray(minutes, dtype=np.int32)
+        self.glucose = np.asarray(glucose, dtype=np.uint16)
+        self.trend = classify_trends(self.minutes, self.glucose) if trend is None else np.asarray(trend, dtype=np.int8)
+        self.source = source
+
+    @classmethod
+    def from_arrays(cls, date_ms, sgv, trend, source=""):
+        """Builds a series from store columns (epoch ms, sgv, trend code)."""
+        return cls(np.asarray(date_ms, dtype=np.int64) // 60000, sgv, trend, source)
+
+    @classmethod
+    def from_pandas(cls, df, source=""):
+        """Builds a series from a Timestamp/Glucose_Value[/Trend] DataFrame (trends from slopes if absent)."""
+        minutes = df['Timestamp'].values.astype('datetime64[m]').astype(np.int64)
+        glucose = np.clip(np.rint(df['Glucose_Value'].to_numpy(dtype=float)), 0, np.iinfo(np.uint16).max)
+        trend = encode_trends(df['Trend']) if 'Trend' in df.columns else None
+        return cls(minutes, glucose, trend, source)
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, sl):
+        if not isinstance(sl, slice): raise TypeError("CGMSeries only supports slicing")
+        return CGMSeries(self.minutes[sl], self.glucose[sl], self.trend[sl], self.source)
+
+    def tail(self, n):
+        return self[-n:] if n else self[len(self):]
+
+    def window(self, start_minute, end_minute=None):
+        """Readings with start_minute < minute <= end_minute, found by binary search (a view)."""
+        lo = np.searchsorted(self.minutes, start_minute, side="right")
+        hi = len(self) if end_minute is None else np.searchsorted(self.minutes, end_minute, side="right")
+        return self[lo:hi]
+
+    def last(self, minutes=0, hours=0):
+        """The trailing `hours`/`minutes` of data, measured back from the newest reading (a view)."""
+        if not len(self): return self
+        return self.window(int(self.minutes[-1]) - (minutes + 60 * hours))
+
+    def overnight_span(self, date=None, start_hour=OVERNIGHT_HOURS[0], end_hour=OVERNIGHT_HOURS[1], utc_offset_min=0):
+        """
+        (start_minute, end_minute) of the night ending on the morning of `date`
+        (default: the local day of the newest reading), e.g. 22:00 the evening before to 07:00.
+        Hours are the user's local time: `utc_offset_min` is their offset from UTC (e.g. -300
+        for EST), 0 for series already stamped in local wall-clock time.
+        """
+        if date is None: date = pd.Timestamp(int(self.minutes[-1]) + utc_offset_min, unit='m').date() if len(self) else pd.Timestamp.now().date()
+        day = int(pd.Timestamp(date).value // 60_000_000_000) - utc_offset_min
+        return day - (24 - start_hour) * 60, day + end_hour * 60
+
+    def overnight(self, date=None, utc_offset_min=0):
+        """Readings from the night ending on the morning of `date` (a view); see overnight_span()."""
+        return self.window(*self.overnight_span(date, utc_offset_min=utc_offset_min))
+
+    def gaps(self, max_gap_min=GAP_MIN):
+        """True where a reading follows a gap of more than `max_gap_min` minutes."""
+        out = np.zeros(len(self), dtype=bool)
+        out[1:] = np.diff(self.minutes) > max_gap_min
+        return out
+
+    @property
+    def fingerprint(self):
+        """O(1) content version: (source, row count, last reading minute, last glucose)."""
+        if not len(self): return (self.source, 0, None, None)
+        return (self.source, len(self), int(self.minutes[-1]), int(self.glucose[-1]))
+
+    @property
+    def timestamps(self):
+        return self.minutes.astype('datetime64[m]')
+
+    @property
+    def trend_labels(self):
+        return TREND_LABELS[self.trend]
+
+    def latest(self, offset=1):
+        """Reading `offset` positions from the end as a {'Timestamp', 'Glucose_Value', 'Trend', 'Trend_Code'} dict."""
+        i = len(self) - offset
+        return {
+            'Timestamp': pd.Timestamp(int(self.minutes[i]), unit='m'),
+            'Glucose_Value': int(self.glucose[i]),
+            'Trend': TREND_LABELS[self.trend[i]],
+            'Trend_Code': int(self.trend[i]),
+        }
+
+    def to_pandas(self, mark_gaps=False):
+        """
+        DataFrame for plotting. Glucose (uint16) and Trend (Categorical over the int8
+        codes) wrap the existing buffers; only the timestamp column is materialised.
+        With `mark_gaps`, a NaN row is inserted inside each gap so charts break the
+        line there instead of drawing across missing data (this copies).
+        """
+        minutes, glucose, trend = self.minutes, self.glucose, self.trend
+        gap = np.flatnonzero(self.gaps()) if mark_gaps else ()
+        if len(gap):
+            minutes = np.insert(minutes, gap, minutes[gap - 1] + 1)
+            glucose = np.insert(glucose.astype(np.float64), gap, np.nan)
+            trend = np.insert(trend, gap, TREND_UNKNOWN)
+        return pd.DataFrame({
+            'Timestamp': minutes.astype('datetime64[m]').astype('datetime64[ns]'),
+            'Glucose_Value': glucose,
+            'Trend': pd.Categorical.from_codes(trend, categories=TREND_LABELS, validate=False),
+        }, copy=False)
+
+# -----------------------------------------------------------------------------
+# 3. APPEND-ONLY COLUMNAR STORE
+# -----------------------------------------------------------------------------
+# One raw binary file per column. Appends are plain 'ab' writes, so a refresh
+# that brings in two new readings writes a handful of bytes instead of
+# rewriting the whole history.
+COLUMNS = (("date", np.int64), ("sgv", np.uint16), ("trend", np.int8))
+
+class CGMStore:
+    """Persistent per-source CGM history keyed on a Nightscout base URL."""
+
+    def __init__(self, source, root=STORE_DIR):
+        self.source = source
+        self.path = os.path.join(root, hashlib.sha1(source.encode("utf-8")).hexdigest()[:16])
+        self._lock = threading.RLock()
+        self._cols = None
+        self._rollups = None
+        self._episodes = None
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _load(self):
+        if self._cols is not None: return self._cols
+        cols = {}
+        for name, dtype in COLUMNS:
+            f = self._file(name)
+            cols[name] = np.fromfile(f, dtype=dtype) if os.path.exists(f) else np.empty(0, dtype=dtype)
+        # An interrupted append can leave columns ragged; trust only the common prefix, and cut the
+        # files back to it too so the next 'ab' append lands on the same row in every column
+        n = min(len(c) for c in cols.values())
+        for name, dtype in COLUMNS:
+            if len(cols[name]) > n: os.truncate(self._file(name), n * np.dtype(dtype).itemsize)
+        self._cols = {k: v[:n] for k, v in cols.items()}
+        return self._cols
+
+    def __len__(self):
+        with self._lock: return len(self._load()["date"])
+
+    def last_date(self):
+        """Returns the newest stored epoch-ms timestamp, or None for an empty store."""
+        with self._lock:
+            dates = self._load()["date"]
+            return int(dates[-1]) if len(dates) else None
+
+    def append(self, dates, sgv, trend):
+        """Appends readings strictly newer than the high-water mark. Returns the number written."""
+        dates = np.asarray(dates, dtype=np.int64)
+        order = np.argsort(dates, kind="stable")
+        dates, sgv, trend = dates[order], np.asarray(sgv)[order], np.asarray(trend)[order]
+
+        with self._lock:
+            cols = self._load()
+            last = cols["date"][-1] if len(cols["date"]) else None
+            keep = np.ones(len(dates), dtype=bool)
+            if len(dates): keep[1:] = dates[1:] != dates[:-1]
+            if last is not None: keep &= dates > last
+            if not keep.any(): return 0
+
+            new = {
+                "date": dates[keep],
+                "sgv": np.clip(sgv[keep], 0, np.iinfo(np.uint16).max).astype(np.uint16),
+                "trend": trend[keep].astype(np.int8),
+            }
+            missing = new["trend"] == TREND_UNKNOWN
+            if missing.any():
+                # No usable device direction: classify from the slope, with stored readings as context
+                ctx = np.searchsorted(cols["date"], new["date"][0] - TREND_WINDOW_MIN * 60000, side="right")
+                codes = classify_trends(np.concatenate([cols["date"][ctx:], new["date"]]) // 60000,
+                                        np.concatenate([cols["sgv"][ctx:], new["sgv"]]))[-len(new["date"]):]
+                new["trend"][missing] = codes[missing]
+            os.makedirs(self.path, exist_ok=True)
+            for name, _ in COLUMNS:
+                with open(self._file(name), "ab") as f: new[name].tofile(f)
+                cols[name] = np.concatenate([cols[name], new[name]])
+            if self._rollups is not None: self._rollups.add(new["date"] // 60000, new["sgv"])
+            if self._episodes is not None: self._episodes.add(new["date"] // 60000, new["sgv"])
+            return int(keep.sum())
+
+    def _unseen(self, dates, tolerance_ms):
+        """True for dates with no stored reading within `tolerance_ms` (exclusive)."""
+        stored = self._load()["date"]
+        if not len(stored) or not len(dates) or tolerance_ms <= 0: return np.ones(len(dates), dtype=bool)
+        i = np.searchsorted(stored, dates)
+        before = dates - stored[np.maximum(i - 1, 0)]
+        after = stored[np.minimum(i, len(stored) - 1)] - dates
+        return np.minimum(np.abs(before), np.abs(after)) >= tolerance_ms
+
+    def merge(self, dates, sgv, trend, tolerance_ms=0):
+        """
+        Inserts readings anywhere in the timeline (backfill pages arrive out of order).
+        Falls through to a plain append when every row is newer than the store;
+        otherwise dedupes on `date` (stored rows win) and rewrites the columns atomically.
+        With `tolerance_ms`, an incoming row that close to a stored one is the same reading
+        (e.g. a page snapped onto a different grid phase) and is dropped.
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        sgv, trend = np.asarray(sgv), np.asarray(trend)
+        with self._lock:
+            fresh = self._unseen(dates, tolerance_ms)
+            dates, sgv, trend = dates[fresh], sgv[fresh], trend[fresh]
+            last = self.last_date()
+            if last is None or not len(dates) or dates.min() > last:
+                return self.append(dates, sgv, trend)
+
+            cols = self._load()
+            before = len(cols["date"])
+            merged = {
+                "date": np.concatenate([cols["date"], dates]),
+                "sgv": np.concatenate([cols["sgv"], np.clip(sgv, 0, np.iinfo(np.uint16).max).astype(np.uint16)]),
+                "trend": np.concatenate([cols["trend"], np.asarray(trend, dtype=np.int8)]),
+            }
+            order = np.argsort(merged["date"], kind="stable")
+            sorted_dates = merged["date"][order]
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = sorted_dates[1:] != sorted_dates[:-1]
+            order = order[keep]
+            for name, _ in COLUMNS: cols[name] = merged[name][order]
+            missing = (order >= before) & (cols["trend"] == TREND_UNKNOWN)
+            if missing.any(): cols["trend"][missing] = classify_trends(cols["date"] // 60000, cols["sgv"])[missing]
+
+            os.makedirs(self.path, exist_ok=True)
+            for name, _ in COLUMNS:
+                tmp = self._file(name) + ".tmp"
+                cols[name].tofile(tmp)
+                os.replace(tmp, self._file(name))
+            if self._rollups is not None:
+                fresh = order[order >= before]
+                self._rollups.add(merged["date"][fresh] // 60000, merged["sgv"][fresh])
+            # Backfill can split or join episodes anywhere in the timeline; rebuild on next use
+            self._episodes = None
+            return len(order) - before
+
+    def read(self, tail=None):
+        """Returns (date_ms, sgv, trend_code) arrays, optionally limited to the last `tail` rows."""
+        with self._lock:
+            cols = self._load()
+            sl = slice(-tail, None) if tail else slice(None)
+            return cols["date"][sl], cols["sgv"][sl], cols["trend"][sl]
+
+    def rollups(self):
+        """Hourly/daily rollups of the whole history, built on first use and then kept current by append/merge."""
+        with self._lock:
+            if self._rollups is None:
+                cols = self._load()
+                self._rollups = rollups.CGMRollups()
+                self._rollups.add(cols["date"] // 60000, cols["sgv"])
+            return self._rollups
+
+    def episodes(self):
+        """Hypo/hyper EpisodeIndex of the whole history, built on first use and kept current by append."""
+        with self._lock:
+            if self._episodes is None: self._episodes = episodes.EpisodeIndex.from_series(self.series())
+            return self._episodes
+
+    def series(self, tail=None):
+        """Returns the stored history (or its last `tail` rows) as a CGMSeries."""
+        return CGMSeries.from_arrays(*self.read(tail), source=self.source)
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+def get_store(source, root=STORE_DIR):
+    """Process-wide registry so every caller shares one in-memory copy per source."""
+    key = (source, root)
+    with _STORES_LOCK:
+        if key not in _STORES: _STORES[key] = CGMStore(source, root)
+        return _STORES[key]
@@ -0,0 +1,165 @@
+import numpy as np
+
+# International consensus CGM thresholds (mg/dL)
+VERY_LOW, LOW, HIGH, VERY_HIGH = 54, 70, 180, 250
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+# Upper-exclusive edges of the five consensus ranges: <54, 54-69, 70-180, 181-250, >250
+RANGE_EDGES = (VERY_LOW, LOW, HIGH + 1, VERY_HIGH + 1)
+
+# -----------------------------------------------------------------------------
+# 1. AMBULATORY GLUCOSE PROFILE
+# -----------------------------------------------------------------------------
+def agp_profile(minutes, glucose, bin_minutes=60, percentiles=AGP_PERCENTILES, utc_offset_min=0):
+    """
+    Percentile bands by local time of day. Returns (bin_start_minutes, bands) where bands has
+    one row per percentile and one column per bin (NaN for bins with no readings).
+    `utc_offset_min` shifts UTC-stamped minutes onto the user's clock (0 for local stamps).
+    A single sort groups every reading by (bin, value); each percentile is then a
+    linear interpolation between two gathered order statistics per bin.
+    """
+    n_bins = 1440 // bin_minutes
+    bins = ((np.asarray(minutes, dtype=np.int64) + utc_offset_min) % 1440) // bin_minutes
+    # Readings are whole mg/dL, so (bin, value) packs into one int64 and a plain sort groups them
+    values = np.clip(np.rint(np.asarray(glucose, dtype=np.float64)), 0, 0xFFFF).astype(np.int64)
+    ordered = (np.sort((bins << 16) | values) & 0xFFFF).astype(np.float64)
+    counts = np.bincount(bins, minlength=n_bins)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    q = np.asarray(percentiles, dtype=np.float64)[:, None] / 100.0
+    pos = starts + q * np.maximum(counts - 1, 0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, starts + np.maximum(counts - 1, 0))
+    if len(ordered):
+        lo, hi = np.minimum(lo, len(ordered) - 1), np.minimum(hi, len(ordered) - 1)
+        bands = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+    else:
+        bands = np.full(pos.shape, np.nan)
+    bands[:, counts == 0] = np.nan
+    return np.arange(n_bins) * bin_minutes, bands
+
+# -----------------------------------------------------------------------------
+# 2. VARIABILITY & RISK INDICES
+# -----------------------------------------------------------------------------
+def range_percentages(glucose):
+    """Consensus time-in-ranges (% of readings): <54, 54-69, 70-180, 181-250, >250, plus <70 and >180."""
+    return range_percentages_from_counts(np.bincount(range_index(glucose), minlength=5))
+
+def glycemia_risk_index(ranges):
+    """GRI (Klonoff 2023) from range_percentages(); capped at 100."""
+    hypo = ranges["very_low"] + 0.8 * ranges["low"]
+    hyper = ranges["very_high"] + 0.5 * ranges["high"]
+    return min(3.0 * hypo + 1.6 * hyper, 100.0), hypo, hyper
+
+# Kovatchev risk r(g) = 10 * f(g)^2, split into its low (f < 0) and high (f > 0) halves and
+# tabulated per integer mg/dL so LBGI/HBGI are a gather and a mean.
+_BG_SCALE = 1.509 * (np.log(np.arange(1, 1024, dtype=np.float64)) ** 1.084 - 5.381)
+_LOW_RISK = np.concatenate(([0.0], np.where(_BG_SCALE < 0, 10.0 * _BG_SCALE ** 2, 0.0)))
+_HIGH_RISK = np.concatenate(([0.0], np.where(_BG_SCALE > 0, 10.0 * _BG_SCALE ** 2, 0.0)))
+
+def risk_values(glucose):
+    """Per-reading (low risk, high risk) whose means are LBGI/HBGI. Zero readings score zero."""
+    g = np.clip(np.rint(np.asarray(glucose, dtype=np.float64)), 0, len(_LOW_RISK) - 1).astype(np.int64)
+    return _LOW_RISK[g], _HIGH_RISK[g]
+
+def risk_indices(glucose):
+    """(LBGI, HBGI) from Kovatchev's symmetrised glucose scale."""
+    g = np.asarray(glucose)
+    g = g[g > 0]
+    if not len(g): return 0.0, 0.0
+    rl, rh = risk_values(g)
+    return float(rl.mean()), float(rh.mean())
+
+def mage(glucose, sd=None):
+    """
+    Mean Amplitude of Glycemic Excursions: mean height of peak-to-nadir swings larger
+    than one SD. Turning points are found vectorised; only that (much shorter) list is
+    walked to drop swings that never clear the SD threshold.
+    """
+    g = np.asarray(glucose, dtype=np.float64)
+    if len(g) < 3: return 0.0
+    if sd is None: sd = g.std(ddof=1)
+    if not sd: return 0.0
+
+    # Collapse flat runs, then keep the endpoints and every change of direction
+    keep = np.ones(len(g), dtype=bool)
+    keep[1:] = g[1:] != g[:-1]
+    g = g[keep]
+    if len(g) < 3: return 0.0
+    step = np.sign(np.diff(g))
+    turns = np.flatnonzero(step[1:] != step[:-1]) + 1
+    extrema = g[np.concatenate(([0], turns, [len(g) - 1]))].tolist()
+
+    # Hysteresis over the extrema: a swing counts once it reverses by more than one SD
+    lo = hi = extrema[0]
+    for i, v in enumerate(extrema):
+        lo, hi = min(lo, v), max(hi, v)
+        if hi - lo > sd: break
+    else:
+        return 0.0
+    rising = v == hi
+    anchor, peak = (lo, hi) if rising else (hi, lo)
+    swings = []
+    for v in extrema[i + 1:]:
+        if rising:
+            if v > peak: peak = v
+            elif peak - v > sd: swings.append(peak - anchor); anchor, peak, rising = peak, v, False
+        else:
+            if v < peak: peak = v
+            elif v - peak > sd: swings.append(anchor - peak); anchor, peak, rising = peak, v, True
+    if abs(peak - anchor) > sd: swings.append(abs(peak - anchor))
+    return float(np.mean(swings)) if swings else 0.0
+
+# -----------------------------------------------------------------------------
+# 3. SUMMARIES
+# -----------------------------------------------------------------------------
+def summarize(glucose):
+    """Full consensus metrics for a window of readings as a flat dict."""
+    g = np.asarray(glucose, dtype=np.float64)
+    if not len(g): return None
+    mean = g.mean()
+    sd = g.std(ddof=1) if len(g) > 1 else 0.0
+    ranges = range_percentages(g)
+    gri, hypo, hyper = glycemia_risk_index(ranges)
+    lbgi, hbgi = risk_indices(g)
+    return {
+        "n": len(g), "mean": mean, "sd": sd, "cv": 100.0 * sd / mean if mean else 0.0,
+        "gmi": 3.31 + 0.02392 * mean, **ranges,
+        "gri": gri, "gri_hypo": hypo, "gri_hyper": hyper,
+        "lbgi": lbgi, "hbgi": hbgi, "mage": mage(g, sd),
+    }
+
+def daily_summary(minutes, glucose, days=None, utc_offset_min=0):
+    """
+    Per-calendar-day (day_start_minutes, mean, TIR%) computed with bincount, oldest first.
+    Days are the user's local days (see agp_profile() for `utc_offset_min`); day starts are
+    the epoch minute of each local midnight. `days` keeps only the most recent N days;
+    days with no readings are dropped.
+    """
+    minutes = np.asarray(minutes, dtype=np.int64)
+    if not len(minutes): return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    day = (minutes + utc_offset_min) // 1440
+    first = day[-1] - days + 1 if days else day[0]
+    sel = day >= first
+    idx, g = day[sel] - first, np.asarray(glucose, dtype=np.float64)[sel]
+    n = np.bincount(idx)
+    total = np.bincount(idx, weights=g)
+    in_range = np.bincount(idx, weights=(g >= LOW) & (g <= HIGH))
+    has = n > 0
+    return (np.flatnonzero(has) + first) * 1440 - utc_offset_min, total[has] / n[has], 100.0 * in_range[has] / n[has]
+
+# -----------------------------------------------------------------------------
+# 4. ADDITIVE FORMS (FOR PRE-AGGREGATED ROLLUPS)
+# -----------------------------------------------------------------------------
+def range_percentages_from_counts(counts):
+    """range_percentages() from the five consensus range counts (<54, 54-69, 70-180, 181-250, >250)."""
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    pct = 100.0 * counts / total if total else np.zeros(5)
+    return {
+        "very_low": pct[0], "low": pct[1], "in_range": pct[2], "high": pct[3], "very_high": pct[4],
+        "below_70": pct[0] + pct[1], "above_180": pct[3] + pct[4],
+    }
+
+def range_index(glucose):
+    """Consensus range (0 = <54 ... 4 = >250) of each reading."""
+    return np.searchsorted(RANGE_EDGES, np.asarray(glucose), side="right")
@@ -0,0 +1,181 @@
+import threading
+import numpy as np
+
+# Excursion kinds: the first two are readings below their threshold, the rest above it.
+# "elevated" (>160) backs the sustained-high intercept; the others are the consensus bands.
+VERY_LOW, LOW, ELEVATED, HIGH, VERY_HIGH = range(5)
+EPISODE_KINDS = ("very_low", "low", "elevated", "high", "very_high")
+EPISODE_THRESHOLDS = (54, 70, 160, 180, 250)
+MIN_DURATION_MIN = 15                   # consensus minimum episode length
+STEP_MIN = 5                            # minutes each reading stands for
+MAX_GAP_MIN = 15                        # a longer sensor gap ends an episode
+SUSTAINED_ELEVATED_MIN = 30             # six consecutive readings >160 trigger the stress intercept
+COLUMNS = ("kind", "start", "end", "extreme", "extreme_minute", "auc")
+
+# -----------------------------------------------------------------------------
+# 1. RUN-LENGTH DETECTION
+# -----------------------------------------------------------------------------
+def _empty():
+    return {
+        "kind": np.empty(0, dtype=np.int8), "start": np.empty(0, dtype=np.int64), "end": np.empty(0, dtype=np.int64),
+        "extreme": np.empty(0, dtype=np.uint16), "extreme_minute": np.empty(0, dtype=np.int64), "auc": np.empty(0),
+    }
+
+def _concat(parts):
+    return {c: np.concatenate([p[c] for p in parts]) for c in COLUMNS}
+
+def _take(episodes, sel):
+    return {c: episodes[c][sel] for c in COLUMNS}
+
+def _runs(minutes, glucose, max_gap_min=MAX_GAP_MIN):
+    """
+    Every excursion run of every kind, ignoring the minimum duration, as episode columns
+    plus an `open` mask for runs still going at the last reading. One pass per kind: run
+    ids are a cumulative sum over run starts, nadir/peak one sort and AUC one bincount.
+    """
+    m = np.asarray(minutes, dtype=np.int64)
+    g = np.asarray(glucose, dtype=np.float64)
+    if not len(g): return _empty(), np.empty(0, dtype=bool)
+    joined = np.diff(m) <= max_gap_min                  # reading i+1 continues reading i
+    parts, open_ = [], []
+    for kind, threshold in enumerate(EPISODE_THRESHOLDS):
+        below = kind in (VERY_LOW, LOW)
+        inside = g < threshold if below else g > threshold
+        rows = np.flatnonzero(inside)
+        if not len(rows): continue
+        continues = np.zeros(len(g), dtype=bool)
+        continues[1:] = inside[1:] & inside[:-1] & joined
+        run = np.cumsum(~continues[rows]) - 1           # run id of each inside reading
+        firsts = np.flatnonzero(np.diff(run, prepend=-1))
+        lasts = np.append(firsts[1:], len(rows)) - 1
+        # Nadir (or peak) per run: sort by (run, depth) and take each run's first row
+        depth = g[rows] if below else -g[rows]
+        deepest = rows[np.lexsort((depth, run))[firsts]]
+        parts.append({
+            "kind": np.full(len(firsts), kind, dtype=np.int8), "start": m[rows[firsts]], "end": m[rows[lasts]],
+            "extreme": g[deepest].astype(np.uint16), "extreme_minute": m[deepest],
+            "auc": np.bincount(run, weights=np.abs(g[rows] - threshold)) * STEP_MIN,
+        })
+        open_.append(rows[lasts] == len(g) - 1)
+    if not parts: return _empty(), np.empty(0, dtype=bool)
+    episodes, open_ = _concat(parts), np.concatenate(open_)
+    order = np.lexsort((episodes["kind"], episodes["start"]))
+    return _take(episodes, order), open_[order]
+
+def durations(episodes):
+    """Episode lengths in minutes (each reading stands for STEP_MIN)."""
+    return episodes["end"] - episodes["start"] + STEP_MIN
+
+def detect_episodes(minutes, glucose, min_duration_min=MIN_DURATION_MIN, max_gap_min=MAX_GAP_MIN):
+    """
+    Contiguous excursions below 54/70 and above 160/180/250 lasting at least `min_duration_min`,
+    as columns {kind, start, end, extreme (nadir/peak), extreme_minute, auc (mg/dL·min beyond
+    the threshold)} sorted by start. Sensor gaps longer than `max_gap_min` end an episode.
+    """
+    episodes, _ = _runs(minutes, glucose, max_gap_min)
+    return _take(episodes, durations(episodes) >= min_duration_min)
+
+# -----------------------------------------------------------------------------
+# 2. INCREMENTAL INDEX
+# -----------------------------------------------------------------------------
+class EpisodeIndex:
+    """
+    Episodes of a CGM history, kept current as readings stream in. Finished episodes are
+    stored once; only the readings of runs still open at the newest reading are rescanned
+    when new data arrives, so an append costs O(new + open run), not O(history).
+    """
+
+    def __init__(self, min_duration_min=MIN_DURATION_MIN):
+        self.min_duration_min = min_duration_min
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, source):
+        self.source = source
+        self.closed = _empty()
+        self.last_minute, self.last_value = None, None
+        # Readings from the start of the earliest still-open run, and the open runs themselves
+        self._tail_minutes = np.empty(0, dtype=np.int64)
+        self._tail_glucose = np.empty(0, dtype=np.float64)
+        self._open = _empty()
+
+    @classmethod
+    def from_series(cls, series):
+        index = cls()
+        index.ingest(series)
+        return index
+
+    def add(self, minutes, glucose):
+        """Folds readings newer than the last one seen into the index."""
+        minutes = np.asarray(minutes, dtype=np.int64)
+        glucose = np.asarray(glucose, dtype=np.float64)
+        with self._lock:
+            if self.last_minute is not None:
+                keep = minutes > self.last_minute
+                minutes, glucose = minutes[keep], glucose[keep]
+            if not len(minutes): return
+            m = np.concatenate([self._tail_minutes, minutes])
+            g = np.concatenate([self._tail_glucose, glucose])
+            runs, open_ = _runs(m, g)
+            # Runs that closed before the previous newest reading were stored on an earlier add
+            done = ~open_ & (self.last_minute is None or runs["end"] >= self.last_minute)
+            done &= durations(runs) >= self.min_duration_min
+            if done.any(): self.closed = _concat([self.closed, _take(runs, done)])
+            self._open = _take(runs, open_)
+            keep_from = np.searchsorted(m, self._open["start"].min()) if open_.any() else len(m)
+            self._tail_minutes, self._tail_glucose = m[keep_from:], g[keep_from:]
+            self.last_minute, self.last_value = int(minutes[-1]), float(glucose[-1])
+
+    def ingest(self, series):
+        """
+        Adds the new readings of a CGMSeries. A different source, or history that no longer
+        agrees with what was seen (regenerated or backfilled data), rebuilds the index.
+        """
+        if series is None or not len(series): return
+        with self._lock:
+            if series.source != self.source: self._reset(series.source)
+            elif self.last_minute is not None:
+                i = int(np.searchsorted(series.minutes, self.last_minute))
+                matches = i < len(series) and series.minutes[i] == self.last_minute and series.glucose[i] == self.last_value
+                if not matches and series.minutes[0] <= self.last_minute: self._reset(series.source)
+        self.add(series.minutes, series.glucose)
+
+    def query(self, start_minute=None, end_minute=None, kinds=None, include_open=True):
+        """
+        Episodes overlapping [start_minute, end_minute) as columns, oldest first. Runs still
+        going at the newest reading are included once they reach the minimum duration;
+        the `open` column marks them.
+        """
+        with self._lock:
+            ongoing = _take(self._open, durations(self._open) >= self.min_duration_min) if include_open else _empty()
+            episodes = _concat([self.closed, ongoing])
+            open_ = np.arange(len(episodes["kind"])) >= len(self.closed["kind"])
+        # A long run can close after shorter ones nested inside it, so restore start order here
+        order = np.lexsort((episodes["kind"], episodes["start"]))
+        episodes, open_ = _take(episodes, order), open_[order]
+        sel = np.ones(len(open_), dtype=bool)
+        if start_minute is not None: sel &= episodes["end"] >= start_minute
+        if end_minute is not None: sel &= episodes["start"] < end_minute
+        if kinds is not None: sel &= np.isin(episodes["kind"], kinds)
+        out = _take(episodes, sel)
+        out["open"] = open_[sel]
+        return out
+
+    def ongoing(self, kind):
+        """(start_minute, duration_min) of the `kind` run covering the newest reading, or None."""
+        with self._lock:
+            hit = np.flatnonzero(self._open["kind"] == kind)
+            if not len(hit): return None
+            start = int(self._open["start"][hit[0]])
+            return start, self.last_minute - start + STEP_MIN
+
+    def sustained(self, kind, min_duration_min):
+        """True while a `kind` run covering the newest reading has lasted at least `min_duration_min`."""
+        run = self.ongoing(kind)
+        return run is not None and run[1] >= min_duration_min
+
+    def counts(self, start_minute=None, end_minute=None):
+        """{kind name: (episode count, total minutes)} over a window, for reports."""
+        episodes = self.query(start_minute, end_minute)
+        minutes = durations(episodes)
+        return {name: (int((episodes["kind"] == k).sum()), int(minutes[episodes["kind"] == k].sum())) for k, name in enumerate(EPISODE_KINDS)}
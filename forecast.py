@@ -0,0 +1,177 @@
+import threading
+import numpy as np
+
+STEP_MIN = 5
+HORIZON_STEPS = 36                      # T+3h in 5-minute steps
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+LAGS = 3
+# Features per step: the last LAGS deltas, distance from a 140 mg/dL anchor (mean reversion) and a bias
+N_FEATURES = LAGS + 2
+RIDGE = 50.0
+# Damped-trend prior the ridge shrinks towards while there is little history
+PRIOR = np.array([0.8, 0.0, 0.0, -0.01, 0.0])
+CALIBRATION_READINGS = 7 * 288          # backtest window for the error quantiles
+RECALIBRATE_EVERY = 12                  # readings (~1h) between calibration refreshes
+MIN_CALIBRATION_ORIGINS = 100
+# Fallback per-step error spread (mg/dL at h=1, growing with sqrt(h)) until calibrated
+FALLBACK_SD = 6.0
+_Z = np.array([-1.645, -0.674, 0.0, 0.674, 1.645])
+
+# -----------------------------------------------------------------------------
+# 1. FEATURES
+# -----------------------------------------------------------------------------
+def _contiguous(minutes):
+    """True where a reading follows the previous one by one CGM step (4-6 min)."""
+    gap = np.diff(np.asarray(minutes, dtype=np.int64), prepend=np.iinfo(np.int64).min // 2)
+    return (gap >= STEP_MIN - 1) & (gap <= STEP_MIN + 1)
+
+def _design(minutes, glucose):
+    """
+    Vectorised training rows (X, y, target): X describes the reading before `target`,
+    y is the delta into it. Rows whose lag window or target crosses a sensor gap are dropped.
+    """
+    g = np.asarray(glucose, dtype=np.float64)
+    if len(g) < LAGS + 2: return np.empty((0, N_FEATURES)), np.empty(0), np.empty(0, dtype=np.int64)
+    ok = _contiguous(minutes)
+    d = np.diff(g)                                      # d[j] = g[j+1] - g[j]
+    rows = np.arange(LAGS, len(g) - 1)                  # predict g[i+1] from g[i] and d[i-1], d[i-2], ...
+    lags = np.stack([d[rows - k] for k in range(1, LAGS + 1)], axis=1)
+    valid = np.ones(len(rows), dtype=bool)
+    for k in range(LAGS + 1): valid &= ok[rows + 1 - k]
+    X = np.column_stack([lags, (g[rows] - 140.0) / 100.0, np.ones(len(rows))])
+    return X[valid], d[rows][valid], rows[valid] + 1
+
+def _step(coef, d1, d2, d3, g):
+    return coef[0] * d1 + coef[1] * d2 + coef[2] * d3 + coef[3] * (g - 140.0) / 100.0 + coef[4]
+
+# -----------------------------------------------------------------------------
+# 2. MODEL
+# -----------------------------------------------------------------------------
+class GlucoseForecaster:
+    """
+    Damped AR model on 5-minute glucose deltas with mean reversion, fitted by ridge least
+    squares. X'X and X'y are accumulated incrementally, so new readings refit in O(new);
+    per-step forecast quantiles come from backtesting the current fit on recent history.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, source):
+        self.source = source
+        self.xtx = np.zeros((N_FEATURES, N_FEATURES))
+        self.xty = np.zeros(N_FEATURES)
+        self.n_rows = 0
+        self.coef = PRIOR.copy()
+        self.error_quantiles = None
+        self.last_minute, self.last_value = None, None
+        self.n_readings = 0
+        self._recent_minutes = np.empty(0, dtype=np.int64)
+        self._recent_glucose = np.empty(0, dtype=np.float64)
+        self._since_calibration = 0
+
+    def _fit(self, minutes, glucose):
+        # Prepend the previous tail so rows whose lags straddle two batches are still learned
+        carried = min(LAGS + 1, len(self._recent_minutes))
+        minutes = np.concatenate([self._recent_minutes[len(self._recent_minutes) - carried:], minutes])
+        glucose = np.concatenate([self._recent_glucose[len(self._recent_glucose) - carried:], glucose])
+        X, y, target = _design(minutes, glucose)
+        new = target >= carried
+        X, y = X[new], y[new]
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.n_rows += len(y)
+        self.coef = np.linalg.solve(self.xtx + RIDGE * np.eye(N_FEATURES), self.xty + RIDGE * PRIOR)
+
+        self._recent_minutes = np.concatenate([self._recent_minutes, minutes[carried:]])[-CALIBRATION_READINGS:]
+        self._recent_glucose = np.concatenate([self._recent_glucose, glucose[carried:]])[-CALIBRATION_READINGS:]
+
+    def _calibrate(self):
+        """Per-step error quantiles of the current fit, backtested from every contiguous origin."""
+        m, g = self._recent_minutes, self._recent_glucose
+        ok = _contiguous(m)
+        # An origin needs LAGS contiguous deltas behind it and HORIZON_STEPS contiguous readings ahead
+        run = np.cumsum(~ok)
+        idx = np.arange(LAGS, len(g) - HORIZON_STEPS)
+        if not len(idx): return
+        origins = idx[run[idx + HORIZON_STEPS] == run[idx - LAGS]]
+        if len(origins) < MIN_CALIBRATION_ORIGINS: return
+
+        level = g[origins].copy()
+        d1, d2, d3 = g[origins] - g[origins - 1], g[origins - 1] - g[origins - 2], g[origins - 2] - g[origins - 3]
+        errors = np.empty((len(origins), HORIZON_STEPS))
+        for h in range(HORIZON_STEPS):
+            d = _step(self.coef, d1, d2, d3, level)
+            level = np.clip(level + d, 40.0, 400.0)
+            d1, d2, d3 = d, d1, d2
+            errors[:, h] = g[origins + h + 1] - level
+        self.error_quantiles = np.percentile(errors, np.asarray(QUANTILES) * 100, axis=0)
+
+    def update(self, minutes, glucose):
+        """Folds readings newer than the last one seen into the fit."""
+        minutes = np.asarray(minutes, dtype=np.int64)
+        glucose = np.asarray(glucose, dtype=np.float64)
+        with self._lock:
+            if self.last_minute is not None:
+                keep = minutes > self.last_minute
+                minutes, glucose = minutes[keep], glucose[keep]
+            if not len(minutes): return
+            self._fit(minutes, glucose)
+            self.last_minute, self.last_value = int(minutes[-1]), float(glucose[-1])
+            self.n_readings += len(minutes)
+            self._since_calibration += len(minutes)
+            if self.error_quantiles is None or self._since_calibration >= RECALIBRATE_EVERY:
+                self._calibrate()
+                self._since_calibration = 0
+
+    def ingest(self, series):
+        """
+        Trains on the new readings of a CGMSeries. A different source, or history that no
+        longer agrees with what was seen (regenerated data, or older readings backfilled
+        since), resets the fit first so it trains on the whole series.
+        """
+        if series is None or not len(series): return
+        with self._lock:
+            if series.source != self.source: self._reset(series.source)
+            elif self.last_minute is not None:
+                i = int(np.searchsorted(series.minutes, self.last_minute))
+                matches = i < len(series) and series.minutes[i] == self.last_minute and series.glucose[i] == self.last_value
+                backfilled = matches and i + 1 > self.n_readings
+                if (not matches or backfilled) and series.minutes[0] <= self.last_minute: self._reset(series.source)
+        self.update(series.minutes, series.glucose)
+
+    def forecast(self, minutes, glucose, widen=1.0, steps=HORIZON_STEPS):
+        """
+        Forecast from the end of a trace. Returns (offset_minutes, bands) where bands has one
+        row per QUANTILES entry and one column per 5-minute step. `widen` scales the spread
+        around the median (e.g. for strain/sleep debt).
+        """
+        g = np.asarray(glucose[-(LAGS + 1):], dtype=np.float64)
+        with self._lock: coef, err_q = self.coef.copy(), self.error_quantiles
+        if len(g) < LAGS + 1 or not _contiguous(minutes[-(LAGS + 1):])[1:].all():
+            # Not enough contiguous context: hold the level
+            path = np.full(steps, g[-1] if len(g) else np.nan)
+        else:
+            path = np.empty(steps)
+            level, d1, d2, d3 = g[-1], g[-1] - g[-2], g[-2] - g[-3], g[-3] - g[-4]
+            for h in range(steps):
+                d = _step(coef, d1, d2, d3, level)
+                level = min(max(level + d, 40.0), 400.0)
+                d1, d2, d3 = d, d1, d2
+                path[h] = level
+
+        if err_q is None:
+            err_q = _Z[:, None] * FALLBACK_SD * np.sqrt(np.arange(1, HORIZON_STEPS + 1))
+        err_q = err_q[:, :steps]
+        spread = err_q - err_q[QUANTILES.index(0.5)]
+        bands = np.clip(path + err_q[QUANTILES.index(0.5)] + widen * spread, 40.0, 400.0)
+        return np.arange(1, steps + 1) * STEP_MIN, bands
+
+def uncertainty_multiplier(strain=0.0, sleep_performance=100, context="Normal"):
+    """Widening factor for the forecast spread from Whoop strain, sleep debt and the active context."""
+    m = 1.0 + 0.5 * min(max(strain, 0.0), 21.0) / 21.0
+    if sleep_performance and sleep_performance < 70: m += 0.3
+    elif sleep_performance and sleep_performance < 85: m += 0.15
+    if context in ("Sick", "Stressed", "Travel"): m += 0.2
+    return m
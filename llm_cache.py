@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import cgm_store
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join(cgm_store.STORE_DIR, "llm_cache.sqlite3")
+DEFAULT_TTL_S = 30 * 60
+MAX_ENTRIES = 500
+BG_STEP = 5                             # mg/dL: below CGM accuracy, so clinically equivalent
+
+# -----------------------------------------------------------------------------
+# 1. INPUT QUANTIZATION
+# -----------------------------------------------------------------------------
+def quantize(value, step):
+    """Rounds `value` to the nearest multiple of `step` (ints stay ints)."""
+    try: q = round(float(value) / step) * step
+    except (TypeError, ValueError): return value
+    return int(q) if float(step).is_integer() else round(q, 6)
+
+def quantize_bg(value):
+    """Glucose rounded to BG_STEP mg/dL for prompts that should hit the cache across near-identical readings."""
+    return quantize(value, BG_STEP)
+
+def make_key(model, max_tokens, system, messages, parse_json=True):
+    """
+    Cache key for one request. Callers render their prompt templates from quantized inputs,
+    so hashing the rendered prompt keys on (template, quantized inputs) together.
+    """
+    payload = json.dumps([model, max_tokens, bool(parse_json), system, messages], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# -----------------------------------------------------------------------------
+# 2. PERSISTENT TTL + LRU STORE
+# -----------------------------------------------------------------------------
+class LLMCache:
+    """
+    SQLite-backed response cache shared by every session and surviving restarts.
+    Entries expire after their TTL; past `max_entries` the least recently used go first.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        return self._conn
+
+    def get(self, key):
+        """The cached value for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value FROM responses WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl_s=DEFAULT_TTL_S):
+        """Stores a JSON-serialisable value, then drops expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, json.dumps(value), now + ttl_s, now))
+            db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+            db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+            self._db().commit()
+
+    def __len__(self):
+        with self._lock: return self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def get_cache(path=CACHE_PATH):
+    """Process-wide LLMCache for `path`."""
+    with _CACHES_LOCK:
+        if path not in _CACHES: _CACHES[path] = LLMCache(path)
+        return _CACHES[path]
+
+# -----------------------------------------------------------------------------
+# 3. TOKEN USAGE INSTRUMENTATION
+# -----------------------------------------------------------------------------
+# Running totals of input billed fresh, read from or written to the provider's prompt cache,
+# and output, across every Claude call in the process.
+USAGE_FIELDS = ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens")
+USAGE = dict.fromkeys(USAGE_FIELDS + ("calls",), 0)
+_USAGE_LOCK = threading.Lock()
+
+def record_usage(label, usage):
+    """Adds one response's `usage` to USAGE and logs its uncached vs. cached input tokens."""
+    counts = {f: int(getattr(usage, f, 0) or 0) for f in USAGE_FIELDS}
+    with _USAGE_LOCK:
+        for f, n in counts.items(): USAGE[f] += n
+        USAGE["calls"] += 1
+    logger.info(f"Claude usage ({label}): {counts['input_tokens']} uncached + {counts['cache_read_input_tokens']} cache-read "
+                f"+ {counts['cache_creation_input_tokens']} cache-write input tokens, {counts['output_tokens']} output")
+    return counts
+
+def cached_input_share():
+    """Fraction of all input tokens served from the prompt cache so far."""
+    with _USAGE_LOCK:
+        total = USAGE["input_tokens"] + USAGE["cache_read_input_tokens"] + USAGE["cache_creation_input_tokens"]
+        return USAGE["cache_read_input_tokens"] / total if total else 0.0
@@ -1,52 +1,118 @@
 import pandas as pd
 import numpy as np
 import requests
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import background
+from cgm_store import CGMSeries, TREND_LABELS, TREND_CODES, TREND_UNKNOWN, GAP_MIN, classify_trends
 
 # -----------------------------------------------------------------------------
 # 1. LIVE DATA INTEGRATION (NIGHTSCOUT)
 # -----------------------------------------------------------------------------
-def fetch_nightscout_data(url, token, count=288):
-    """Fetches real-time CGM data from a user's Nightscout REST API."""
+def normalize_nightscout_url(url):
+    """Canonical Nightscout base URL (scheme added, trailing slash removed)."""
     base_url = url.strip().rstrip('/')
     if not base_url.startswith('http'):
         base_url = 'https://' + base_url
+    return base_url
+
+def fetch_nightscout_entries(url, token, count=288, since=None, until=None, session=None):
+    """Raw Nightscout entries list. `since`/`until` bound `date` (epoch ms, exclusive). Raises on HTTP errors."""
+    base_url = normalize_nightscout_url(url)
         
     endpoint = f"{base_url}/api/v1/entries.json?count={count}"
+    if since is not None:
+        endpoint += f"&find[date][$gt]={int(since)}"
+    if until is not None:
+        endpoint += f"&find[date][$lt]={int(until)}"
     if token:
         endpoint += f"&token={token}"
         
-    try:
-        # Increased timeout to 30s to allow sleeping Nightscout servers time to wake up
-        response = requests.get(endpoint, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if not data: return None
-        df = pd.DataFrame(data)
-        
-        if 'date' in df.columns: df['Timestamp'] = pd.to_datetime(df['date'], unit='ms')
-        elif 'dateString' in df.columns: df['Timestamp'] = pd.to_datetime(df['dateString'])
-        else: return None
-            
-        df['Glucose_Value'] = pd.to_numeric(df.get('sgv'), errors='coerce')
-        df = df.dropna(subset=['Glucose_Value'])
-        
-        trend_map = {
-            "DoubleUp": "Rising Fast", "SingleUp": "Rising", "FortyFiveUp": "Rising Slowly",
-            "Flat": "Steady",
-            "FortyFiveDown": "Falling Slowly", "SingleDown": "Falling", "DoubleDown": "Falling Fast",
-            "NONE": "Unknown", "NOT COMPUTABLE": "Unknown", "RATE OUT OF RANGE": "Unknown"
-        }
-        df['Trend'] = df.get('direction', 'Flat').map(trend_map).fillna('Steady')
-        
-        df = df[['Timestamp', 'Glucose_Value', 'Trend']]
-        df = df.sort_values(by='Timestamp').reset_index(drop=True)
-        return df
-        
-    except Exception as e:
-        print(f"Nightscout Fetch Error: {e}")
-        return None
+    # Increased timeout to 30s to allow sleeping Nightscout servers time to wake up
+    response = (session or requests).get(endpoint, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+# Nightscout `direction` -> int8 trend code. Missing/unmapped directions are Unknown; the
+# store classifies those from the rate of change when they are appended.
+NIGHTSCOUT_DIRECTION_CODES = {
+    "DoubleUp": TREND_CODES["Rising Fast"], "SingleUp": TREND_CODES["Rising"], "FortyFiveUp": TREND_CODES["Rising Slowly"],
+    "Flat": TREND_CODES["Steady"],
+    "FortyFiveDown": TREND_CODES["Falling Slowly"], "SingleDown": TREND_CODES["Falling"], "DoubleDown": TREND_CODES["Falling Fast"],
+    "NONE": TREND_CODES["Unknown"], "NOT COMPUTABLE": TREND_CODES["Unknown"], "RATE OUT OF RANGE": TREND_CODES["Unknown"]
+}
+
+def _as_float(value):
+    try: return float(value)
+    except (TypeError, ValueError): return np.nan
+
+def parse_nightscout_entries(data):
+    """
+    Pulls only `date`, `sgv` and `direction` out of raw Nightscout entries into
+    preallocated NumPy arrays, skipping the generic DataFrame-from-dicts path.
+    Returns (date_ms int64, sgv uint16, trend int8) sorted by date; entries without
+    a usable timestamp or glucose value (calibrations, meter readings) are dropped.
+    """
+    data = data or []
+    n = len(data)
+    dates = np.fromiter((e.get('date', -1) or -1 for e in data), dtype=np.int64, count=n)
+    sgv = np.fromiter((_as_float(e.get('sgv')) for e in data), dtype=np.float64, count=n)
+    trend = np.fromiter((NIGHTSCOUT_DIRECTION_CODES.get(e.get('direction'), TREND_UNKNOWN) for e in data), dtype=np.int8, count=n)
+
+    missing = np.flatnonzero(dates < 0)
+    if len(missing):
+        # Older uploaders only send an ISO `dateString`; parse just those rows
+        ds = pd.to_datetime([data[i].get('dateString') for i in missing], errors='coerce', utc=True)
+        dates[missing] = np.where(ds.isna(), -1, ds.as_unit('ms').asi8)
+
+    valid = (dates >= 0) & ~np.isnan(sgv)
+    dates, sgv, trend = dates[valid], sgv[valid], trend[valid]
+    order = np.argsort(dates, kind='stable')
+    return dates[order], np.rint(sgv[order]).astype(np.uint16), trend[order]
+
+CGM_GRID_MS = 5 * 60 * 1000
+
+def normalize_cgm_readings(dates, sgv, trend, anchor_ms=None, grid_ms=CGM_GRID_MS):
+    """
+    Cleans parsed readings before they are stored:
+      - snaps jittered timestamps onto the sensor's 5-minute grid. The grid phase comes from
+        `anchor_ms` (normally the store's last reading) or the first reading after each gap,
+        because sensors do not report on clock-aligned minutes;
+      - dedupes uploads that land in the same slot (multiple uploaders), keeping the one
+        closest to the grid point.
+    Gaps are left as gaps: nothing is interpolated (see CGMSeries.gaps()).
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    if not len(dates): return dates, np.asarray(sgv), np.asarray(trend)
+    order = np.argsort(dates, kind='stable')
+    dates, sgv, trend = dates[order], np.asarray(sgv)[order], np.asarray(trend)[order]
+
+    # A new grid segment starts after any break longer than 1.5 slots, anchored on its first reading
+    starts = np.ones(len(dates), dtype=bool)
+    starts[1:] = np.diff(dates) > 1.5 * grid_ms
+    anchors = dates.copy()
+    if anchor_ms is not None and dates[0] - anchor_ms <= 1.5 * grid_ms: anchors[0] = anchor_ms
+    seg_anchor = anchors[np.maximum.accumulate(np.where(starts, np.arange(len(dates)), 0))]
+    slots = seg_anchor + np.rint((dates - seg_anchor) / grid_ms).astype(np.int64) * grid_ms
+
+    # One reading per slot: the one nearest its grid point
+    rank = np.lexsort((np.abs(dates - slots), slots))
+    keep = np.ones(len(rank), dtype=bool)
+    keep[1:] = slots[rank][1:] != slots[rank][:-1]
+    pick = rank[keep]
+    return slots[pick], sgv[pick], trend[pick]
+
+def nightscout_entries_to_frame(data):
+    """Converts raw Nightscout entries into the standard Timestamp/Glucose_Value/Trend frame."""
+    dates, sgv, trend = normalize_cgm_readings(*parse_nightscout_entries(data))
+    if not len(dates): return None
+    return pd.DataFrame({
+        'Timestamp': pd.to_datetime(dates, unit='ms'),
+        'Glucose_Value': sgv.astype(np.int64),
+        'Trend': pd.Categorical.from_codes(trend, categories=TREND_LABELS),
+    })
 
 # -----------------------------------------------------------------------------
 # 2. BIOMETRIC SIMULATOR (FALLBACK)
@@ -74,10 +140,10 @@ def apply_context_modifiers(df, context):
         df['Glucose_Value'] += spikes + noise
     else: df['Glucose_Value'] += noise
 
-    diffs = df['Glucose_Value'].diff().fillna(0)
-    df['Trend'] = np.where(diffs > 3, "Rising", np.where(diffs < -3, "Falling", "Steady"))
     # CLINICAL TWEAK: Lowered artificial ceiling from 220 to 195
     df['Glucose_Value'] = np.clip(df['Glucose_Value'], 65, 195)
+    minutes = df['Timestamp'].values.astype('datetime64[m]').astype(np.int64) if 'Timestamp' in df.columns else np.arange(len(df)) * 5
+    df['Trend'] = pd.Categorical.from_codes(classify_trends(minutes, df['Glucose_Value'].to_numpy(dtype=float)), categories=TREND_LABELS)
     return df
 
 # -----------------------------------------------------------------------------
@@ -125,35 +191,114 @@ def generate_travel_advisory(offset_hours=6):
     shift = offset_hours / 3
     return f"✈️ TRAVEL PROTOCOL: Today: Shift +{int(shift)}h. Tomorrow: +{int(shift)}h. Day 3: Final +{int(shift)}h."
 
+def _environmental_load_from_payload(data):
+    temp_c, weather_id = data.get("main", {}).get("temp", 20), data.get("weather", [{}])[0].get("id", 800)
+    
+    multiplier, status_tags = 1.0, []
+    if temp_c > 32: multiplier -= 0.15; status_tags.append("🔥 HEAT WARNING (Rapid Absorption Risk)")
+    elif temp_c < 0: multiplier += 0.15; status_tags.append("❄️ EXTREME COLD (High Resistance Risk)")
+    if 200 <= weather_id <= 299: multiplier += 0.10; status_tags.append("⛈️ SEVERE WEATHER")
+        
+    return multiplier, " | ".join(status_tags) if status_tags else "☁️ BENIGN ENVIRONMENT"
+
+def _request_weather(lat, lon, api_key):
+    return requests.get(f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric", timeout=10).json()
+
 def fetch_environmental_load(lat=38.9847, lon=-77.0947, api_key=""):
+    """Blocking weather lookup. The risk engine reads the TTL cache via get_environmental_load instead."""
     if not api_key: return 1.0, "☁️ WEATHER OFFLINE"
-    try:
-        data = requests.get(f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric", timeout=10).json()
-        temp_c, weather_id = data.get("main", {}).get("temp", 20), data.get("weather", [{}])[0].get("id", 800)
-        
-        multiplier, status_tags = 1.0, []
-        if temp_c > 32: multiplier -= 0.15; status_tags.append("🔥 HEAT WARNING (Rapid Absorption Risk)")
-        elif temp_c < 0: multiplier += 0.15; status_tags.append("❄️ EXTREME COLD (High Resistance Risk)")
-        if 200 <= weather_id <= 299: multiplier += 0.10; status_tags.append("⛈️ SEVERE WEATHER")
-            
-        return multiplier, " | ".join(status_tags) if status_tags else "☁️ BENIGN ENVIRONMENT"
+    try: return _environmental_load_from_payload(_request_weather(lat, lon, api_key))
     except Exception: return 1.0, "☁️ WEATHER SYNC UNAVAILABLE"
 
+# --- Weather TTL cache (stale-while-revalidate) ---
+# Weather moves on ~10 minute scales, so readings are cached per ~1 km cell and
+# refreshed out of band. Readers always get the last known value in O(1).
+WEATHER_TTL_S = 600
+WEATHER_RETRY_S = 60
+_WEATHER_CACHE = {}  # (lat, lon) rounded -> (fetched_at, (multiplier, status))
+_WEATHER_LOCK = threading.Lock()
+
+def _weather_key(lat, lon):
+    return (round(lat, 2), round(lon, 2))
+
+def _refresh_weather(key, lat, lon, api_key):
+    try:
+        result = (time.time(), _environmental_load_from_payload(_request_weather(lat, lon, api_key)))
+    except Exception as e:
+        print(f"Weather Refresh Error: {e}")
+        with _WEATHER_LOCK:
+            prev = _WEATHER_CACHE.get(key)
+            # Keep serving the stale value; retry after WEATHER_RETRY_S rather than on every read
+            stale = prev[1] if prev else (1.0, "☁️ WEATHER SYNC UNAVAILABLE")
+            _WEATHER_CACHE[key] = (time.time() - WEATHER_TTL_S + WEATHER_RETRY_S, stale)
+        return
+    with _WEATHER_LOCK: _WEATHER_CACHE[key] = result
+
+def prefetch_environmental_load(lat=38.9847, lon=-77.0947, api_key=""):
+    """Starts a background refresh if the cached reading is missing or older than WEATHER_TTL_S."""
+    if not api_key: return None
+    key = _weather_key(lat, lon)
+    with _WEATHER_LOCK: entry = _WEATHER_CACHE.get(key)
+    if entry is None or time.time() - entry[0] > WEATHER_TTL_S:
+        return background.submit_once(("weather", key), _refresh_weather, key, lat, lon, api_key)
+    return None
+
+def has_cached_weather(lat=38.9847, lon=-77.0947):
+    """True once any reading (fresh or stale) is cached for this cell."""
+    with _WEATHER_LOCK: return _weather_key(lat, lon) in _WEATHER_CACHE
+
+def get_environmental_load(lat=38.9847, lon=-77.0947, api_key=""):
+    """Non-blocking (multiplier, status): the cached reading, revalidated in the background when stale."""
+    if not api_key: return 1.0, "☁️ WEATHER OFFLINE"
+    prefetch_environmental_load(lat, lon, api_key)
+    with _WEATHER_LOCK: entry = _WEATHER_CACHE.get(_weather_key(lat, lon))
+    return entry[1] if entry else (1.0, "☁️ WEATHER SYNCING")
+
 # -----------------------------------------------------------------------------
 # 4. THE UNIFIED ERM ENGINE
 # -----------------------------------------------------------------------------
-def calc_glycemic_risk(df, context, whoop_data=None, meeting_count=0, speaker_mode=False, owm_api_key="", is_real_data=False):
-    if not is_real_data: df = apply_context_modifiers(df, context)
+# Memoised results keyed on (data fingerprint, context, modifiers). Callers that pass a
+# cheap `fingerprint` (see CGMSeries.fingerprint) skip re-scoring unchanged data entirely.
+RISK_MEMO_SIZE = 64
+_RISK_MEMO = OrderedDict()
+_RISK_MEMO_LOCK = threading.Lock()
+
+def calc_glycemic_risk(df, context, whoop_data=None, meeting_count=0, speaker_mode=False, owm_api_key="", is_real_data=False, fingerprint=None):
+    """Accepts either a CGMSeries or a Timestamp/Glucose_Value/Trend DataFrame and returns the same type."""
+    whoop_mod = get_whoop_risk_modifier(whoop_data)
+    sched_mod = calculate_schedule_load(meeting_count)
+    env_mod = get_environmental_load(api_key=owm_api_key)
+
+    memo_key = None if fingerprint is None else (fingerprint, context, speaker_mode, is_real_data, whoop_mod, sched_mod, env_mod)
+    if memo_key is not None:
+        with _RISK_MEMO_LOCK:
+            if memo_key in _RISK_MEMO:
+                _RISK_MEMO.move_to_end(memo_key)
+                return _RISK_MEMO[memo_key]
+
+    result = _evaluate_risk(df, context, whoop_mod, sched_mod, env_mod, speaker_mode, is_real_data)
+    if memo_key is not None:
+        with _RISK_MEMO_LOCK:
+            _RISK_MEMO[memo_key] = result
+            while len(_RISK_MEMO) > RISK_MEMO_SIZE: _RISK_MEMO.popitem(last=False)
+    return result
+
+def _evaluate_risk(df, context, whoop_mod, sched_mod, env_mod, speaker_mode, is_real_data):
+    as_series = isinstance(df, CGMSeries)
+    if not is_real_data:
+        if as_series:
+            sim = df.to_pandas()
+            sim['Glucose_Value'] = sim['Glucose_Value'].astype(float)
+            df = CGMSeries.from_pandas(apply_context_modifiers(sim, context), source=df.source)
+        else: df = apply_context_modifiers(df, context)
         
-    latest_glucose = df['Glucose_Value'].iloc[-1]
-    latest_trend = df['Trend'].iloc[-1]
+    latest = df.latest() if as_series else df.iloc[-1]
+    latest_glucose = latest['Glucose_Value']
     
-    whoop_multiplier, whoop_status = get_whoop_risk_modifier(whoop_data)
-    sched_multiplier, sched_status = calculate_schedule_load(meeting_count)
-    env_multiplier, env_status = fetch_environmental_load(api_key=owm_api_key)
+    (whoop_multiplier, whoop_status), (sched_multiplier, sched_status), (env_multiplier, env_status) = whoop_mod, sched_mod, env_mod
     
     final_reason = f"{whoop_status} | {sched_status} | {env_status}"
-    low_threshold, high_threshold = (85 if env_multiplier < 1.0 else 70), (150 if speaker_mode else 180)
+    low_threshold, high_threshold = risk_thresholds(env_multiplier, speaker_mode)
 
     if latest_glucose > high_threshold: return df, "🔴 HIGH ALERT", "#ED8796", f"Hyperglycemic risk detected. ({final_reason})"
     elif latest_glucose < low_threshold: return df, "🔴 LOW ALERT", "#ED8796", f"Hypoglycemic risk detected. ({final_reason})"
@@ -162,4 +307,52 @@ def calc_glycemic_risk(df, context, whoop_data=None, meeting_count=0, speaker_mo
         return df, "🔴 CAUTION", "#EED49F", f"Compounded Strain Detected! {final_reason}"
 
     if context == "Travel": return df, "✈️ TRAVELING", "#8B5CF6", f"{generate_travel_advisory()} ({final_reason})"
-    return df, "🟢 STABLE", "#A6DA95", f"{final_reason} | System nominal."
\ No newline at end of file
+    return df, "🟢 STABLE", "#A6DA95", f"{final_reason} | System nominal."
+
+# -----------------------------------------------------------------------------
+# 5. BATCH RISK TIMELINE
+# -----------------------------------------------------------------------------
+# Per-reading int8 risk codes, mirroring the statuses _evaluate_risk() returns for the newest one
+RISK_STABLE, RISK_TRAVEL, RISK_CAUTION, RISK_LOW, RISK_HIGH = 0, 1, 2, 3, 4
+RISK_LABELS = ("🟢 STABLE", "✈️ TRAVELING", "🔴 CAUTION", "🔴 LOW ALERT", "🔴 HIGH ALERT")
+RISK_COLORS = ("#A6DA95", "#8B5CF6", "#EED49F", "#ED8796", "#ED8796")
+
+def risk_thresholds(env_multiplier, speaker_mode=False):
+    """(low, high) alert thresholds in mg/dL; env_multiplier may be a scalar or an array."""
+    return np.where(np.asarray(env_multiplier) < 1.0, 85, 70), (150 if speaker_mode else 180)
+
+def risk_timeline(glucose, context="Normal", whoop_multiplier=1.0, env_multiplier=1.0, speaker_mode=False):
+    """
+    Scores every reading against the same thresholds and modifiers as calc_glycemic_risk()
+    in one vectorised pass. Multipliers may be scalars or per-reading arrays (for backtesting
+    threshold or modifier changes). Returns an int8 RISK_* code per reading.
+    """
+    g = np.asarray(glucose, dtype=np.float64)
+    whoop_m, env_m = np.broadcast_to(whoop_multiplier, g.shape), np.broadcast_to(env_multiplier, g.shape)
+    low, high = risk_thresholds(env_m, speaker_mode)
+    codes = np.full(g.shape, RISK_TRAVEL if context == "Travel" else RISK_STABLE, dtype=np.int8)
+    # Later assignments win, matching the precedence of the single-point checks
+    codes[(env_m > 1.0) & (whoop_m + env_m - 1.0 >= 1.5)] = RISK_CAUTION
+    codes[g < low] = RISK_LOW
+    codes[g > high] = RISK_HIGH
+    return codes
+
+def calc_risk_timeline(series, context, whoop_data=None, speaker_mode=False, owm_api_key=""):
+    """risk_timeline() for a CGMSeries with today's Whoop and weather modifiers applied to every reading."""
+    whoop_multiplier = get_whoop_risk_modifier(whoop_data)[0]
+    env_multiplier = get_environmental_load(api_key=owm_api_key)[0]
+    return risk_timeline(series.glucose, context, whoop_multiplier, env_multiplier, speaker_mode)
+
+def risk_spans(minutes, codes, min_code=RISK_LOW, max_gap_min=GAP_MIN):
+    """
+    (start_minute, end_minute, code) for each run of equal codes >= `min_code`, split at
+    sensor gaps. Used to shade alert episodes on charts.
+    """
+    m, c = np.asarray(minutes, dtype=np.int64), np.asarray(codes)
+    if not len(c): return []
+    starts = np.ones(len(c), dtype=bool)
+    starts[1:] = (c[1:] != c[:-1]) | (np.diff(m) > max_gap_min)
+    starts = np.flatnonzero(starts)
+    ends = np.append(starts[1:], len(c)) - 1
+    keep = c[starts] >= min_code
+    return list(zip(m[starts[keep]].tolist(), m[ends[keep]].tolist(), c[starts[keep]].tolist()))
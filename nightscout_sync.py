@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import requests
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import background
+import logic
+import cgm_store
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# -----------------------------------------------------------------------------
+# 1. INCREMENTAL SYNC (HIGH-WATER MARK)
+# -----------------------------------------------------------------------------
+MAX_SYNC_PAGES = 14                     # ~two weeks of 288-reading pages; longer outages are left to backfill
+
+def _pull_new_entries(url, token, count, store):
+    """
+    Appends every entry newer than the store's last reading. Nightscout answers with the newest
+    `count` matches, so after a long outage a full page is followed by the page just before it
+    (bounded by its oldest entry) until a short page shows the gap since `last` is covered.
+    """
+    last = store.last_date()
+    pages, until = [], None
+    for _ in range(MAX_SYNC_PAGES):
+        data = logic.fetch_nightscout_entries(url, token, count=count, since=last, until=until)
+        page = logic.parse_nightscout_entries(data)
+        pages.append(page)
+        # A first sync takes only the newest page; older history is the backfill's job
+        if last is None or len(data) < count or not len(page[0]) or (until is not None and page[0][0] >= until): break
+        until = int(page[0][0])
+    dates, sgv, trend = (np.concatenate(cols) for cols in zip(*pages))
+    store.append(*logic.normalize_cgm_readings(dates, sgv, trend, anchor_ms=last))
+
+def sync_nightscout_data(url, token, count=288, store=None):
+    """
+    Brings the local store up to date and returns the latest `count` readings as a CGMSeries.
+    Only entries newer than the store's last `date` are requested, so a warm
+    refresh downloads one or two rows instead of the full 24h window.
+    While the source's circuit breaker is open the network is skipped entirely and
+    the stored (stale) readings are served; see is_degraded().
+    Returns None when neither the upstream nor the local store has data.
+    """
+    base_url = logic.normalize_nightscout_url(url)
+    if store is None: store = cgm_store.get_store(base_url)
+    breaker = get_breaker(base_url)
+
+    if breaker.allow():
+        try:
+            _pull_new_entries(url, token, count, store)
+            breaker.record_success()
+        except Exception as e:
+            print(f"Nightscout Sync Error: {e}")
+            breaker.record_failure()
+    else:
+        breaker.maybe_probe(("ns-probe", base_url), _pull_new_entries, url, token, count, store)
+
+    if len(store) == 0: return None
+    return store.series(tail=count)
+
+def load_local_series(url, count=288):
+    """The last `count` stored readings for `url` (all of them if None) without touching the network (None if empty)."""
+    store = cgm_store.get_store(logic.normalize_nightscout_url(url))
+    return store.series(tail=count) if len(store) else None
+
+def load_local_rollups(url):
+    """Hourly/daily rollups of the stored history for `url` (None if empty)."""
+    store = cgm_store.get_store(logic.normalize_nightscout_url(url))
+    return store.rollups() if len(store) else None
+
+def load_local_episodes(url):
+    """Hypo/hyper episode index of the stored history for `url` (None if empty)."""
+    store = cgm_store.get_store(logic.normalize_nightscout_url(url))
+    return store.episodes() if len(store) else None
+
+# -----------------------------------------------------------------------------
+# 2. PER-SOURCE CIRCUIT BREAKER
+# -----------------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    Trips open after `threshold` consecutive failures. While open, callers are
+    short-circuited (no network) and a single background probe retries with
+    exponential backoff; the first successful probe closes the breaker.
+    """
+
+    def __init__(self, threshold=3, base_backoff_s=15, max_backoff_s=600):
+        self.threshold = threshold
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.failures = 0
+        self.is_open = False
+        self.backoff_s = base_backoff_s
+        self.next_probe = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock: return not self.is_open
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.is_open, self.backoff_s = 0, False, self.base_backoff_s
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.is_open:
+                self.backoff_s = min(self.backoff_s * 2, self.max_backoff_s)
+            elif self.failures >= self.threshold:
+                self.is_open, self.backoff_s = True, self.base_backoff_s
+            self.next_probe = time.time() + self.backoff_s
+
+    def _probe(self, fn, *args):
+        try: fn(*args)
+        except Exception as e:
+            print(f"Circuit Probe Failed: {e}")
+            self.record_failure()
+            return False
+        self.record_success()
+        return True
+
+    def maybe_probe(self, key, fn, *args):
+        """Schedules a background probe if the backoff has elapsed. Returns its future, or None."""
+        with self._lock:
+            if not self.is_open or time.time() < self.next_probe: return None
+        return background.submit_once(key, self._probe, fn, *args)
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def get_breaker(base_url):
+    with _BREAKERS_LOCK:
+        if base_url not in _BREAKERS: _BREAKERS[base_url] = CircuitBreaker()
+        return _BREAKERS[base_url]
+
+def is_degraded(url):
+    """True while the source's breaker is open, i.e. readings being served are stale."""
+    return not get_breaker(logic.normalize_nightscout_url(url)).allow()
+
+# -----------------------------------------------------------------------------
+# 3. MULTI-DAY BACKFILL (PAGED, PARALLEL, RESUMABLE)
+# -----------------------------------------------------------------------------
+def _checkpoint_path(store):
+    return os.path.join(store.path, "backfill.json")
+
+def load_checkpoint(store):
+    """Set of page-start timestamps (epoch ms) that have already been downloaded."""
+    try:
+        with open(_checkpoint_path(store), "r") as f: return set(json.load(f).get("done", []))
+    except (FileNotFoundError, json.JSONDecodeError): return set()
+
+def save_checkpoint(store, done):
+    os.makedirs(store.path, exist_ok=True)
+    tmp = _checkpoint_path(store) + ".tmp"
+    with open(tmp, "w") as f: json.dump({"done": sorted(done)}, f)
+    os.replace(tmp, _checkpoint_path(store))
+
+def plan_pages(days, page_hours=24, now_ms=None):
+    """Splits the last `days` into [start, end) pages aligned to `page_hours`, so
+    page boundaries (and therefore checkpoints) are stable across resumed runs."""
+    end = int(now_ms if now_ms is not None else time.time() * 1000)
+    page_ms = page_hours * 60 * 60 * 1000
+    first = (end - days * DAY_MS) // page_ms * page_ms
+    return [(p, p + page_ms) for p in range(first, end, page_ms)]
+
+def _fetch_page(url, token, start, end, session):
+    # 5-min cadence, with headroom for duplicate uploads from multiple uploaders
+    count = max(1, (end - start) // (5 * 60 * 1000)) * 3
+    data = logic.fetch_nightscout_entries(url, token, count=count, since=start - 1, until=end, session=session)
+    return logic.normalize_cgm_readings(*logic.parse_nightscout_entries(data))
+
+def backfill_nightscout_history(url, token, days=14, page_hours=24, max_workers=4, store=None, now_ms=None):
+    """
+    Downloads `days` of history as date-bounded pages over a bounded thread pool
+    sharing one keep-alive Session, merging each page into the local store as it lands.
+    Completed pages are checkpointed, so a run interrupted by a sleeping or timing-out
+    Nightscout server resumes where it stopped. The page still being filled (the one
+    containing "now") is never checkpointed.
+    Returns a summary dict: pages planned, fetched, failed and rows added.
+    """
+    if store is None: store = cgm_store.get_store(logic.normalize_nightscout_url(url))
+    now_ms = int(now_ms if now_ms is not None else time.time() * 1000)
+    pages = plan_pages(days, page_hours, now_ms)
+    done = load_checkpoint(store)
+    todo = [p for p in pages if p[0] not in done]
+    summary = {"pages": len(pages), "fetched": 0, "failed": 0, "rows": 0}
+    if not todo: return summary
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch_page, url, token, start, end, session): (start, end) for start, end in todo}
+        for fut in as_completed(futures):
+            start, end = futures[fut]
+            try:
+                dates, sgv, trend = fut.result()
+            except Exception as e:
+                print(f"Nightscout Backfill Error ({start}): {e}")
+                summary["failed"] += 1
+                continue
+            if len(dates):
+                # Pages snap onto their own grid phase, so a reading the sync already stored can
+                # come back a few seconds off; anything within half a slot is that same reading
+                summary["rows"] += store.merge(dates, sgv, trend, tolerance_ms=logic.CGM_GRID_MS // 2)
+            summary["fetched"] += 1
+            if end <= now_ms:
+                done.add(start)
+                save_checkpoint(store, done)
+    return summary
+
+# -----------------------------------------------------------------------------
+# 4. BACKGROUND POLLER (CGM-CADENCE ALIGNED)
+# -----------------------------------------------------------------------------
+CGM_CADENCE_S = 300
+UPLOAD_GRACE_S = 20
+LATE_RETRY_S = 30
+
+def next_poll_delay(last_ms, now_s, cadence_s=CGM_CADENCE_S, grace_s=UPLOAD_GRACE_S, retry_s=LATE_RETRY_S):
+    """
+    Seconds until the next poll: just after the next reading is expected to upload.
+    A late upload is retried every `retry_s` for one cadence; past that (sensor
+    warm-up, signal loss) polling falls back to the plain cadence.
+    """
+    if last_ms is None: return cadence_s
+    due = last_ms / 1000 + cadence_s + grace_s
+    if due > now_s: return due - now_s
+    return retry_s if now_s - due < cadence_s else cadence_s
+
+class NightscoutPoller(threading.Thread):
+    """Daemon that keeps one source's store current so renders never touch the network."""
+
+    def __init__(self, url, token, count=288):
+        super().__init__(daemon=True, name="ns-poller")
+        self.url, self.token, self.count = url, token, count
+        self.store = cgm_store.get_store(logic.normalize_nightscout_url(url))
+        self.first_sync = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try: sync_nightscout_data(self.url, self.token, self.count, store=self.store)
+            except Exception as e: print(f"Nightscout Poller Error: {e}")
+            self.first_sync.set()
+            self._stop_event.wait(next_poll_delay(self.store.last_date(), time.time()))
+
+    def stop(self):
+        self._stop_event.set()
+
+_POLLERS = {}
+_POLLERS_LOCK = threading.Lock()
+
+def start_poller(url, token, count=288):
+    """Idempotent: returns the running poller for this source (restarted if the token changed)."""
+    base_url = logic.normalize_nightscout_url(url)
+    with _POLLERS_LOCK:
+        poller = _POLLERS.get(base_url)
+        if poller is not None and poller.is_alive() and poller.token == token: return poller
+        if poller is not None: poller.stop()
+        poller = NightscoutPoller(url, token, count)
+        _POLLERS[base_url] = poller
+        poller.start()
+        return poller
+
+def stop_poller(url):
+    with _POLLERS_LOCK:
+        poller = _POLLERS.pop(logic.normalize_nightscout_url(url), None)
+    if poller is not None: poller.stop()
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# 1. LOG-BUCKET LAYOUT
+# -----------------------------------------------------------------------------
+# DDSketch-style buckets: bucket i holds values in (gamma^(i-1), gamma^i] * MIN_VALUE, so
+# every value is within RELATIVE_ACCURACY of its bucket's representative. Readings
+# outside [MIN_VALUE, MAX_VALUE] are clamped into the end buckets.
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE, MAX_VALUE = 20.0, 1000.0
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+N_BUCKETS = int(math.ceil(math.log(MAX_VALUE / MIN_VALUE, GAMMA))) + 1
+BUCKET_VALUES = MIN_VALUE * 2 * GAMMA ** np.arange(N_BUCKETS) / (GAMMA + 1)
+BUCKET_VALUES[0] = MIN_VALUE
+
+def bucket_index(values):
+    """Sketch bucket of each value."""
+    v = np.clip(np.asarray(values, dtype=np.float64), MIN_VALUE, MAX_VALUE)
+    return np.ceil(np.log(v / MIN_VALUE) / math.log(GAMMA) - 1e-9).astype(np.int64)
+
+def quantiles_from_counts(counts, quantiles):
+    """
+    Quantiles (0-1) of each row of a (rows, N_BUCKETS) count matrix, interpolating between
+    neighbouring ranks like np.percentile. Returns (len(quantiles), rows); NaN for empty rows.
+    """
+    counts = np.atleast_2d(counts)
+    cum = np.cumsum(counts, axis=1)
+    n = cum[:, -1]
+    last = np.maximum(n - 1, 0)
+    pos = np.asarray(quantiles, dtype=np.float64)[:, None] * last
+    lo = np.floor(pos)
+    # The r-th smallest value sits in the first bucket whose cumulative count exceeds r
+    v_lo = BUCKET_VALUES[(cum[None, :, :] > lo[..., None]).argmax(axis=2)]
+    v_hi = BUCKET_VALUES[(cum[None, :, :] > np.minimum(lo + 1, last)[..., None]).argmax(axis=2)]
+    out = v_lo + (v_hi - v_lo) * (pos - lo)
+    out[:, n == 0] = np.nan
+    return out
+
+# -----------------------------------------------------------------------------
+# 2. MERGEABLE SKETCH
+# -----------------------------------------------------------------------------
+class QuantileSketch:
+    """
+    Fixed-size mergeable quantile sketch for glucose readings. Memory is N_BUCKETS
+    counters regardless of how many readings it summarises, merging is element-wise
+    addition, and every quantile is within RELATIVE_ACCURACY of an exact answer.
+    """
+    __slots__ = ("counts",)
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros(N_BUCKETS, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def of(cls, values):
+        sketch = cls()
+        sketch.add(values)
+        return sketch
+
+    def add(self, values):
+        self.counts += np.bincount(bucket_index(values), minlength=N_BUCKETS)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    __iadd__ = merge
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def quantiles(self, quantiles):
+        """Estimated quantiles (0-1) as a float array."""
+        return quantiles_from_counts(self.counts, quantiles)[:, 0]
@@ -0,0 +1,126 @@
+import math
+import threading
+from collections import deque
+import numpy as np
+
+# Sliding windows in minutes, measured back from the newest reading.
+WINDOWS_MIN = {"3h": 180, "6h": 360, "8h": 480, "12h": 720, "24h": 1440, "14d": 20160}
+
+# Range buckets the dashboard reports on: (name, predicate on mg/dL)
+RANGE_BUCKETS = (
+    ("very_low", lambda v: v < 54),
+    ("low", lambda v: v < 70),
+    ("below_80", lambda v: v < 80),
+    ("in_range", lambda v: 70 <= v <= 180),
+    ("target", lambda v: 80 <= v <= 140),
+    ("elevated", lambda v: 140 < v <= 180),
+    ("high", lambda v: v > 180),
+    ("very_high", lambda v: v > 250),
+)
+
+# -----------------------------------------------------------------------------
+# 1. SINGLE SLIDING WINDOW
+# -----------------------------------------------------------------------------
+class _Window:
+    """Running sum/sum-of-squares/bucket counts plus monotonic deques for min/max."""
+    __slots__ = ("span", "buf", "n", "total", "total_sq", "counts", "min_dq", "max_dq")
+
+    def __init__(self, span):
+        self.span = span
+        self.buf = deque()
+        self.n, self.total, self.total_sq = 0, 0.0, 0.0
+        self.counts = [0] * len(RANGE_BUCKETS)
+        self.min_dq, self.max_dq = deque(), deque()
+
+    def push(self, minute, value, flags):
+        self.buf.append((minute, value, flags))
+        self.n += 1
+        self.total += value
+        self.total_sq += value * value
+        for i in flags: self.counts[i] += 1
+        while self.min_dq and self.min_dq[-1][1] >= value: self.min_dq.pop()
+        self.min_dq.append((minute, value))
+        while self.max_dq and self.max_dq[-1][1] <= value: self.max_dq.pop()
+        self.max_dq.append((minute, value))
+
+        cutoff = minute - self.span
+        while self.buf and self.buf[0][0] <= cutoff:
+            old_minute, old_value, old_flags = self.buf.popleft()
+            self.n -= 1
+            self.total -= old_value
+            self.total_sq -= old_value * old_value
+            for i in old_flags: self.counts[i] -= 1
+            if self.min_dq[0][0] == old_minute: self.min_dq.popleft()
+            if self.max_dq[0][0] == old_minute: self.max_dq.popleft()
+
+    def stats(self):
+        if not self.n: return None
+        mean = self.total / self.n
+        var = (self.total_sq - self.total * mean) / (self.n - 1) if self.n > 1 else 0.0
+        return {
+            "n": self.n,
+            "mean": mean,
+            "min": self.min_dq[0][1],
+            "max": self.max_dq[0][1],
+            "std": math.sqrt(max(var, 0.0)),
+            "pct": {name: 100.0 * c / self.n for (name, _), c in zip(RANGE_BUCKETS, self.counts)},
+        }
+
+# -----------------------------------------------------------------------------
+# 2. MULTI-WINDOW ENGINE
+# -----------------------------------------------------------------------------
+class RollingMetrics:
+    """
+    Incremental glycemic statistics over every window in WINDOWS_MIN. Each new
+    reading is an amortised O(1) update, and every dashboard statistic (mean,
+    min/max, std, per-range percentages) is answered without rescanning history.
+    """
+
+    def __init__(self, windows=WINDOWS_MIN):
+        self._windows = {name: _Window(span) for name, span in windows.items()}
+        self._lock = threading.Lock()
+        self.source = None
+        self.last_minute = None
+        self.last_value = None
+        self.pushed = 0
+
+    def _reset(self, source):
+        self._windows = {name: _Window(w.span) for name, w in self._windows.items()}
+        self.source, self.last_minute, self.last_value, self.pushed = source, None, None, 0
+
+    def push(self, minute, value):
+        """Adds one reading; readings at or before the newest one seen are ignored."""
+        minute, value = int(minute), int(value)
+        with self._lock:
+            if self.last_minute is not None and minute <= self.last_minute: return
+            flags = tuple(i for i, (_, pred) in enumerate(RANGE_BUCKETS) if pred(value))
+            for w in self._windows.values(): w.push(minute, value, flags)
+            self.last_minute, self.last_value = minute, value
+            self.pushed += 1
+
+    def ingest(self, series):
+        """
+        Pushes the readings of a CGMSeries that are newer than the last one seen (O(new)).
+        If the series no longer agrees with what was ingested (new source, regenerated data,
+        or older readings backfilled since) the engine is rebuilt from it once.
+        """
+        if series is None or not len(series): return
+        with self._lock:
+            start = 0
+            if series.source != self.source or self.last_minute is None:
+                self._reset(series.source)
+            else:
+                i = int(np.searchsorted(series.minutes, self.last_minute))
+                matches = i < len(series) and series.minutes[i] == self.last_minute and series.glucose[i] == self.last_value
+                if matches and i + 1 <= self.pushed: start = i + 1
+                elif series.minutes[0] <= self.last_minute: self._reset(series.source)
+        for minute, value in zip(series.minutes[start:].tolist(), series.glucose[start:].tolist()):
+            self.push(minute, value)
+
+    @property
+    def empty(self):
+        return self.last_minute is None
+
+    def stats(self, window):
+        """{'n', 'mean', 'min', 'max', 'std', 'pct': {bucket: %}} for a named window, or None if empty."""
+        with self._lock: return self._windows[window].stats()
@@ -0,0 +1,176 @@
+import threading
+import numpy as np
+import clinical_metrics
+import quantile_sketch
+
+HOUR, DAY = 60, 1440
+
+# -----------------------------------------------------------------------------
+# 1. ONE ROLLUP GRANULARITY
+# -----------------------------------------------------------------------------
+class RollupTable:
+    """
+    Columnar per-period aggregates (count, sum, sum of squares, min, max, consensus
+    range counts, LBGI/HBGI risk sums and a QuantileSketch), one row per `period` minutes.
+    Row i covers epoch minutes [(origin + i) * period, (origin + i + 1) * period).
+    """
+    COLUMNS = ("count", "total", "total_sq", "min", "max", "ranges", "low_risk", "high_risk", "sketch")
+
+    def __init__(self, period):
+        self.period = period
+        self.origin = None
+        self.count = np.zeros(0, dtype=np.int32)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.total_sq = np.zeros(0, dtype=np.float64)
+        self.min = np.zeros(0, dtype=np.uint16)
+        self.max = np.zeros(0, dtype=np.uint16)
+        self.ranges = np.zeros((0, 5), dtype=np.int32)
+        self.low_risk = np.zeros(0, dtype=np.float64)
+        self.high_risk = np.zeros(0, dtype=np.float64)
+        # Row i is the counts vector of the QuantileSketch for that period
+        self.sketch = np.zeros((0, quantile_sketch.N_BUCKETS), dtype=np.uint16)
+
+    def __len__(self):
+        return len(self.count)
+
+    def _cover(self, first, last):
+        """Grows the columns so rows `first`..`last` (period indices) exist."""
+        if self.origin is None: self.origin = first
+        pad_front = max(0, self.origin - first)
+        pad_back = max(0, last - (self.origin + len(self) - 1))
+        if not pad_front and not pad_back: return
+        for name in self.COLUMNS:
+            col = getattr(self, name)
+            fill = np.iinfo(np.uint16).max if name == "min" else 0
+            front = np.full((pad_front,) + col.shape[1:], fill, dtype=col.dtype)
+            back = np.full((pad_back,) + col.shape[1:], fill, dtype=col.dtype)
+            setattr(self, name, np.concatenate([front, col, back]))
+        self.origin -= pad_front
+
+    def add(self, minutes, glucose):
+        """Folds a batch of readings (any order, any periods) into the table."""
+        minutes = np.asarray(minutes, dtype=np.int64)
+        if not len(minutes): return
+        glucose = np.asarray(glucose, dtype=np.int64)
+        period_idx = minutes // self.period
+        first, last = int(period_idx.min()), int(period_idx.max())
+        self._cover(first, last)
+        # Only the touched rows are updated, so a live append costs O(batch), not O(table)
+        sl = slice(first - self.origin, last - self.origin + 1)
+        rows, n = period_idx - first, last - first + 1
+
+        self.count[sl] += np.bincount(rows, minlength=n).astype(np.int32)
+        self.total[sl] += np.bincount(rows, weights=glucose, minlength=n)
+        self.total_sq[sl] += np.bincount(rows, weights=glucose * glucose, minlength=n)
+        np.minimum.at(self.min[sl], rows, glucose.astype(np.uint16))
+        np.maximum.at(self.max[sl], rows, glucose.astype(np.uint16))
+        self.ranges[sl] += np.bincount(rows * 5 + clinical_metrics.range_index(glucose), minlength=n * 5).reshape(n, 5).astype(np.int32)
+        low_risk, high_risk = clinical_metrics.risk_values(glucose)
+        self.low_risk[sl] += np.bincount(rows, weights=low_risk, minlength=n)
+        self.high_risk[sl] += np.bincount(rows, weights=high_risk, minlength=n)
+        k = quantile_sketch.N_BUCKETS
+        self.sketch[sl] += np.bincount(rows * k + quantile_sketch.bucket_index(glucose), minlength=n * k).reshape(n, k).astype(np.uint16)
+
+    def sketch_of(self, sl):
+        """Merged QuantileSketch for a row slice."""
+        return quantile_sketch.QuantileSketch(self.sketch[sl].sum(axis=0, dtype=np.int64))
+
+    def span(self, start_minute, end_minute):
+        """Row slice for periods overlapping [start_minute, end_minute)."""
+        if self.origin is None: return slice(0, 0)
+        lo = max(0, start_minute // self.period - self.origin)
+        hi = min(len(self), max(0, -(-end_minute // self.period) - self.origin))
+        return slice(lo, max(lo, hi))
+
+# -----------------------------------------------------------------------------
+# 2. HOURLY + DAILY ROLLUPS
+# -----------------------------------------------------------------------------
+class CGMRollups:
+    """
+    Hourly and daily rollups of a CGM history, kept current as readings arrive.
+    Trend/dossier queries read O(hours) or O(days) rows instead of every reading.
+    Callers must only add readings once (the store feeds it exactly its new rows).
+    """
+
+    def __init__(self):
+        self.hourly = RollupTable(HOUR)
+        self.daily = RollupTable(DAY)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_series(cls, series):
+        rollups = cls()
+        rollups.add(series.minutes, series.glucose)
+        return rollups
+
+    def add(self, minutes, glucose):
+        with self._lock:
+            self.hourly.add(minutes, glucose)
+            self.daily.add(minutes, glucose)
+
+    def summary(self, start_minute, end_minute):
+        """
+        Consensus metrics (n, mean, sd, cv, gmi, range %, GRI, LBGI/HBGI, min, max) for the
+        hours overlapping [start_minute, end_minute), from hourly rows only. None if empty.
+        """
+        with self._lock:
+            t, sl = self.hourly, self.hourly.span(start_minute, end_minute)
+            counts = t.count[sl]
+            n = int(counts.sum())
+            if not n: return None
+            total, total_sq = t.total[sl].sum(), t.total_sq[sl].sum()
+            ranges, low_risk, high_risk = t.ranges[sl].sum(axis=0), t.low_risk[sl].sum(), t.high_risk[sl].sum()
+            lo, hi = int(t.min[sl][counts > 0].min()), int(t.max[sl][counts > 0].max())
+
+        mean = total / n
+        sd = np.sqrt(max(total_sq - total * mean, 0.0) / (n - 1)) if n > 1 else 0.0
+        pct = clinical_metrics.range_percentages_from_counts(ranges)
+        gri, hypo, hyper = clinical_metrics.glycemia_risk_index(pct)
+        return {
+            "n": n, "mean": mean, "sd": sd, "cv": 100.0 * sd / mean if mean else 0.0,
+            "gmi": 3.31 + 0.02392 * mean, "min": lo, "max": hi, **pct,
+            "gri": gri, "gri_hypo": hypo, "gri_hyper": hyper, "lbgi": low_risk / n, "hbgi": high_risk / n,
+        }
+
+    def sketch(self, start_minute, end_minute):
+        """QuantileSketch over the hours overlapping [start_minute, end_minute), merged from hourly sketches."""
+        with self._lock: return self.hourly.sketch_of(self.hourly.span(start_minute, end_minute))
+
+    def quantiles(self, start_minute, end_minute, percentiles=clinical_metrics.AGP_PERCENTILES):
+        """Glucose percentiles over any window, from merged sketches rather than raw readings."""
+        return self.sketch(start_minute, end_minute).quantiles(np.asarray(percentiles) / 100.0)
+
+    def agp(self, start_minute, end_minute, percentiles=clinical_metrics.AGP_PERCENTILES, hours=range(24), utc_offset_min=0):
+        """
+        Local hour-of-day percentile bands, as agp_profile(), by merging the hourly sketches that
+        fall on each hour of day. `hours` restricts it to some hours of day (in that order).
+        `utc_offset_min` is applied to the nearest hour, the resolution of the hourly rows.
+        """
+        hours = list(hours)
+        with self._lock:
+            t, sl = self.hourly, self.hourly.span(start_minute, end_minute)
+            sketches = t.sketch[sl]
+            first_hour = (sl.start + (t.origin or 0) + round(utc_offset_min / HOUR)) % 24
+            # Hourly rows are contiguous, so each hour of day is a stride-24 view
+            by_hour = np.stack([sketches[(h - first_hour) % 24::24].sum(axis=0, dtype=np.int64) for h in hours])
+        return np.asarray(hours) * HOUR, quantile_sketch.quantiles_from_counts(by_hour, np.asarray(percentiles) / 100.0)
+
+    def daily_summary(self, start_minute, end_minute, utc_offset_min=0):
+        """
+        (day_start_minutes, mean, TIR%) per local day with readings, as daily_summary(). The daily
+        rows cover UTC days, so with a `utc_offset_min` (applied to the nearest hour) the days
+        are regrouped from hourly rows instead.
+        """
+        shift = round(utc_offset_min / HOUR) * HOUR
+        with self._lock:
+            t = self.hourly if shift else self.daily
+            sl = t.span(start_minute, end_minute)
+            counts, total, in_range = t.count[sl], t.total[sl], t.ranges[sl, 2]
+            row_starts = (np.arange(sl.start, sl.stop) + (t.origin or 0)) * t.period
+        if not len(counts): return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        day = (row_starts + shift) // DAY
+        idx = day - day[0]
+        n = np.bincount(idx, weights=counts)
+        total, in_range = np.bincount(idx, weights=total), np.bincount(idx, weights=in_range)
+        has = n > 0
+        return (np.flatnonzero(has) + day[0]) * DAY - shift, total[has] / n[has], 100.0 * in_range[has] / n[has]
@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import types
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.modules.setdefault('audio_recorder_streamlit', MagicMock(audio_recorder=lambda *a, **k: None))
+
+import anthropic
+import llm_cache
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+
+class _FlakyMessages:
+    """First request fails, later ones answer."""
+    def __init__(self): self.calls = 0
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.calls == 1: raise Exception("overloaded_error")
+        usage = types.SimpleNamespace(input_tokens=1, output_tokens=1, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        return types.SimpleNamespace(content=[types.SimpleNamespace(text="Back in range.")], usage=usage)
+
+class _TruncatedOnceMessages:
+    """First stream stops at max_tokens, later ones finish."""
+    def __init__(self): self.streams = 0
+    def stream(self, **kwargs):
+        self.streams += 1
+        stop_reason = "max_tokens" if self.streams == 1 else "end_turn"
+        usage = types.SimpleNamespace(input_tokens=1, output_tokens=1, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        final = types.SimpleNamespace(stop_reason=stop_reason, usage=usage)
+        return MagicMock(__enter__=lambda self: self, text_stream=iter(["Clinical ", "dossier."]), get_final_message=lambda: final)
+
+def _run(at):
+    at.run()
+    time.sleep(0.5)  # let the background call land before the next render
+
+def _app(monkeypatch, tmp_path, messages):
+    # Other test modules swap a mock into sys.modules['streamlit'] and import whoop against it
+    monkeypatch.setitem(sys.modules, "streamlit", streamlit)
+    monkeypatch.delitem(sys.modules, "whoop", raising=False)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(llm_cache, "_CACHES", {})
+    monkeypatch.setattr(anthropic, "Anthropic", lambda *a, **k: types.SimpleNamespace(messages=messages))
+    at = AppTest.from_file(APP, default_timeout=60)
+    for name in ("ANTHROPIC_API_KEY", "WHOOP_CLIENT_ID", "WHOOP_CLIENT_SECRET", "WHOOP_REDIRECT_URI"): at.secrets[name] = "x"
+    at.session_state["authenticated"] = True
+    return at
+
+def test_failed_ai_call_is_retried_on_next_render(tmp_path, monkeypatch):
+    messages = _FlakyMessages()
+    at = _app(monkeypatch, tmp_path, messages)
+    at.session_state["active_view"] = "Metrics"
+
+    _run(at)
+    _run(at)
+    assert any("overloaded_error" in e.value for e in at.error)
+
+    _run(at)
+    _run(at)
+    assert not at.error
+    assert any("Back in range." in s.value for s in at.success)
+    assert messages.calls == 2
+
+def test_truncated_stream_is_not_kept(tmp_path, monkeypatch):
+    messages = _TruncatedOnceMessages()
+    at = _app(monkeypatch, tmp_path, messages)
+    at.session_state["show_dossier"] = True
+
+    at.run()
+    assert any("cut off" in e.value for e in at.error)
+
+    at.run()
+    assert not at.error
+    assert any(i.value == "Clinical dossier." for i in at.info)
+    assert messages.streams == 2
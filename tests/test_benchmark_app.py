@@ -33,7 +33,7 @@ def setup_mock_functions(mocker):
     import logic
     importlib.reload(logic)
     # Mock network/API calls with an artificial delay to simulate real-world latency
-    mocker.patch('whoop.requests.get', side_effect=lambda *args, **kwargs: time.sleep(0.5) or MagicMock(status_code=200, json=lambda: {'records': [{'recovery': {'score': {'recovery_score': 85}}, 'score': {'strain': 12.0, 'sleep_performance_percentage': 90}}]}))
+    mocker.patch('whoop._SESSION.get', side_effect=lambda *args, **kwargs: time.sleep(0.5) or MagicMock(status_code=200, json=lambda: {'records': [{'recovery': {'score': {'recovery_score': 85}}, 'score': {'strain': 12.0, 'sleep_performance_percentage': 90}}]}))
 
     # calendar_sync uses Google Calendar API
     mock_events = MagicMock()
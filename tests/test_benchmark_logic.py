@@ -15,3 +15,37 @@ def test_benchmark_apply_context_modifiers_travel(benchmark):
 
     # Assert
     assert result is not None
+
+def test_benchmark_parse_nightscout_entries_90_days(benchmark):
+    from logic import parse_nightscout_entries
+    # ~90 days of 5-minute readings with the full set of Nightscout fields
+    data = [{"_id": str(i), "device": "xDrip-DexcomG6", "date": 1700000000000 + i * 300000,
+             "dateString": "2023-11-14T22:13:20.000Z", "sgv": 100 + (i % 80), "delta": 1.5,
+             "direction": "Flat", "type": "sgv", "filtered": 0, "unfiltered": 0, "rssi": 100,
+             "noise": 1, "sysTime": "2023-11-14T22:13:20.000Z"} for i in range(26000)]
+
+    dates, sgv, trend = benchmark(parse_nightscout_entries, data)
+
+    assert len(dates) == 26000
+
+def test_benchmark_clinical_summary_90_days(benchmark):
+    import clinical_metrics
+    rng = np.random.default_rng(0)
+    minutes = np.arange(26000) * 5
+    glucose = np.clip(140 + 50 * np.sin(minutes / 200) + rng.normal(0, 10, 26000), 40, 400).astype(np.uint16)
+
+    def report():
+        return clinical_metrics.summarize(glucose), clinical_metrics.agp_profile(minutes, glucose)
+
+    summary, (_, bands) = benchmark(report)
+
+    assert summary["n"] == 26000 and bands.shape == (5, 24)
+
+def test_benchmark_risk_timeline_90_days(benchmark):
+    from logic import risk_timeline, RISK_HIGH
+    rng = np.random.default_rng(0)
+    glucose = np.clip(140 + 60 * np.sin(np.arange(26000) / 40) + rng.normal(0, 10, 26000), 40, 400).astype(np.uint16)
+
+    codes = benchmark(risk_timeline, glucose, "Normal", 1.2, 1.1)
+
+    assert len(codes) == 26000 and (codes == RISK_HIGH).any()
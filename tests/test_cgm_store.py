@@ -0,0 +1,163 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cgm_store import CGMStore, TREND_CODES, encode_trends
+
+def test_append_only_keeps_newer_rows(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    assert store.last_date() is None
+
+    assert store.append([1000, 2000], [100, 110], [4, 4]) == 2
+    # Overlapping page: 2000 is already stored, 3000 is new
+    assert store.append([2000, 3000], [110, 120], [4, 2]) == 1
+    assert store.last_date() == 3000
+    assert len(store) == 3
+
+def test_store_persists_across_instances(tmp_path):
+    CGMStore("https://ns.example", root=str(tmp_path)).append([1000, 2000], [100, 110], [4, 2])
+    reopened = CGMStore("https://ns.example", root=str(tmp_path))
+    dates, sgv, trend = reopened.read()
+    assert list(dates) == [1000, 2000]
+    assert list(sgv) == [100, 110]
+    assert sgv.dtype == np.uint16 and trend.dtype == np.int8
+
+def test_ragged_columns_are_truncated(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([1000, 2000], [100, 110], [4, 4])
+    # Simulate a crash between column writes
+    with open(os.path.join(store.path, "date.bin"), "ab") as f:
+        np.array([3000], dtype=np.int64).tofile(f)
+    assert len(CGMStore("https://ns.example", root=str(tmp_path))) == 2
+
+def test_append_after_ragged_recovery_keeps_columns_aligned(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([1000, 2000], [100, 110], [4, 4])
+    with open(os.path.join(store.path, "date.bin"), "ab") as f:
+        np.array([3000], dtype=np.int64).tofile(f)
+    recovered = CGMStore("https://ns.example", root=str(tmp_path))
+    assert recovered.append([4000, 5000], [140, 150], [4, 4]) == 2
+    dates, sgv, _ = CGMStore("https://ns.example", root=str(tmp_path)).read()
+    assert list(dates) == [1000, 2000, 4000, 5000]
+    assert list(sgv) == [100, 110, 140, 150]
+
+def test_encode_trends_unknown_label():
+    assert list(encode_trends(["Steady", "Sideways"])) == [TREND_CODES["Steady"], TREND_CODES["Unknown"]]
+
+def test_merge_inserts_out_of_order_and_dedupes(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([3000, 4000], [130, 140], [4, 4])
+    assert store.merge([1000, 2000, 3000], [100, 110, 999], [4, 4, 4]) == 2
+    dates, sgv, _ = CGMStore("https://ns.example", root=str(tmp_path)).read()
+    assert list(dates) == [1000, 2000, 3000, 4000]
+    # Stored rows win on duplicate dates
+    assert list(sgv) == [100, 110, 130, 140]
+
+# --- CGMSeries ---
+from cgm_store import CGMSeries
+import pickle
+
+def test_series_round_trips_pandas():
+    df = pd.DataFrame({
+        "Timestamp": pd.date_range("2024-01-01", periods=4, freq="5min"),
+        "Glucose_Value": [100.4, 110.0, 120.6, 130.0],
+        "Trend": ["Steady", "Rising", "Rising", "Rising Fast"],
+    })
+    series = CGMSeries.from_pandas(df)
+    assert series.glucose.dtype == np.uint16 and series.minutes.dtype == np.int32 and series.trend.dtype == np.int8
+    out = series.to_pandas()
+    assert list(out["Glucose_Value"]) == [100, 110, 121, 130]
+    assert list(out["Trend"]) == list(df["Trend"])
+    assert (out["Timestamp"] == df["Timestamp"]).all()
+    # Glucose column shares the series buffer
+    assert np.shares_memory(out["Glucose_Value"].to_numpy(), series.glucose)
+
+def test_series_tail_is_a_view_and_latest():
+    series = CGMSeries.from_arrays([0, 300000, 600000], [100, 110, 120], [4, 2, 1], source="ns")
+    tail = series.tail(2)
+    assert len(tail) == 2 and np.shares_memory(tail.glucose, series.glucose)
+    assert series.latest() == {"Timestamp": pd.Timestamp("1970-01-01 00:10:00"), "Glucose_Value": 120, "Trend": "Rising Fast", "Trend_Code": 1}
+    assert series.latest(2)["Glucose_Value"] == 110
+
+def test_series_pickles_compactly():
+    n = 288
+    series = CGMSeries(np.arange(n) * 5, np.full(n, 120), np.full(n, 4))
+    restored = pickle.loads(pickle.dumps(series))
+    assert list(restored.glucose) == list(series.glucose)
+    assert not hasattr(series, "__dict__")
+
+# --- Rate-of-change trends ---
+from cgm_store import classify_trends, trend_slopes, is_rising, is_falling
+
+def test_trend_slopes_are_least_squares_over_trailing_window():
+    minutes = np.array([0, 5, 10, 15, 20])
+    glucose = np.array([100, 110, 115, 130, 130])
+    slopes = trend_slopes(minutes, glucose)
+    assert np.isnan(slopes[0])
+    assert slopes[1] == 2.0
+    # Window (5, 20] holds minutes 10, 15, 20
+    assert slopes[4] == pytest.approx(np.polyfit([10, 15, 20], [115, 130, 130], 1)[0])
+
+def test_classify_trends_bands_and_gaps():
+    minutes = np.array([0, 5, 10, 60, 65, 70, 75])
+    glucose = np.array([100, 120, 140, 140, 136, 130, 115])
+    codes = classify_trends(minutes, glucose)
+    labels = [TREND_CODES_BY_CODE[c] for c in codes]
+    # The 50-minute gap resets the window: minute 60 has no neighbours
+    assert labels == ["Unknown", "Rising Fast", "Rising Fast", "Unknown", "Steady", "Falling Slowly", "Falling"]
+    assert codes.dtype == np.int8
+    assert list(is_rising(codes)) == [False, True, True, False, False, False, False]
+    assert list(is_falling(codes)) == [False] * 5 + [True, True]
+
+TREND_CODES_BY_CODE = {v: k for k, v in TREND_CODES.items()}
+
+def test_append_classifies_missing_directions_with_stored_context(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([0, 300000], [100, 110], [4, 4])
+    store.append([600000], [125], [TREND_CODES["Unknown"]])
+    # Slope over minutes 0, 5, 10 is 2.5 mg/dL/min
+    assert store.read()[2][-1] == TREND_CODES["Rising"]
+
+def test_time_windows_use_timestamps_not_row_counts():
+    # 5-minute data with a 1-hour dropout
+    minutes = np.r_[np.arange(0, 60, 5), np.arange(120, 180, 5)]
+    series = CGMSeries(minutes, np.full(len(minutes), 120))
+    last_hour = series.last(60)
+    assert list(last_hour.minutes) == list(range(120, 180, 5))
+    assert np.shares_memory(last_hour.glucose, series.glucose)
+    assert list(series.window(50, 125).minutes) == [55, 120, 125]
+    assert list(np.flatnonzero(series.gaps())) == [12]
+
+def test_to_pandas_marks_gaps_with_nan():
+    series = CGMSeries([0, 5, 60, 65], [100, 110, 120, 130])
+    df = series.to_pandas(mark_gaps=True)
+    assert len(df) == 5 and np.isnan(df["Glucose_Value"].iloc[2])
+    assert len(series.to_pandas()) == 4
+
+def test_last_hours_and_overnight_windows():
+    day = int(pd.Timestamp("2024-03-02").value // 60_000_000_000)
+    minutes = np.arange(day - 24 * 60, day + 12 * 60, 5)
+    series = CGMSeries(minutes, np.full(len(minutes), 110))
+    assert len(series.last(hours=2)) == len(series.last(minutes=120)) == 24
+    assert len(series.last(hours=1, minutes=30)) == 18
+    start, end = series.overnight_span()
+    assert (start, end) == (day - 120, day + 7 * 60)
+    night = series.overnight()
+    assert night.minutes[0] == day - 115 and night.minutes[-1] == day + 7 * 60
+    assert np.shares_memory(night.glucose, series.glucose)
+    assert series.overnight_span(pd.Timestamp("2024-03-01").date()) == (day - 1440 - 120, day - 1440 + 7 * 60)
+
+def test_overnight_window_uses_local_hours():
+    # Readings stamped in UTC for a user at UTC-5: local 22:00-07:00 is 03:00-12:00 UTC
+    day = int(pd.Timestamp("2024-03-02").value // 60_000_000_000)
+    minutes = np.arange(day - 24 * 60, day + 14 * 60, 5)
+    series = CGMSeries(minutes, np.full(len(minutes), 110))
+    assert series.overnight_span(utc_offset_min=-300) == (day + 3 * 60, day + 12 * 60)
+    night = series.overnight(utc_offset_min=-300)
+    assert night.minutes[0] == day + 3 * 60 + 5 and night.minutes[-1] == day + 12 * 60
+    # At UTC+11 the newest reading (13:55 UTC) is already 00:55 the next local day
+    assert series.overnight_span(utc_offset_min=660) == (day + 1440 - 120 - 660, day + 1440 + 7 * 60 - 660)
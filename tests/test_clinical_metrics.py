@@ -0,0 +1,70 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import clinical_metrics
+
+def test_agp_matches_numpy_percentiles():
+    rng = np.random.default_rng(1)
+    minutes = np.sort(rng.integers(0, 14 * 1440, 4000))
+    glucose = rng.integers(40, 350, 4000)
+    bin_starts, bands = clinical_metrics.agp_profile(minutes, glucose)
+    assert list(bin_starts[:3]) == [0, 60, 120]
+    bins = (minutes % 1440) // 60
+    for b in range(24):
+        expected = np.percentile(glucose[bins == b], clinical_metrics.AGP_PERCENTILES)
+        assert np.allclose(bands[:, b], expected)
+
+def test_agp_bins_by_local_hour():
+    # 09:00-09:59 UTC is 04:00 local at UTC-5
+    _, bands = clinical_metrics.agp_profile([540, 545, 550], [100, 110, 120], utc_offset_min=-300)
+    assert bands[2, 4] == 110 and np.isnan(bands[:, 9]).all()
+
+def test_agp_empty_bins_are_nan():
+    _, bands = clinical_metrics.agp_profile([60, 65], [100, 120])
+    assert np.isnan(bands[:, 0]).all()
+    assert bands[2, 1] == 110
+
+def test_range_percentages_use_consensus_boundaries():
+    r = clinical_metrics.range_percentages([50, 54, 69, 70, 180, 181, 250, 251, 120, 120])
+    assert r["very_low"] == 10 and r["low"] == 20 and r["in_range"] == 40
+    assert r["high"] == 20 and r["very_high"] == 10
+    assert r["below_70"] == 30 and r["above_180"] == 30
+
+def test_gri_components():
+    gri, hypo, hyper = clinical_metrics.glycemia_risk_index({"very_low": 1, "low": 5, "high": 20, "very_high": 5})
+    assert hypo == pytest.approx(5.0) and hyper == pytest.approx(15.0)
+    assert gri == pytest.approx(3.0 * 5 + 1.6 * 15)
+    assert clinical_metrics.glycemia_risk_index({"very_low": 40, "low": 0, "high": 0, "very_high": 0})[0] == 100.0
+
+def test_risk_indices_match_kovatchev_formula():
+    g = np.array([45, 70, 112, 180, 300], dtype=float)
+    f = 1.509 * (np.log(g) ** 1.084 - 5.381)
+    r = 10 * f ** 2
+    lbgi, hbgi = clinical_metrics.risk_indices(g)
+    assert lbgi == pytest.approx(np.where(f < 0, r, 0).mean())
+    assert hbgi == pytest.approx(np.where(f > 0, r, 0).mean())
+
+def test_mage_ignores_sub_sd_wiggles():
+    # Two 100 mg/dL swings with small noise wiggles inside them
+    trace = [100, 104, 101, 150, 146, 200, 196, 198, 150, 153, 100, 102, 100, 150, 200]
+    assert clinical_metrics.mage(trace) == pytest.approx(100.0)
+    assert clinical_metrics.mage([120] * 10) == 0.0
+
+def test_summarize_and_daily_summary():
+    minutes = np.arange(3 * 288) * 5
+    glucose = np.r_[np.full(288, 100), np.full(288, 200), np.full(288, 150)]
+    s = clinical_metrics.summarize(glucose)
+    assert s["mean"] == pytest.approx(150) and s["in_range"] == pytest.approx(200 / 3)
+    assert s["gmi"] == pytest.approx(3.31 + 0.02392 * 150)
+    day_starts, mean, tir = clinical_metrics.daily_summary(minutes, glucose, days=2)
+    assert list(day_starts) == [1440, 2880]
+    assert list(mean) == [200, 150] and list(tir) == [0, 100]
+    # At UTC+2 the last two hours of each UTC day belong to the next local day
+    day_starts, mean, _ = clinical_metrics.daily_summary(minutes, glucose, utc_offset_min=120)
+    assert list(day_starts) == [-120, 1320, 2760, 4200]
+    assert mean[0] == 100 and mean[-1] == 150
+    assert clinical_metrics.summarize([]) is None
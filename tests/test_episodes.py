@@ -0,0 +1,74 @@
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import episodes
+from episodes import EpisodeIndex, detect_episodes, durations, LOW, VERY_LOW, ELEVATED, HIGH, VERY_HIGH
+from cgm_store import CGMSeries, CGMStore
+
+def _trace(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(n) * 5
+    minutes[n // 2:] += 60                              # one sensor gap
+    glucose = np.clip(140 + 110 * np.sin(minutes / 90) + rng.normal(0, 12, n), 40, 400).astype(np.uint16)
+    return minutes, glucose
+
+def test_detects_start_end_nadir_and_auc():
+    minutes = np.arange(10) * 5
+    glucose = np.array([100, 68, 60, 52, 58, 66, 90, 100, 100, 100])
+    found = detect_episodes(minutes, glucose)
+    low = np.flatnonzero(found["kind"] == LOW)
+    assert len(low) == 1 and found["start"][low[0]] == 5 and found["end"][low[0]] == 25
+    assert found["extreme"][low[0]] == 52 and found["extreme_minute"][low[0]] == 15
+    assert found["auc"][low[0]] == 5 * (2 + 10 + 18 + 12 + 4)
+    # The <54 excursion is a single reading: shorter than the 15-minute minimum
+    assert not (found["kind"] == VERY_LOW).any()
+
+def test_sensor_gap_splits_episodes():
+    minutes = np.array([0, 5, 10, 40, 45, 50])
+    found = detect_episodes(minutes, np.full(6, 200))
+    assert list(found["start"][found["kind"] == HIGH]) == [0, 40]
+
+def test_streaming_index_matches_batch_detection():
+    minutes, glucose = _trace()
+    index = EpisodeIndex()
+    for lo in range(0, len(minutes), 37):
+        index.add(minutes[lo:lo + 37], glucose[lo:lo + 37])
+    streamed = index.query()
+    batch = detect_episodes(minutes, glucose)
+    for col in episodes.COLUMNS:
+        assert np.array_equal(streamed[col], batch[col]), col
+    assert (streamed["end"][streamed["open"]] == minutes[-1]).all() and len(batch["kind"]) > 20
+
+def test_ongoing_and_counts():
+    index = EpisodeIndex.from_series(CGMSeries(np.arange(12) * 5, [120] * 6 + [170, 175, 190, 200, 210, 220]))
+    assert index.ongoing(ELEVATED) == (30, 30)
+    assert index.ongoing(HIGH) == (40, 20)
+    assert index.ongoing(VERY_HIGH) is None
+    counts = index.counts()
+    assert counts["elevated"] == (1, 30) and counts["high"] == (1, 20) and counts["low"] == (0, 0)
+    # Regenerated data with the same source rebuilds the index
+    index.ingest(CGMSeries(np.arange(12) * 5, [120] * 12))
+    assert index.ongoing(ELEVATED) is None and not len(index.query()["kind"])
+
+def test_sustained_elevated_needs_six_readings():
+    minutes = np.arange(12) * 5
+    five = EpisodeIndex()
+    five.add(minutes, np.r_[np.full(7, 120), np.full(5, 170)])
+    assert five.ongoing(ELEVATED)[1] == 25
+    assert not five.sustained(ELEVATED, episodes.SUSTAINED_ELEVATED_MIN)
+    six = EpisodeIndex()
+    six.add(minutes, np.r_[np.full(6, 120), np.full(6, 170)])
+    assert six.sustained(ELEVATED, episodes.SUSTAINED_ELEVATED_MIN)
+    assert not six.sustained(HIGH, episodes.SUSTAINED_ELEVATED_MIN)
+
+def test_store_keeps_episode_index_current(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append(np.arange(6) * 300000, [100, 100, 65, 60, 62, 100], [4] * 6)
+    index = store.episodes()
+    assert list(index.query()["kind"]) == [LOW]
+    store.append(np.arange(6, 10) * 300000, [200, 210, 220, 230], [4] * 4)
+    assert store.episodes() is index
+    assert index.ongoing(HIGH) == (30, 20)
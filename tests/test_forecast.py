@@ -0,0 +1,70 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import forecast
+from forecast import GlucoseForecaster
+from cgm_store import CGMSeries
+
+def _ar_trace(n=4000, phi=0.85, seed=0):
+    rng = np.random.default_rng(seed)
+    g, d = np.empty(n), 0.0
+    g[:4] = 140
+    for i in range(4, n):
+        d = phi * d + rng.normal(0, 1.5) - 0.01 * (g[i - 1] - 140)
+        g[i] = g[i - 1] + d
+    return np.arange(n) * 5, g
+
+def test_learns_damped_trend_from_history():
+    minutes, glucose = _ar_trace()
+    model = GlucoseForecaster()
+    model.update(minutes, glucose)
+    assert model.coef[0] == pytest.approx(0.85, abs=0.05)
+    assert model.error_quantiles.shape == (len(forecast.QUANTILES), forecast.HORIZON_STEPS)
+
+def test_incremental_fit_matches_batch_fit():
+    minutes, glucose = _ar_trace(n=1500)
+    batch, incremental = GlucoseForecaster(), GlucoseForecaster()
+    batch.update(minutes, glucose)
+    for start in range(0, len(minutes), 37): incremental.update(minutes[start:start + 37], glucose[start:start + 37])
+    assert incremental.n_rows == batch.n_rows
+    assert np.allclose(incremental.xtx, batch.xtx) and np.allclose(incremental.coef, batch.coef)
+
+def test_rows_spanning_sensor_gaps_are_dropped():
+    minutes = np.r_[np.arange(10) * 5, 200 + np.arange(10) * 5]
+    model = GlucoseForecaster()
+    model.update(minutes, np.full(20, 120.0))
+    # Each contiguous run of 10 readings yields 10 - (LAGS + 1) training rows
+    assert model.n_rows == 2 * (10 - forecast.LAGS - 1)
+
+def test_forecast_bands_are_ordered_and_widen():
+    minutes, glucose = _ar_trace()
+    model = GlucoseForecaster()
+    model.update(minutes, glucose)
+    offsets, bands = model.forecast(minutes, glucose)
+    assert offsets[0] == 5 and offsets[-1] == 180
+    assert np.all(np.diff(bands, axis=0) >= 0)
+    _, wide = model.forecast(minutes, glucose, widen=2.0)
+    assert (wide[-1] - wide[0])[-1] > (bands[-1] - bands[0])[-1]
+
+def test_ingest_resets_on_new_source():
+    model = GlucoseForecaster()
+    minutes, glucose = _ar_trace(n=300)
+    model.ingest(CGMSeries(minutes, glucose, source="a"))
+    rows = model.n_rows
+    model.ingest(CGMSeries(minutes[:100], glucose[:100], source="b"))
+    assert model.source == "b" and model.n_rows < rows
+
+def test_ingest_retrains_on_backfilled_history():
+    minutes, glucose = _ar_trace(n=600)
+    model = GlucoseForecaster()
+    model.ingest(CGMSeries(minutes[400:], glucose[400:], source="ns"))
+    partial = model.n_rows
+    model.ingest(CGMSeries(minutes, glucose, source="ns"))
+    assert model.n_rows > partial and model.n_readings == 600
+    full = GlucoseForecaster()
+    full.ingest(CGMSeries(minutes, glucose, source="ns"))
+    assert np.allclose(model.coef, full.coef)
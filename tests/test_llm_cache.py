@@ -0,0 +1,51 @@
+import sys
+import os
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm_cache import LLMCache, make_key, quantize, quantize_bg
+
+def test_quantized_inputs_share_a_key():
+    assert quantize_bg(122) == quantize_bg(118) == 120
+    assert quantize(83, 5) == 85 and quantize(0.26, 0.1) == 0.3
+    assert quantize("n/a", 5) == "n/a"
+    key = lambda bg: make_key("m", 150, f"BG {quantize_bg(bg)}", [{"role": "user", "content": "hi"}], False)
+    assert key(121) == key(119) != key(127)
+    assert make_key("m", 150, "s", [], False) != make_key("m", 500, "s", [], False)
+
+def test_round_trip_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    LLMCache(path).put("k", {"action_directive": "walk"})
+    cache = LLMCache(path)
+    assert cache.get("k") == {"action_directive": "walk"}
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("k", "text", ttl_s=60)
+    with patch("llm_cache.time.time", return_value=time.time() + 61):
+        assert cache.get("k") is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    now = time.time()
+    with patch("llm_cache.time.time", side_effect=[now, now + 1, now + 2, now + 3]):
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")                                  # "b" is now the least recently used
+        cache.put("c", 3)
+    assert cache.get("a") == 1 and cache.get("c") == 3 and cache.get("b") is None
+    assert len(cache) == 2
+
+def test_record_usage_accumulates_cached_and_uncached_tokens():
+    from types import SimpleNamespace
+    import llm_cache
+    before = dict(llm_cache.USAGE)
+    counts = llm_cache.record_usage("test", SimpleNamespace(input_tokens=40, cache_read_input_tokens=900, cache_creation_input_tokens=None, output_tokens=12))
+    assert counts == {"input_tokens": 40, "cache_read_input_tokens": 900, "cache_creation_input_tokens": 0, "output_tokens": 12}
+    assert llm_cache.USAGE["cache_read_input_tokens"] - before["cache_read_input_tokens"] == 900
+    assert llm_cache.USAGE["calls"] == before["calls"] + 1
+    assert 0.0 < llm_cache.cached_input_share() <= 1.0
@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 import pandas as pd
 import numpy as np
 import sys
@@ -206,3 +206,147 @@ def test_calc_glycemic_risk_schedule_load_high_weekend_suppressed(mock_whoop, mo
     # Alert should not be triggered because weekend is active
     assert status != "🟡 LOAD ALERT"
     assert "🌴 WEEKEND MODE ACTIVE" in message
+
+# =====================================================================
+# NIGHTSCOUT PARSING
+# =====================================================================
+from logic import parse_nightscout_entries, nightscout_entries_to_frame
+from cgm_store import TREND_CODES
+
+def test_parse_nightscout_entries_extracts_columns():
+    data = [
+        {"date": 600000, "sgv": 120, "direction": "SingleDown", "device": "xDrip", "noise": 1, "rssi": 100},
+        {"date": 300000, "sgv": "118", "direction": "Flat"},
+        {"date": 450000, "type": "cal", "slope": 900},  # calibration record, no sgv
+        {"dateString": "1970-01-01T00:15:00Z", "sgv": 125},
+    ]
+    dates, sgv, trend = parse_nightscout_entries(data)
+    assert list(dates) == [300000, 600000, 900000]
+    assert list(sgv) == [118, 120, 125]
+    # No `direction` -> Unknown; the store classifies it from the slope on append
+    assert list(trend) == [TREND_CODES["Steady"], TREND_CODES["Falling"], TREND_CODES["Unknown"]]
+    assert sgv.dtype == np.uint16 and trend.dtype == np.int8
+
+def test_nightscout_entries_to_frame_schema():
+    df = nightscout_entries_to_frame([{"date": 300000, "sgv": 118, "direction": "NOT COMPUTABLE"}])
+    assert list(df.columns) == ["Timestamp", "Glucose_Value", "Trend"]
+    assert df["Trend"].iloc[0] == "Unknown"
+    assert nightscout_entries_to_frame([]) is None
+
+def test_calc_glycemic_risk_accepts_cgm_series():
+    from cgm_store import CGMSeries
+    series = CGMSeries.from_arrays([0, 300000, 600000], [120, 120, 190], [4, 4, 2])
+    out, status, color, _ = calc_glycemic_risk(series, context="Normal", is_real_data=True)
+    assert isinstance(out, CGMSeries)
+    assert status == "🔴 HIGH ALERT"
+
+    sim = CGMSeries.from_pandas(fetch_health_data())
+    out, _, _, _ = calc_glycemic_risk(sim, context="Exercise")
+    assert isinstance(out, CGMSeries) and len(out) == len(sim)
+
+def test_calc_glycemic_risk_memoised_on_fingerprint():
+    from cgm_store import CGMSeries
+    series = CGMSeries.from_arrays([0, 300000], [120, 125], [4, 4], source="memo-test")
+    with patch('logic._evaluate_risk', wraps=__import__('logic')._evaluate_risk) as spy:
+        first = calc_glycemic_risk(series, "Normal", is_real_data=True, fingerprint=series.fingerprint)
+        second = calc_glycemic_risk(series, "Normal", is_real_data=True, fingerprint=series.fingerprint)
+        calc_glycemic_risk(series, "Stressed", is_real_data=True, fingerprint=series.fingerprint)
+    assert first is second
+    assert spy.call_count == 2
+
+# =====================================================================
+# WEATHER TTL CACHE
+# =====================================================================
+import time
+import logic
+
+def _wait_for_weather(lat, lon):
+    fut = logic.background.inflight(("weather", logic._weather_key(lat, lon)))
+    if fut: fut.result(timeout=5)
+
+def test_ai_work_runs_on_its_own_pool():
+    import threading
+    fut = logic.background.submit_once(("pool-test", 1), lambda: threading.current_thread().name, executor=logic.background.AI_EXECUTOR)
+    assert fut.result(timeout=5).startswith("tldh-ai")
+    assert logic.background.submit_once(("pool-test", 2), lambda: threading.current_thread().name).result(timeout=5).startswith("tldh-bg")
+
+@patch('logic.requests.get')
+def test_environmental_load_never_blocks_and_revalidates(mock_get):
+    logic._WEATHER_CACHE.clear()
+    mock_get.side_effect = lambda *a, **k: time.sleep(0.3) or MagicMock(json=lambda: {"main": {"temp": 35}, "weather": [{"id": 800}]})
+
+    start = time.time()
+    assert logic.get_environmental_load(10.0, 20.0, api_key="k") == (1.0, "☁️ WEATHER SYNCING")
+    assert time.time() - start < 0.1
+    _wait_for_weather(10.0, 20.0)
+
+    multiplier, status = logic.get_environmental_load(10.001, 20.001, api_key="k")
+    assert multiplier == 0.85 and "HEAT WARNING" in status
+    assert mock_get.call_count == 1
+
+    # Expired entry: stale value is served while a refresh runs
+    key = logic._weather_key(10.0, 20.0)
+    logic._WEATHER_CACHE[key] = (time.time() - logic.WEATHER_TTL_S - 1, (1.0, "stale"))
+    assert logic.get_environmental_load(10.0, 20.0, api_key="k") == (1.0, "stale")
+    _wait_for_weather(10.0, 20.0)
+    assert mock_get.call_count == 2
+
+@patch('logic.requests.get', side_effect=Exception("Timeout"))
+def test_environmental_load_keeps_stale_value_on_failure(mock_get):
+    logic._WEATHER_CACHE.clear()
+    key = logic._weather_key(1.0, 2.0)
+    logic._WEATHER_CACHE[key] = (0, (1.15, "❄️ EXTREME COLD"))
+    assert logic.get_environmental_load(1.0, 2.0, api_key="k") == (1.15, "❄️ EXTREME COLD")
+    _wait_for_weather(1.0, 2.0)
+    # Still stale-but-served, and not immediately retried
+    assert logic.get_environmental_load(1.0, 2.0, api_key="k") == (1.15, "❄️ EXTREME COLD")
+    assert mock_get.call_count == 1
+
+def test_has_cached_weather_counts_stale_readings():
+    logic._WEATHER_CACHE.clear()
+    assert not logic.has_cached_weather(3.0, 4.0)
+    logic._WEATHER_CACHE[logic._weather_key(3.0, 4.0)] = (0, (1.0, "stale"))
+    assert logic.has_cached_weather(3.0, 4.0)
+
+from logic import normalize_cgm_readings
+
+def test_normalize_snaps_dedupes_and_keeps_gaps():
+    # Jittered 5-min cadence, a duplicate upload of the second reading and a 40-minute sensor gap
+    dates = np.array([0, 301000, 318000, 598000, 903000, 3300000, 3607000])
+    sgv = np.array([100, 105, 999, 110, 115, 150, 155])
+    out_dates, out_sgv, _ = normalize_cgm_readings(dates, sgv, np.zeros(7, dtype=np.int8))
+    assert list(out_dates) == [0, 300000, 600000, 900000, 3300000, 3600000]
+    # The duplicate further from the grid point is dropped
+    assert list(out_sgv) == [100, 105, 110, 115, 150, 155]
+
+def test_normalize_uses_anchor_phase():
+    # Sensor reports at :10s past the 5-minute mark; new readings follow the store's phase
+    out_dates, _, _ = normalize_cgm_readings(np.array([318000, 607000]), np.array([1, 2]), np.array([4, 4]), anchor_ms=10000)
+    assert list(out_dates) == [310000, 610000]
+
+# =====================================================================
+# BATCH RISK TIMELINE
+# =====================================================================
+from logic import risk_timeline, risk_spans, RISK_STABLE, RISK_TRAVEL, RISK_CAUTION, RISK_LOW, RISK_HIGH, RISK_LABELS
+
+def test_risk_timeline_matches_single_point_evaluation():
+    from cgm_store import CGMSeries
+    glucose = [60, 75, 120, 160, 200]
+    for context, speaker_mode, whoop_mod, env_mod in [("Normal", False, 1.0, 1.0), ("Travel", True, 1.0, 1.0),
+                                                      ("Normal", False, 1.4, 1.2), ("Normal", False, 1.0, 0.9)]:
+        codes = risk_timeline(glucose, context, whoop_mod, env_mod, speaker_mode)
+        for i, g in enumerate(glucose):
+            series = CGMSeries.from_arrays([0], [g], [4])
+            _, status, _, _ = logic._evaluate_risk(series, context, (whoop_mod, ""), (1.0, ""), (env_mod, ""), speaker_mode, True)
+            assert RISK_LABELS[codes[i]] == status
+
+def test_risk_timeline_accepts_per_reading_modifiers():
+    codes = risk_timeline([80, 80, 120], env_multiplier=np.array([1.0, 0.9, 1.6]))
+    assert list(codes) == [RISK_STABLE, RISK_LOW, RISK_CAUTION]
+    assert codes.dtype == np.int8
+
+def test_risk_spans_split_on_code_changes_and_gaps():
+    minutes = np.array([0, 5, 10, 15, 20, 60, 65])
+    codes = np.array([RISK_HIGH, RISK_HIGH, RISK_STABLE, RISK_LOW, RISK_LOW, RISK_LOW, RISK_TRAVEL], dtype=np.int8)
+    assert risk_spans(minutes, codes) == [(0, 5, RISK_HIGH), (15, 20, RISK_LOW), (60, 60, RISK_LOW)]
+    assert risk_spans([], []) == []
@@ -0,0 +1,198 @@
+import sys
+import os
+from unittest.mock import patch, MagicMock
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nightscout_sync
+from cgm_store import CGMStore
+
+def _response(entries):
+    res = MagicMock()
+    res.json.return_value = entries
+    return res
+
+@patch('logic.requests.get')
+def test_incremental_sync_requests_only_new_entries(mock_get, tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    mock_get.return_value = _response([
+        {"date": 600000, "sgv": 120, "direction": "Flat"},
+        {"date": 300000, "sgv": 115, "direction": "FortyFiveUp"},
+    ])
+    df = nightscout_sync.sync_nightscout_data("ns.example", "", store=store).to_pandas()
+    assert len(df) == 2
+    assert "find[date]" not in mock_get.call_args[0][0]
+
+    mock_get.return_value = _response([{"date": 900000, "sgv": 130, "direction": "SingleUp"}])
+    df = nightscout_sync.sync_nightscout_data("ns.example", "", store=store).to_pandas()
+    assert "find[date][$gt]=600000" in mock_get.call_args[0][0]
+    assert list(df["Glucose_Value"]) == [115, 120, 130]
+    assert df["Trend"].iloc[-1] == "Rising"
+
+@patch('logic.requests.get')
+def test_sync_serves_local_store_when_upstream_fails(mock_get, tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([300000], [110], [4])
+    mock_get.side_effect = Exception("Timeout")
+    df = nightscout_sync.sync_nightscout_data("ns.example", "", store=store).to_pandas()
+    assert list(df["Glucose_Value"]) == [110]
+
+@patch('logic.requests.get')
+def test_sync_empty_everywhere_returns_none(mock_get, tmp_path):
+    mock_get.return_value = _response([])
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    assert nightscout_sync.sync_nightscout_data("ns.example", "", store=store) is None
+
+def _page_responder(fail_pages=()):
+    """Fake Nightscout that returns one reading at each page start."""
+    def get(endpoint, timeout=30):
+        since = int(endpoint.split("find[date][$gt]=")[1].split("&")[0])
+        if since + 1 in fail_pages: raise Exception("Gateway Timeout")
+        return _response([{"date": since + 1, "sgv": 100, "direction": "Flat"}])
+    return get
+
+def test_plan_pages_are_aligned():
+    day = nightscout_sync.DAY_MS
+    pages = nightscout_sync.plan_pages(2, now_ms=10 * day + 5)
+    assert pages == [(8 * day, 9 * day), (9 * day, 10 * day), (10 * day, 11 * day)]
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    day = nightscout_sync.DAY_MS
+    now = 10 * day + 5
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+
+    with patch('requests.Session.get', side_effect=_page_responder(fail_pages={9 * day})):
+        first = nightscout_sync.backfill_nightscout_history("ns.example", "", days=2, store=store, now_ms=now)
+    assert first == {"pages": 3, "fetched": 2, "failed": 1, "rows": 2}
+    # The open page containing "now" is fetched but never checkpointed
+    assert nightscout_sync.load_checkpoint(store) == {8 * day}
+
+    calls = []
+    def tracking(endpoint, timeout=30):
+        calls.append(endpoint)
+        return _page_responder()(endpoint, timeout)
+    with patch('requests.Session.get', side_effect=tracking):
+        second = nightscout_sync.backfill_nightscout_history("ns.example", "", days=2, store=store, now_ms=now)
+    assert len(calls) == 2
+    assert second["rows"] == 1
+    assert list(store.read()[0]) == [8 * day, 9 * day, 10 * day]
+
+def _fake_nightscout(dates, sgv):
+    """Fake entries endpoint over a fixed history: honours since/until/count, newest first."""
+    dates, sgv = np.asarray(dates), np.asarray(sgv)
+    def get(endpoint, timeout=30):
+        query = dict(p.split("=", 1) for p in endpoint.split("?", 1)[1].split("&"))
+        sel = np.ones(len(dates), dtype=bool)
+        if "find[date][$gt]" in query: sel &= dates > int(query["find[date][$gt]"])
+        if "find[date][$lt]" in query: sel &= dates < int(query["find[date][$lt]"])
+        rows = np.flatnonzero(sel)[::-1][:int(query["count"])]
+        return _response([{"date": int(dates[i]), "sgv": int(sgv[i]), "direction": "Flat"} for i in rows])
+    return get
+
+def test_backfill_after_sync_does_not_duplicate_jittered_readings(tmp_path):
+    day = nightscout_sync.DAY_MS
+    # Mid-day, so the synced 24h window starts on a different reading than any backfill page
+    now = 10 * day + 6 * 3_600_000
+    rng = np.random.default_rng(3)
+    # Three days of uploads at a 5-minute cadence, each a few seconds off the grid
+    dates = now - 3 * day + 17_000 + np.arange(864) * 300_000 + rng.integers(-20_000, 20_000, 864)
+    sgv = 100 + np.arange(864) % 50
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    fake = _fake_nightscout(dates, sgv)
+
+    with patch('logic.requests.get', side_effect=fake):
+        nightscout_sync.sync_nightscout_data("ns.example", "", store=store)
+    assert len(store) == 288
+    with patch('requests.Session.get', side_effect=fake):
+        nightscout_sync.backfill_nightscout_history("ns.example", "", days=3, store=store, now_ms=now)
+    assert len(store) == 864
+    assert np.diff(store.read()[0]).min() > 150_000
+
+def test_sync_after_long_outage_pages_back_to_the_last_reading(tmp_path):
+    # Three days offline: more than one page of 288 entries arrived since the last stored reading
+    dates = 300_000 + np.arange(1 + 864) * 300_000
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append(dates[:1], [100], [4])
+    fake = _fake_nightscout(dates, np.full(len(dates), 120))
+    with patch('logic.requests.get', side_effect=fake) as mock_get:
+        series = nightscout_sync.sync_nightscout_data("ns.example", "", store=store)
+    assert mock_get.call_count == 4
+    assert list(store.read()[0]) == list(dates)
+    assert len(series) == 288
+
+# --- Circuit breaker ---
+import time
+
+@patch('logic.requests.get')
+def test_breaker_trips_and_serves_stale_data(mock_get, tmp_path):
+    nightscout_sync._BREAKERS.clear()
+    store = CGMStore("https://down.example", root=str(tmp_path))
+    store.append([300000], [110], [4])
+    mock_get.side_effect = Exception("Read timed out")
+
+    for _ in range(3):
+        nightscout_sync.sync_nightscout_data("down.example", "", store=store)
+    assert mock_get.call_count == 3
+    assert nightscout_sync.is_degraded("down.example")
+
+    # Open breaker: no synchronous network call, last good data served
+    start = time.time()
+    series = nightscout_sync.sync_nightscout_data("down.example", "", store=store)
+    assert time.time() - start < 0.1
+    assert mock_get.call_count == 3
+    assert list(series.glucose) == [110]
+
+@patch('logic.requests.get')
+def test_breaker_probe_backs_off_then_recovers(mock_get, tmp_path):
+    nightscout_sync._BREAKERS.clear()
+    store = CGMStore("https://flaky.example", root=str(tmp_path))
+    breaker = nightscout_sync.get_breaker("https://flaky.example")
+    mock_get.side_effect = Exception("Read timed out")
+    for _ in range(3):
+        nightscout_sync.sync_nightscout_data("flaky.example", "", store=store)
+    first_backoff = breaker.backoff_s
+
+    # Backoff elapsed: a failing probe doubles the backoff
+    breaker.next_probe = 0
+    fut = breaker.maybe_probe(("test-probe", 1), nightscout_sync._pull_new_entries, "flaky.example", "", 288, store)
+    assert fut.result(timeout=5) is False
+    assert breaker.backoff_s == first_backoff * 2
+    assert breaker.maybe_probe(("test-probe", 2), lambda: None) is None  # still backing off
+
+    # Upstream is back: the probe closes the breaker and lands the new readings
+    mock_get.side_effect = None
+    mock_get.return_value = _response([{"date": 600000, "sgv": 140, "direction": "Flat"}])
+    breaker.next_probe = 0
+    fut = breaker.maybe_probe(("test-probe", 3), nightscout_sync._pull_new_entries, "flaky.example", "", 288, store)
+    assert fut.result(timeout=5) is True
+    assert not nightscout_sync.is_degraded("flaky.example")
+    assert list(store.read()[1]) == [140]
+
+# --- Background poller ---
+def test_next_poll_delay_aligns_to_upload_cadence():
+    last_ms = 1_000_000_000
+    now = last_ms / 1000 + 60
+    # Next reading expected 300s after the last one, polled 20s after that
+    assert nightscout_sync.next_poll_delay(last_ms, now) == 260
+    # Upload is late: retry soon
+    assert nightscout_sync.next_poll_delay(last_ms, last_ms / 1000 + 400) == nightscout_sync.LATE_RETRY_S
+    # Long gap (sensor off): back to plain cadence
+    assert nightscout_sync.next_poll_delay(last_ms, last_ms / 1000 + 2000) == nightscout_sync.CGM_CADENCE_S
+    assert nightscout_sync.next_poll_delay(None, now) == nightscout_sync.CGM_CADENCE_S
+
+@patch('logic.requests.get')
+def test_poller_fills_store_and_is_idempotent(mock_get, tmp_path):
+    mock_get.return_value = _response([{"date": int(time.time() * 1000), "sgv": 101, "direction": "Flat"}])
+    with patch('cgm_store.STORE_DIR', str(tmp_path)), patch('cgm_store.get_store', lambda source: CGMStore(source, root=str(tmp_path))):
+        poller = nightscout_sync.start_poller("poll.example", "tok")
+        try:
+            assert poller.first_sync.wait(5)
+            assert nightscout_sync.start_poller("poll.example", "tok") is poller
+            assert list(poller.store.read()[1]) == [101]
+            # Token change restarts the poller
+            replaced = nightscout_sync.start_poller("poll.example", "new-tok")
+            assert replaced is not poller
+        finally:
+            nightscout_sync.stop_poller("poll.example")
+    assert mock_get.call_count >= 1
@@ -0,0 +1,31 @@
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import quantile_sketch
+from quantile_sketch import QuantileSketch
+
+QS = np.array([0.05, 0.25, 0.5, 0.75, 0.95])
+
+def test_quantiles_within_relative_error():
+    rng = np.random.default_rng(5)
+    values = np.clip(rng.lognormal(np.log(140), 0.35, 20000), 40, 400).round()
+    est = QuantileSketch.of(values).quantiles(QS)
+    exact = np.percentile(values, QS * 100)
+    assert np.all(np.abs(est - exact) <= 2 * quantile_sketch.RELATIVE_ACCURACY * exact)
+
+def test_merge_equals_sketch_of_union():
+    rng = np.random.default_rng(6)
+    a, b = rng.integers(40, 400, 500), rng.integers(40, 400, 700)
+    merged = QuantileSketch.of(a)
+    merged += QuantileSketch.of(b)
+    assert merged.count == 1200
+    assert np.array_equal(merged.counts, QuantileSketch.of(np.r_[a, b]).counts)
+
+def test_size_is_bounded_and_extremes_clamp():
+    sketch = QuantileSketch.of([5, 39, 2000])
+    assert sketch.counts.shape == (quantile_sketch.N_BUCKETS,)
+    assert sketch.quantiles([0.0])[0] == quantile_sketch.MIN_VALUE
+    assert np.isnan(QuantileSketch().quantiles([0.5])).all()
@@ -0,0 +1,62 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from rolling_metrics import RollingMetrics
+from cgm_store import CGMSeries
+
+def _brute_force(minutes, glucose, span):
+    sel = glucose[minutes > minutes[-1] - span].astype(float)
+    return {
+        "n": len(sel), "mean": sel.mean(), "min": sel.min(), "max": sel.max(),
+        "std": sel.std(ddof=1) if len(sel) > 1 else 0.0,
+        "in_range": 100 * ((sel >= 70) & (sel <= 180)).mean(),
+        "below_80": 100 * (sel < 80).mean(),
+    }
+
+def test_streaming_stats_match_brute_force():
+    rng = np.random.default_rng(7)
+    minutes = np.cumsum(rng.choice([5, 5, 5, 10, 35], size=2000))
+    glucose = np.clip(rng.normal(140, 50, size=2000), 40, 400).astype(int)
+    engine = RollingMetrics()
+    for i, (m, g) in enumerate(zip(minutes, glucose)):
+        engine.push(m, g)
+        if i % 97 == 0 or i == len(minutes) - 1:
+            for window, span in (("3h", 180), ("24h", 1440), ("14d", 20160)):
+                expected = _brute_force(minutes[:i + 1], glucose[:i + 1], span)
+                got = engine.stats(window)
+                assert got["n"] == expected["n"]
+                assert got["min"] == expected["min"] and got["max"] == expected["max"]
+                assert got["mean"] == pytest.approx(expected["mean"])
+                assert got["std"] == pytest.approx(expected["std"])
+                assert got["pct"]["in_range"] == pytest.approx(expected["in_range"])
+                assert got["pct"]["below_80"] == pytest.approx(expected["below_80"])
+
+def test_ingest_only_pushes_new_readings():
+    series = CGMSeries(np.arange(10) * 5, np.full(10, 100), source="ns")
+    engine = RollingMetrics()
+    engine.ingest(series)
+    assert engine.stats("24h")["n"] == 10
+
+    grown = CGMSeries(np.arange(12) * 5, np.r_[np.full(10, 100), 200, 200], source="ns")
+    engine.ingest(grown.tail(5))
+    assert engine.stats("24h")["n"] == 12
+    assert engine.stats("24h")["max"] == 200
+
+def test_ingest_rebuilds_when_data_changes_underneath():
+    engine = RollingMetrics()
+    engine.ingest(CGMSeries(np.arange(10) * 5, np.full(10, 100), source="simulator"))
+    engine.ingest(CGMSeries(np.arange(10) * 5, np.full(10, 150), source="simulator"))
+    assert engine.stats("24h")["mean"] == 150
+    engine.ingest(CGMSeries(np.arange(3) * 5, np.full(3, 90), source="other"))
+    assert engine.stats("24h")["n"] == 3
+
+def test_ingest_rebuilds_after_backfill():
+    engine = RollingMetrics()
+    engine.ingest(CGMSeries(np.arange(5, 10) * 5, np.full(5, 100), source="ns"))
+    # Older readings were merged in before the newest one seen
+    engine.ingest(CGMSeries(np.arange(11) * 5, np.r_[np.full(5, 60), np.full(5, 100), 100], source="ns"))
+    assert engine.stats("24h")["n"] == 11 and engine.stats("24h")["min"] == 60
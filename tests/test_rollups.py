@@ -0,0 +1,74 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import clinical_metrics
+from rollups import CGMRollups
+from cgm_store import CGMStore
+
+def _trace(days=10, seed=3):
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(days * 288) * 5 + 7 * 1440
+    glucose = np.clip(140 + 60 * np.sin(minutes / 300) + rng.normal(0, 15, len(minutes)), 40, 400).astype(np.int64)
+    return minutes, glucose
+
+def test_rollup_summary_matches_raw_metrics():
+    minutes, glucose = _trace()
+    rollups = CGMRollups()
+    rollups.add(minutes, glucose)
+    got = rollups.summary(int(minutes[0]), int(minutes[-1]) + 1)
+    expected = clinical_metrics.summarize(glucose)
+    for key in ("n", "mean", "sd", "cv", "in_range", "below_70", "very_high", "gri", "lbgi", "hbgi"):
+        assert got[key] == pytest.approx(expected[key]), key
+    assert got["min"] == glucose.min() and got["max"] == glucose.max()
+
+def test_rollup_agp_and_daily_match_raw():
+    minutes, glucose = _trace()
+    rollups = CGMRollups.from_series(type("S", (), {"minutes": minutes, "glucose": glucose})())
+    _, bands = rollups.agp(int(minutes[0]), int(minutes[-1]) + 1)
+    _, expected = clinical_metrics.agp_profile(minutes, glucose)
+    # Sketch quantiles carry the 1% relative error bound
+    assert np.allclose(bands, expected, rtol=0.02)
+
+    days, mean, tir = rollups.daily_summary(int(minutes[-1]) // 1440 * 1440 - 2 * 1440, int(minutes[-1]) + 1)
+    e_days, e_mean, e_tir = clinical_metrics.daily_summary(minutes, glucose, days=3)
+    assert list(days) == list(e_days)
+    assert np.allclose(mean, e_mean) and np.allclose(tir, e_tir)
+
+def test_rollup_agp_uses_local_hours():
+    minutes, glucose = _trace()
+    rollups = CGMRollups.from_series(type("S", (), {"minutes": minutes, "glucose": glucose})())
+    _, bands = rollups.agp(int(minutes[0]), int(minutes[-1]) + 1, utc_offset_min=-300)
+    _, expected = clinical_metrics.agp_profile(minutes, glucose, utc_offset_min=-300)
+    assert np.allclose(bands, expected, rtol=0.02)
+    _, some = rollups.agp(int(minutes[0]), int(minutes[-1]) + 1, hours=[22, 23, 0], utc_offset_min=-300)
+    assert np.allclose(some, bands[:, [22, 23, 0]])
+
+def test_rollup_daily_summary_uses_local_days():
+    minutes, glucose = _trace()
+    rollups = CGMRollups.from_series(type("S", (), {"minutes": minutes, "glucose": glucose})())
+    end = int(minutes[-1]) + 1
+    days, mean, tir = rollups.daily_summary(int(minutes[0]), end, utc_offset_min=-300)
+    e_days, e_mean, e_tir = clinical_metrics.daily_summary(minutes, glucose, utc_offset_min=-300)
+    assert list(days) == list(e_days) and days[1] % 1440 == 300
+    assert np.allclose(mean, e_mean) and np.allclose(tir, e_tir)
+
+def test_rollups_accept_out_of_order_batches():
+    minutes, glucose = _trace(days=4)
+    in_order, shuffled = CGMRollups(), CGMRollups()
+    in_order.add(minutes, glucose)
+    for part in (slice(600, 900), slice(0, 600), slice(900, None)): shuffled.add(minutes[part], glucose[part])
+    assert in_order.summary(0, 10**9) == shuffled.summary(0, 10**9)
+
+def test_store_keeps_rollups_current(tmp_path):
+    store = CGMStore("https://ns.example", root=str(tmp_path))
+    store.append([600000, 900000], [100, 110], [4, 4])
+    rollups = store.rollups()
+    store.append([1200000], [300], [4])
+    store.merge([300000, 600000], [50, 999], [4, 4])
+    s = rollups.summary(0, 10**9)
+    assert s["n"] == 4 and s["min"] == 50 and s["max"] == 300
+    assert s["mean"] == pytest.approx((50 + 100 + 110 + 300) / 4)
@@ -72,7 +72,7 @@ class TestWhoop(unittest.TestCase):
         self.assertIsNone(result)
         mock_st.error.assert_called_once()
 
-    @patch('whoop.requests.get')
+    @patch('whoop._SESSION.get')
     def test_fetch_whoop_recovery_success(self, mock_get):
         mock_cycle_response = MagicMock()
         mock_cycle_response.status_code = 200
@@ -102,7 +102,7 @@ class TestWhoop(unittest.TestCase):
         self.assertEqual(result["score"]["day_strain"], 12.5)
         self.assertEqual(result["score"]["sleep_performance_percentage"], 95)
 
-    @patch('whoop.requests.get')
+    @patch('whoop._SESSION.get')
     def test_fetch_whoop_recovery_missing_recovery_score(self, mock_get):
         mock_cycle_response = MagicMock()
         mock_cycle_response.status_code = 200
@@ -128,7 +128,7 @@ class TestWhoop(unittest.TestCase):
         self.assertEqual(result["score"]["recovery_score"], 75)
         self.assertEqual(result["score"]["hrv_rmssd_milli_seconds"], 55.5)
 
-    @patch('whoop.requests.get')
+    @patch('whoop._SESSION.get')
     def test_fetch_whoop_recovery_api_error(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 500
@@ -137,7 +137,7 @@ class TestWhoop(unittest.TestCase):
         result = whoop.fetch_whoop_recovery("fake_token")
         self.assertIsNone(result)
 
-    @patch('whoop.requests.get')
+    @patch('whoop._SESSION.get')
     def test_fetch_whoop_recovery_exception(self, mock_get):
         mock_get.side_effect = requests.exceptions.Timeout("Timeout")
 
@@ -145,6 +145,27 @@ class TestWhoop(unittest.TestCase):
 
         self.assertIsNone(result)
 
+    @patch('whoop._SESSION.get')
+    def test_fetch_whoop_recovery_endpoints_run_concurrently(self, mock_get):
+        def slow_get(url, headers=None, timeout=None):
+            time.sleep(0.3)
+            res = MagicMock(status_code=200)
+            if url.endswith("/cycle"): res.json.return_value = {"records": [{"score": {"strain": 9.5}}]}
+            elif url.endswith("/sleep"): res.json.return_value = {"records": [{"score": {"sleep_performance_percentage": 88}}]}
+            else: res.json.return_value = {"records": [{"score": {"recovery_score": 64}}]}
+            return res
+        mock_get.side_effect = slow_get
+
+        start = time.time()
+        result = whoop.fetch_whoop_recovery("concurrent_token")
+        elapsed = time.time() - start
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(result["score"]["strain"], 9.5)
+        self.assertEqual(result["score"]["sleep_performance_percentage"], 88)
+        self.assertEqual(result["score"]["recovery_score"], 64)
+
     @patch('whoop.open', new_callable=mock_open)
     @patch('whoop.time.time', return_value=1000)
     def test_save_tokens(self, mock_time, mock_file):
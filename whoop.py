@@ -6,6 +6,7 @@ import secrets
 import logging
 import os
 from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging for this module
 logger = logging.getLogger(__name__)
@@ -19,6 +20,11 @@ REDIRECT_URI = st.secrets["WHOOP_REDIRECT_URI"]
 
 AUTH_URL = "https://api.prod.whoop.com/oauth/oauth2/auth"
 TOKEN_URL = "https://api.prod.whoop.com/oauth/oauth2/token"
+DATA_ENDPOINTS = (
+    "https://api.prod.whoop.com/developer/v2/cycle",
+    "https://api.prod.whoop.com/developer/v2/activity/sleep",
+    "https://api.prod.whoop.com/developer/v2/recovery",
+)
 
 def get_authorization_url(oauth_state=None):
     """Generates the Whoop login URL with a dynamic state for CSRF protection."""
@@ -52,15 +58,20 @@ def get_access_token(auth_code):
         logger.error(f"Token exchange failed: {e}")
         return None
 
+# Keep-alive session reused across refreshes (skips the TCP+TLS handshake per call)
+# and a small dedicated pool so the three endpoint reads overlap.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(DATA_ENDPOINTS)))
+_POOL = ThreadPoolExecutor(max_workers=len(DATA_ENDPOINTS), thread_name_prefix="whoop")
+
 @st.cache_data(ttl=300)
 def fetch_whoop_recovery(token):
     """Pulls V2 Cycle, Recovery, and Sleep metrics from all required endpoints."""
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        # BUGFIX: Querying all three distinct Whoop v2 endpoints
-        cycle_res = requests.get("https://api.prod.whoop.com/developer/v2/cycle", headers=headers, timeout=10)
-        sleep_res = requests.get("https://api.prod.whoop.com/developer/v2/activity/sleep", headers=headers, timeout=10)
-        rec_res = requests.get("https://api.prod.whoop.com/developer/v2/recovery", headers=headers, timeout=10)
+        # BUGFIX: Querying all three distinct Whoop v2 endpoints (concurrently; latency = slowest endpoint)
+        futures = [_POOL.submit(_SESSION.get, url, headers=headers, timeout=10) for url in DATA_ENDPOINTS]
+        cycle_res, sleep_res, rec_res = [f.result() for f in futures]
 
         if cycle_res.status_code == 200:
             cycle_recs = cycle_res.json().get('records', [])